@@ -1,61 +1,79 @@
 from fastapi import FastAPI, Request, Depends
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from .models.database import engine, Base, Scan, AIReport, get_db
+from .log_config import configure_logging
+from .models.database import engine, Base, SessionLocal, Scan, AIReport, Schedule, get_db, upgrade_schema, backfill_posts, create_search_index, index_pending_scans
 from .routers.scans_router import scans_router, get_scans, scan_to_dict
 from .routers.claude_router import claude_router
+from .routers.schedules_router import schedules_router, schedule_to_dict
+from .routers.search_router import search_router
+from .routers.metrics_router import metrics_router
+from .services.http_pool import close_sessions
+from .services.metrics import instrument_sessions
+
+configure_logging()
+instrument_sessions(SessionLocal)
 
 Base.metadata.create_all(bind=engine)
+upgrade_schema()
+backfill_posts()
+create_search_index()
+index_pending_scans()
 
 app = FastAPI()
 templates = Jinja2Templates(directory="app/templates")
 
+@app.on_event("shutdown")
+def shutdown_http_pool():
+    close_sessions()
+
 # Template-rendering Endpoints
 @app.get("/")
 def dashboard(request: Request, db: Session = Depends(get_db)):
     total_scans = db.query(Scan).count()
     latest_scan = db.query(Scan).order_by(Scan.timestamp.desc()).first()
+    schedules = [schedule_to_dict(schedule) for schedule in db.query(Schedule).order_by(Schedule.next_run_at).all()]
     return templates.TemplateResponse(
+        request,
         "dashboard.html",
-        {"request": request, "total_scans": total_scans, "latest_scan": latest_scan}
+        {"total_scans": total_scans, "latest_scan": latest_scan, "schedules": schedules}
     )
 
 @app.get("/scans")
 def scans_page(request: Request, db: Session = Depends(get_db)):
-    scans = get_scans(db)
-    scans_with_decoded_results = []
-    for scan in scans:
-        scan_dict = scan_to_dict(scan)
-        if hasattr(scan, '_sa_instance_state'):
-            scan_dict['_sa_instance_state'] = scan._sa_instance_state
-        scans_with_decoded_results.append(scan_dict)
-    return templates.TemplateResponse("scans.html", {"request": request, "scans": scans_with_decoded_results})
+    scans, next_cursor = get_scans(db)
+    return templates.TemplateResponse(
+        request,
+        "scans.html",
+        {"scans": [scan_to_dict(scan) for scan in scans], "next_cursor": next_cursor}
+    )
 
 @app.get("/scans/table")
 def scans_table(
     request: Request,
     name: str = None,
     status: str = None,
+    sort: str = "timestamp",
+    order: str = "desc",
+    cursor: str = None,
     db: Session = Depends(get_db)
 ):
-    scans = get_scans(db, name, status)
-    scans_with_decoded_results = []
-    for scan in scans:
-        scan_dict = scan_to_dict(scan)
-        if hasattr(scan, '_sa_instance_state'):
-            scan_dict['_sa_instance_state'] = scan._sa_instance_state
-        scans_with_decoded_results.append(scan_dict)
+    scans, next_cursor = get_scans(db, name, status, sort, order, cursor)
+    # The same partial scans.html includes, so the refreshed table matches the page
     return templates.TemplateResponse(
-        "scans.html",
-        {"request": request, "scans": scans_with_decoded_results},
-        block_name="table_content"
+        request,
+        "scans_table.html",
+        {"scans": [scan_to_dict(scan) for scan in scans], "next_cursor": next_cursor}
     )
 
 @app.get("/reports")
 def reports_page(request: Request, db: Session = Depends(get_db)):
     reports = db.query(AIReport).all()
-    return templates.TemplateResponse("report.html", {"request": request, "reports": reports})
+    return templates.TemplateResponse(request, "report.html", {"reports": reports})
 
 # Register Routers
 app.include_router(scans_router)
-app.include_router(claude_router) 
+app.include_router(claude_router)
+app.include_router(schedules_router)
+app.include_router(search_router)
+app.include_router(metrics_router)
@@ -1,22 +1,32 @@
 import argparse
-from database import Base, engine, SessionLocal
+from sqlalchemy import text
+from database import Base, engine, SessionLocal, upgrade_schema, backfill_posts, create_search_index, index_pending_scans, FTS_TABLE
 
 def create_tables():
     with SessionLocal() as db:
         Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+    create_search_index()
 
 def drop_tables():
     with SessionLocal() as db:
+        db.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+        db.commit()
         Base.metadata.drop_all(bind=engine)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Manage database tables")
-    parser.add_argument("action", choices=["create", "drop"], help="Action to perform")
+    parser.add_argument("action", choices=["create", "drop", "migrate"], help="Action to perform")
     args = parser.parse_args()
 
     if args.action == "create":
         create_tables()
         print("Tables created")
+    elif args.action == "migrate":
+        create_tables()
+        backfill_posts()
+        index_pending_scans()
+        print("Posts backfilled from scan results and indexed for search")
     elif args.action == "drop":
         drop_tables()
         print("Tables dropped")
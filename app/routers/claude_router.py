@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import base64
+from typing import Literal
 import json
-from ..models.database import get_db, SessionLocal, Scan, AIReport
-from ..services.claude import claude_classify
+from ..models.database import get_db, SessionLocal, Scan, Post, AIReport, Classification, bulk_insert, classification_rows
+from ..services.claude import get_classifier, estimate_tokens, pack_posts, SYSTEM_PROMPT, PACKED_SYSTEM_PROMPT
+from ..services.rate_limiter import RateLimiter
+from ..services.classification_cache import ResultCache
+from ..services.local_classifier import get_local_classifier, cascade_split, CASCADE_THRESHOLD
+from ..services.near_duplicates import cluster_representatives
+from ..services.job_queue import enqueue, check_lease
+from ..services.metrics import CLASSIFIED_POSTS
 
 claude_router = APIRouter(prefix="/claude", tags=["Claude AI Router"])
 
@@ -16,35 +23,159 @@ class StartClassification(BaseModel):
     model_name: str
     temperature: float = 0.1
     max_tokens: int = 100
+    concurrency: int = Field(4, ge=1, le=64)
+    requests_per_minute: int = Field(50, ge=1)
+    tokens_per_minute: int = Field(40000, ge=1)
+    # "batch" submits the whole scan as one Message Batch, "packed" sends several posts per request
+    mode: Literal["sync", "batch", "packed"] = "sync"
+    pack_size: int = Field(10, ge=1, le=100)
+    pack_token_budget: int = Field(4000, ge=100)
+    # Classify with the local model first and only send posts it isn't sure about to Claude
+    cascade: bool = False
+    cascade_threshold: float = Field(CASCADE_THRESHOLD, ge=0, le=1)
 
-def classify_posts(scan: Scan, api_key: str, model_name: str, temperature: float, max_tokens: int):
+# StartClassification fields forwarded to classify_posts
+CLASSIFY_OPTIONS = {
+    "concurrency", "requests_per_minute", "tokens_per_minute", "mode", "pack_size", "pack_token_budget",
+    "cascade", "cascade_threshold"
+}
+
+# Page size of report posts
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Rows read per query by the NDJSON export
+EXPORT_CHUNK_SIZE = 500
+
+def classify_posts(
+    scan: Scan,
+    api_key: str,
+    model_name: str,
+    temperature: float,
+    max_tokens: int,
+    concurrency: int = 4,
+    requests_per_minute: int = 50,
+    tokens_per_minute: int = 40000,
+    mode: str = "sync",
+    pack_size: int = 10,
+    pack_token_budget: int = 4000,
+    cascade: bool = False,
+    cascade_threshold: float = CASCADE_THRESHOLD,
+    cluster_contents: dict | None = None,
+    on_batch_submitted=None,
+    batch_id: str | None = None
+):
     try:
-        decoded_result = base64.b64decode(scan.result).decode('utf-8')
-        posts_data = json.loads(decoded_result)
-        posts = posts_data.get('posts', [])
+        # Incremental scans carry no content for posts seen unchanged before
+        posts = [post for post in scan.posts if post.status != 'unchanged']
+        contents = [post.content or '' for post in posts]
+        # Near-duplicates are classified once, through the first post of their cluster
+        cluster_contents = cluster_contents or {}
+        keys = [
+            cluster_contents.get(getattr(post, 'cluster_id', None), content)
+            for post, content in zip(posts, contents)
+        ]
+
+        # Identical posts are classified once; earlier results come from the cache
+        cache = ResultCache(model_name, temperature)
+        results = cache.get_many(keys)
+        pending = [key for key in dict.fromkeys(keys) if key not in results]
+
+        # Confident local predictions never reach Claude or the Claude result cache
+        local = {}
+        if cascade and pending:
+            local, pending = cascade_split(get_local_classifier(), pending, cascade_threshold)
+
+        limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        classifier = get_classifier(api_key, model_name)
+
+        def classify(content):
+            limiter.acquire(estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(content) + max_tokens)
+            return classifier.classify(content, max_tokens, temperature, limiter)
+
+        fresh = {}
+        if mode == "batch" and pending:
+            # A retried job collects the batch its earlier attempt submitted instead of paying for it again
+            if batch_id:
+                classifier.wait_for_batch(batch_id)
+                fresh.update(classifier.batch_results(batch_id, pending))
+            missing = [content for content in pending if content not in fresh]
+            if missing:
+                batch_id = classifier.submit_batch(missing, max_tokens, temperature)
+                if on_batch_submitted:
+                    on_batch_submitted(batch_id)
+                classifier.wait_for_batch(batch_id)
+                fresh.update(classifier.batch_results(batch_id, missing))
+            for content in pending:
+                fresh.setdefault(content, {"error": "Failed to classify post: no batch result", "classification": None, "scores": None})
+        elif mode == "packed" and pending:
+            def classify_pack(indexes):
+                pack = [pending[i] for i in indexes]
+                limiter.acquire(
+                    estimate_tokens(PACKED_SYSTEM_PROMPT)
+                    + sum(estimate_tokens(content) for content in pack)
+                    + max_tokens * len(pack)
+                )
+                return classifier.classify_packed(pack, max_tokens, temperature, limiter)
+
+            packs = pack_posts(pending, pack_size, pack_token_budget)
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for indexes, pack_results in zip(packs, executor.map(classify_pack, packs)):
+                    for i, classification_result in zip(indexes, pack_results):
+                        if classification_result is not None:
+                            fresh[pending[i]] = classification_result
+                # Anything the packed replies missed or garbled is retried one post per call
+                leftovers = [content for content in pending if content not in fresh]
+                for content, classification_result in zip(leftovers, executor.map(classify, leftovers)):
+                    fresh[content] = classification_result
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for content, classification_result in zip(pending, executor.map(classify, pending)):
+                    fresh[content] = classification_result
+        cache.put_many(fresh)
+        results.update(fresh)
+        results.update(local)
 
         classified_posts = []
-        for post in posts:
-            content_base64 = post.get('content', '')
-            content = base64.b64decode(content_base64).decode('utf-8')
-            classification_result = claude_classify(
-                api_key=api_key,
-                model_name=model_name,
-                post_content=content,
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
+        usage = {"input_tokens": 0, "output_tokens": 0, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+        for classification_result in fresh.values():
+            for key, value in (classification_result.get("usage") or {}).items():
+                usage[key] += value
+        for post, content, key in zip(posts, contents, keys):
+            classification_result = results[key]
             classified_posts.append({
+                "post_id": post.id,
+                "cluster_id": getattr(post, 'cluster_id', None),
                 "content": content,
                 "classification": classification_result.get("classification"),
-                "scores": classification_result.get("scores")
+                "scores": classification_result.get("scores"),
+                "latency": classification_result.get("latency"),
+                "usage": classification_result.get("usage"),
+                "cached": key not in fresh and key not in local,
+                "source": "local" if key in local else "claude"
             })
+        for post in classified_posts:
+            CLASSIFIED_POSTS.labels("local" if post["source"] == "local" else "cache" if post["cached"] else "claude").inc()
 
-        return {"posts": classified_posts}
+        return {
+            "posts": classified_posts,
+            "unique": len(set(keys)),
+            "usage": usage,
+            "local": sum(1 for post in classified_posts if post["source"] == "local"),
+            "cache": {"hits": cache.hits, "misses": cache.misses}
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Classification failed: {str(e)}")
 
-def run_classification(report_id: int, scan_id: int, api_key: str, model_name: str, temperature: float, max_tokens: int):
+def fail_report(report_id: int, error: str):
+    """Mark a report as failed with an error classification."""
+    with SessionLocal() as db:
+        db_report = db.query(AIReport).filter(AIReport.id == report_id).first()
+        if db_report:
+            db_report.status = "failed"
+            db_report.classification = json.dumps({"error": error})
+            db.commit()
+
+def run_classification(report_id: int, scan_id: int, api_key: str, model_name: str, temperature: float, max_tokens: int, reraise: bool = False, lease_lost=None, **classify_options):
     db = SessionLocal()
     try:
         db_report = db.query(AIReport).filter(AIReport.id == report_id).first()
@@ -58,21 +189,55 @@ def run_classification(report_id: int, scan_id: int, api_key: str, model_name: s
             db.commit()
             return
 
-        classification_result = classify_posts(scan, api_key, model_name, temperature, max_tokens)
+        db_report.status = "running"
+        db.commit()
+
+        def record_batch(batch_id):
+            db_report.batch_id = batch_id
+            check_lease(lease_lost)
+            db.commit()
+
+        cluster_ids = [post.cluster_id for post in scan.posts if post.cluster_id is not None and post.status != 'unchanged']
+        classification_result = classify_posts(
+            scan, api_key, model_name, temperature, max_tokens,
+            cluster_contents=cluster_representatives(db, cluster_ids),
+            on_batch_submitted=record_batch,
+            batch_id=db_report.batch_id,
+            **classify_options
+        )
+        cache_stats = classification_result.pop("cache")
+        posts = classification_result.pop("posts")
+        # Another worker may own the job by now; leave its results alone
+        check_lease(lease_lost)
+        # A retried job replaces whatever an earlier attempt stored
+        db.query(Classification).filter(Classification.report_id == report_id).delete(synchronize_session=False)
+        bulk_insert(db, Classification, classification_rows(report_id, posts))
+        counts = {}
+        for post in posts:
+            label = post["classification"] or "Failed"
+            counts[label] = counts.get(label, 0) + 1
+        db_report.cache_hits = cache_stats["hits"]
+        db_report.cache_misses = cache_stats["misses"]
         db_report.status = "completed"
-        db_report.classification = json.dumps(classification_result)
+        db_report.classification = json.dumps({
+            "usage": classification_result["usage"],
+            "counts": counts,
+            "total": len(posts),
+            "unique": classification_result["unique"],
+            "local": classification_result["local"]
+        })
         db.commit()
     except Exception as e:
-        db_report.status = "failed"
-        db_report.classification = json.dumps({"error": str(e)})
-        db.commit()
+        db.rollback()
+        if reraise:
+            raise
+        fail_report(report_id, str(e))
     finally:
         db.close()
 
 @claude_router.post("/start-classification", status_code=201)
 async def start_classification_endpoint(
     classification: StartClassification,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     scan = db.query(Scan).filter(Scan.id == classification.scan_id).first()
@@ -84,37 +249,167 @@ async def start_classification_endpoint(
         name=scan.name,  # Use the scan's name
         timestamp=datetime.utcnow(),
         status="running",
-        classification=""
+        classification="",
+        cache_hits=0,
+        cache_misses=0
     )
     db.add(db_report)
     db.commit()
     db.refresh(db_report)
 
-    background_tasks.add_task(
-        run_classification,
-        db_report.id,
-        scan.id,
-        classification.api_key,
-        classification.model_name,
-        classification.temperature,
-        classification.max_tokens
-    )
+    # Picked up by `python -m app.worker`; the API key is scrubbed from the job once it finishes
+    enqueue(db, "classification", f"report:{db_report.id}", {
+        "report_id": db_report.id,
+        "scan_id": scan.id,
+        "api_key": classification.api_key,
+        "model_name": classification.model_name,
+        "temperature": classification.temperature,
+        "max_tokens": classification.max_tokens,
+        **classification.model_dump(include=CLASSIFY_OPTIONS)
+    })
 
     return JSONResponse(
-        content={"message": "Classification started", "report_id": db_report.id}
+        content={"message": "Classification queued", "report_id": db_report.id}
     )
 
-@claude_router.get("/reports/{report_id}")
-async def get_report(report_id: int, db: Session = Depends(get_db)):
+def classification_to_dict(classification: Classification, post: Post | None) -> dict:
+    """Convert a classifications row and its post to the dictionary shape used in reports"""
+    return {
+        "post_id": classification.post_id,
+        "cluster_id": post.cluster_id if post else None,
+        "position": classification.position,
+        "title": post.title if post else None,
+        "link": post.link if post else None,
+        "content": post.content if post else None,
+        "classification": classification.label,
+        "score": classification.score,
+        "scores": json.loads(classification.scores) if classification.scores else None,
+        "latency": classification.latency,
+        "usage": {"input_tokens": classification.input_tokens, "output_tokens": classification.output_tokens},
+        "cached": classification.cached,
+        "source": classification.source or "claude"
+    }
+
+def filter_classifications(query, label: str | None, min_score: float | None):
+    if label:
+        query = query.filter(Classification.label == label)
+    if min_score is not None:
+        query = query.filter(Classification.score >= min_score)
+    return query
+
+def legacy_report_posts(report: AIReport, label: str | None, min_score: float | None) -> list[dict]:
+    """Posts of reports written before the classifications table, read from the JSON blob."""
+    try:
+        posts = json.loads(report.classification or "{}").get("posts") or []
+    except ValueError:
+        return []
+    results = []
+    for position, post in enumerate(posts):
+        scores = post.get("scores") or {}
+        score = scores.get(post["classification"].lower()) if post.get("classification") else None
+        if label and post.get("classification") != label:
+            continue
+        if min_score is not None and (score is None or score < min_score):
+            continue
+        results.append(dict(post, position=position, score=score))
+    return results
+
+def get_report_or_404(db: Session, report_id: int) -> AIReport:
     report = db.query(AIReport).filter(AIReport.id == report_id).first()
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
-    return JSONResponse(content={"classification": report.classification})
+    return report
+
+@claude_router.get("/reports/{report_id}")
+async def get_report(
+    report_id: int,
+    label: str | None = None,
+    min_score: float | None = None,
+    offset: int = 0,
+    limit: int = DEFAULT_PAGE_SIZE,
+    db: Session = Depends(get_db)
+):
+    """One page of a report's classified posts, optionally only `label` with a score of at least `min_score`."""
+    report = get_report_or_404(db, report_id)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = filter_classifications(
+        db.query(Classification).filter(Classification.report_id == report_id), label, min_score
+    )
+    total = query.count()
+    if total or not report.classification or '"posts"' not in report.classification:
+        rows = (
+            query.add_entity(Post)
+            .outerjoin(Post, Classification.post_id == Post.id)
+            .order_by(Classification.position)
+            .offset(offset)
+            .limit(limit)
+            .all()
+        )
+        posts = [classification_to_dict(classification, post) for classification, post in rows]
+        summary = json.loads(report.classification) if report.classification else {}
+    else:
+        legacy = legacy_report_posts(report, label, min_score)
+        total = len(legacy)
+        posts = legacy[offset:offset + limit]
+        summary = {key: value for key, value in json.loads(report.classification).items() if key != "posts"}
+    return JSONResponse(content={
+        "status": report.status,
+        "summary": summary,
+        "cache_hits": report.cache_hits or 0,
+        "cache_misses": report.cache_misses or 0,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "posts": posts
+    })
+
+@claude_router.get("/reports/{report_id}/export.ndjson")
+async def export_report(
+    report_id: int,
+    label: str | None = None,
+    min_score: float | None = None,
+    db: Session = Depends(get_db)
+):
+    """Stream every matching classified post as newline-delimited JSON."""
+    report = get_report_or_404(db, report_id)
+    legacy = None
+    if not db.query(Classification.id).filter(Classification.report_id == report_id).first():
+        legacy = legacy_report_posts(report, label, min_score)
+
+    def lines():
+        if legacy is not None:
+            for post in legacy:
+                yield json.dumps(post) + "\n"
+            return
+        # Each chunk is a short keyset query, so the export never holds the whole report in memory
+        last_position = -1
+        while True:
+            with SessionLocal() as chunk_db:
+                rows = (
+                    filter_classifications(chunk_db.query(Classification, Post), label, min_score)
+                    .outerjoin(Post, Classification.post_id == Post.id)
+                    .filter(Classification.report_id == report_id, Classification.position > last_position)
+                    .order_by(Classification.position)
+                    .limit(EXPORT_CHUNK_SIZE)
+                    .all()
+                )
+                for classification, post in rows:
+                    yield json.dumps(classification_to_dict(classification, post)) + "\n"
+            if len(rows) < EXPORT_CHUNK_SIZE:
+                return
+            last_position = rows[-1][0].position
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="report-{report_id}.ndjson"'}
+    )
 
 
 @claude_router.delete("/delete-all-reports")
 async def delete_all_reports(db: Session = Depends(get_db)):
     try:
+        db.query(Classification).delete()
         db.query(AIReport).delete()
         db.commit()
         return JSONResponse(content={"message": "All AI reports deleted successfully"})
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+from ..models.database import get_db, Scan, AIReport, load_metric_snapshots
+from ..services import metrics
+from ..services.job_queue import queue_depth
+
+metrics_router = APIRouter(tags=["Metrics Router"])
+
+@metrics_router.get("/metrics")
+async def metrics_endpoint(db: Session = Depends(get_db)):
+    """Prometheus text exposition of the API's metrics plus those published by worker processes.
+
+    Queue depth and in-flight scans and reports are read from the database
+    on every scrape.
+    """
+    metrics.JOBS.reset()
+    for job_type, counts in queue_depth(db).items():
+        for status, count in counts.items():
+            metrics.JOBS.labels(job_type, status).set(count)
+    metrics.SCANS_IN_FLIGHT.set(db.query(Scan).filter(Scan.status == "running").count())
+    metrics.REPORTS_IN_FLIGHT.set(db.query(AIReport).filter(AIReport.status == "running").count())
+    snapshots = [metrics.snapshot(include_gauges=True)] + load_metric_snapshots(db)
+    return Response(content=metrics.render(metrics.merge(snapshots)), media_type=metrics.CONTENT_TYPE)
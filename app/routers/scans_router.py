@@ -1,22 +1,58 @@
-from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import or_, tuple_
+from sqlalchemy.orm import Session, load_only
+from pydantic import BaseModel, Field
 from datetime import datetime
+import asyncio
 import base64
 import json
-import requests
-from ..models.database import get_db, SessionLocal, Scan
-from ..services.scraper import scrape_posts
+import logging
+from ..models.database import (
+    get_db, SessionLocal, Scan, Post, PostIndex, PostCluster, ClusterBand, AIReport, Classification, insert_posts, bulk_upsert,
+    index_scan_posts, unindex_scan_posts, clear_search_index
+)
+from ..services.proxy_pool import ProxyPool, CIRCUITS_PER_PROXY
+from ..services.job_queue import enqueue, check_lease
+from ..services.site_profiles import get_profiles
+from ..services.near_duplicates import assign_clusters, release_scan_posts
+from ..services.scraper import iter_posts, DEFAULT_CONCURRENCY, DEFAULT_MAX_PER_HOST
+
+logger = logging.getLogger(__name__)
 
 scans_router = APIRouter(prefix="/scans", tags=["Scraper Scans Router"])
 
+# Posts written per commit while a scan runs
+STORE_BATCH_SIZE = 10
+# Seconds between database polls of the live scan stream
+STREAM_POLL_INTERVAL = 1.0
+# Page size of scan listings
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Columns scan listings can be sorted by
+SORT_COLUMNS = {"id": Scan.id, "name": Scan.name, "timestamp": Scan.timestamp, "status": Scan.status}
+# Columns needed by scan_to_dict; everything else stays unloaded in listings
+LIST_COLUMNS = (
+    Scan.id, Scan.name, Scan.onion_url, Scan.http_proxy, Scan.https_proxy, Scan.timestamp,
+    Scan.status, Scan.pages_fetched, Scan.posts_stored, Scan.errors
+)
+
 # Pydantic Models
 class ScanCreate(BaseModel):
     name: str
     onion_url: str
     http_proxy: str
     https_proxy: str
+    concurrency: int = Field(DEFAULT_CONCURRENCY, ge=1, le=64)
+    max_per_host: int = Field(DEFAULT_MAX_PER_HOST, ge=1, le=64)
+    max_pages: int = Field(1, ge=1, le=1000)
+    max_depth: int = Field(10, ge=0, le=1000)
+    # Isolated Tor circuits per proxy; the proxy fields may list several comma-separated SOCKS endpoints
+    circuits_per_proxy: int = Field(CIRCUITS_PER_PROXY, ge=1, le=16)
+    incremental: bool = False  # Only fetch posts that are new or changed since the last scan
+
+# ScanCreate fields forwarded to iter_posts
+SCRAPE_OPTIONS = {"concurrency", "max_per_host", "max_pages", "max_depth", "circuits_per_proxy"}
 
 class ScanResponse(BaseModel):
     id: int
@@ -57,7 +93,10 @@ def create_scan(db: Session, scan: ScanCreate):
         https_proxy=scan.https_proxy,
         timestamp=datetime.utcnow(),
         status="running",
-        result=""
+        result="",
+        pages_fetched=0,
+        posts_stored=0,
+        errors=0
     )
     db.add(db_scan)
     db.commit()
@@ -67,16 +106,110 @@ def create_scan(db: Session, scan: ScanCreate):
 def get_scan(db: Session, scan_id: int):
     return db.query(Scan).filter(Scan.id == scan_id).first()
 
-def get_scans(db: Session, name: str = None, status: str = None):
-    query = db.query(Scan)
+def encode_cursor(scan: Scan, sort: str) -> str:
+    value = getattr(scan, sort)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, scan.id]).encode('utf-8')).decode('utf-8')
+
+def decode_cursor(cursor: str, sort: str) -> tuple:
+    try:
+        value, scan_id = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')))
+        if sort == "timestamp":
+            value = datetime.fromisoformat(value)
+        return value, int(scan_id)
+    except (ValueError, TypeError, base64.binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def get_scans(
+    db: Session,
+    name: str = None,
+    status: str = None,
+    sort: str = "timestamp",
+    order: str = "desc",
+    cursor: str = None,
+    limit: int = DEFAULT_PAGE_SIZE
+):
+    """Return one page of scans and the cursor of the next page.
+
+    Pages are keyset paginated on (sort column, id), so deep pages cost the
+    same as the first one, and only the columns in LIST_COLUMNS are loaded.
+
+    Args:
+        db (Session): Database session
+        name (str, optional): Substring the scan name must contain
+        status (str, optional): Exact scan status
+        sort (str, optional): One of SORT_COLUMNS. Defaults to "timestamp"
+        order (str, optional): "asc" or "desc". Defaults to "desc"
+        cursor (str, optional): next_cursor of the previous page
+        limit (int, optional): Page size, capped at MAX_PAGE_SIZE
+
+    Returns:
+        tuple: (list of Scan, next cursor or None on the last page)
+    """
+    if sort not in SORT_COLUMNS or order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Invalid sort")
+    column = SORT_COLUMNS[sort]
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    query = db.query(Scan).options(load_only(*LIST_COLUMNS))
     if name:
         query = query.filter(Scan.name.contains(name))
     if status:
         query = query.filter(Scan.status == status)
-    return query.all()
+    if cursor:
+        key = tuple_(column, Scan.id)
+        value = decode_cursor(cursor, sort)
+        query = query.filter(key < value if order == "desc" else key > value)
+    if order == "desc":
+        query = query.order_by(column.desc(), Scan.id.desc())
+    else:
+        query = query.order_by(column.asc(), Scan.id.asc())
+
+    scans = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(scans[limit - 1], sort) if len(scans) > limit else None
+    return scans[:limit], next_cursor
+
+def load_post_index(db: Session, site: str) -> dict:
+    """Return the known posts of a site keyed by link.
+
+    Only entries written by completed scans count. Entries of a running,
+    failed or deleted scan (including an earlier attempt of a retried one)
+    point at content no completed scan holds, so those posts are fetched again.
+    """
+    entries = db.query(PostIndex).outerjoin(Scan, Scan.id == PostIndex.scan_id).filter(
+        PostIndex.site == site,
+        or_(PostIndex.scan_id.is_(None), Scan.status == "completed")
+    ).all()
+    return {
+        entry.link: {
+            "content_hash": entry.content_hash,
+            "etag": entry.etag,
+            "last_modified": entry.last_modified
+        }
+        for entry in entries
+    }
+
+def update_post_index(db: Session, site: str, posts: list[dict], scan_id: int | None = None):
+    """Record hashes and validators of freshly scraped posts for the next incremental scan."""
+    now = datetime.utcnow()
+    rows = {
+        post["link"]: {
+            "site": site,
+            "link": post["link"],
+            "content_hash": post["content_hash"],
+            "etag": post.get("etag"),
+            "last_modified": post.get("last_modified"),
+            "last_seen": now,
+            "scan_id": scan_id
+        }
+        for post in posts
+        if post.get("status") != "error" and post.get("content_hash")
+    }
+    bulk_upsert(db, PostIndex, list(rows.values()), ["site", "link"])
 
 def test_connection(onion_url: str, http_proxy: str, https_proxy: str):
-    """Test connectivity to the onion URL using the provided proxies."""
+    """Test connectivity to the onion URL through every configured proxy."""
     proxies = {
         'http': http_proxy,
         'https': https_proxy
@@ -84,38 +217,119 @@ def test_connection(onion_url: str, http_proxy: str, https_proxy: str):
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
     }
+    pool = None
     try:
-        response = requests.head(onion_url, proxies=proxies, headers=headers, timeout=20)
-        response.raise_for_status()
-        return True
+        pool = ProxyPool.from_proxies(proxies, circuits_per_proxy=1)
+        if pool is None:
+            raise ValueError("No proxy configured")
+        healthy = pool.check_health(onion_url, timeout=20, headers=headers)
+        if not healthy:
+            raise ValueError("No proxy reached the site")
+        return healthy
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Connection test failed: {str(e)}")
+    finally:
+        if pool is not None:
+            pool.close()
 
-# Background Task
-def run_scan(scan_id: int):
+def fail_scan(scan_id: int, error: str):
+    """Mark a scan as failed with an error result."""
+    with SessionLocal() as db:
+        db_scan = get_scan(db, scan_id)
+        if db_scan:
+            db_scan.status = "failed"
+            db_scan.result = base64.b64encode(json.dumps({"error": error}).encode('utf-8')).decode('utf-8')
+            db.commit()
+
+# Job Handler
+def run_scan(scan_id: int, incremental: bool = False, reraise: bool = False, lease_lost=None, **scrape_options):
+    """Scrape a scan's site and store its posts.
+
+    Args:
+        scan_id (int): ID of the scan to run
+        incremental (bool, optional): Skip posts unchanged since the last scan. Defaults to False
+        reraise (bool, optional): Re-raise errors instead of marking the scan failed,
+            so the job queue can retry it. Defaults to False
+        lease_lost (threading.Event, optional): Set by the worker when it loses the
+            job's lease; the scan then stops before its next commit
+        **scrape_options: Options forwarded to iter_posts
+    """
     db = SessionLocal()
     try:
         db_scan = get_scan(db, scan_id)
         if not db_scan:
             return
+        # A retried job starts over from an empty scan
+        release_scan_posts(db, scan_id)
+        unindex_scan_posts(db, scan_id)
+        db.query(Post).filter(Post.scan_id == scan_id).delete(synchronize_session=False)
+        db_scan.status = "running"
+        db_scan.result = ""
+        db_scan.fetch_stats = None
+        db.commit()
         proxies = {
             'http': db_scan.http_proxy,
             'https': db_scan.https_proxy
         }
-        result = scrape_posts(db_scan.onion_url, proxies)
+        known_posts = load_post_index(db, db_scan.onion_url) if incremental else None
+        stats = {}
+        batch = []
+        stored = 0
+
+        def flush():
+            nonlocal stored
+            assign_clusters(db, batch)
+            insert_posts(db, db_scan.id, batch, stored)
+            update_post_index(db, db_scan.onion_url, batch, db_scan.id)
+            stored += len(batch)
+            db_scan.posts_stored = stored
+            db_scan.pages_fetched = stats.get("pages_fetched", 0)
+            db_scan.errors = stats.get("errors", 0)
+            db_scan.fetch_stats = json.dumps({"hosts": stats.get("hosts", {}), "circuits": stats.get("circuits", [])})
+            check_lease(lease_lost)
+            db.commit()
+            batch.clear()
+
+        # Posts are committed in small batches so progress survives a crash
+        # and /scans/{scan_id}/stream can publish them while the scan runs
+        for post in iter_posts(db_scan.onion_url, proxies, known_posts=known_posts, stats=stats, **scrape_options):
+            batch.append(post)
+            if len(batch) >= STORE_BATCH_SIZE:
+                flush()
+        flush()
         db_scan.status = "completed"
-        db_scan.result = result
+        db_scan.result = ""
+        index_scan_posts(db, db_scan.id)
+        check_lease(lease_lost)
         db.commit()
     except Exception as e:
-        print(f"Scan error: {str(e)}")
-        db_scan = get_scan(db, scan_id)
-        if db_scan:
-            db_scan.status = "failed"
-            db_scan.result = base64.b64encode(json.dumps({"error": str(e)}).encode('utf-8')).decode('utf-8')
-            db.commit()
+        logger.error("Scan failed", extra={"scan_id": scan_id, "error": str(e)})
+        db.rollback()
+        if reraise:
+            raise
+        fail_scan(scan_id, str(e))
     finally:
         db.close()
 
+def post_to_dict(post: Post) -> dict:
+    """Convert a Post row to the dictionary shape used in scan results"""
+    return {
+        "id": post.id,
+        "title": post.title,
+        "category": post.category,
+        "date": post.date,
+        "link": post.link,
+        "content": post.content,
+        "status": post.status,
+        "content_hash": post.content_hash,
+        "cluster_id": post.cluster_id
+    }
+
+def get_scan_posts(db: Session, scan_id: int, offset: int = 0, limit: int | None = None):
+    query = db.query(Post).filter(Post.scan_id == scan_id).order_by(Post.position).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
 
 def scan_to_dict(scan: Scan) -> dict:
     """Convert a Scan object to a dictionary with decoded result"""
@@ -125,8 +339,11 @@ def scan_to_dict(scan: Scan) -> dict:
         "onion_url": scan.onion_url,
         "http_proxy": scan.http_proxy,
         "https_proxy": scan.https_proxy,
-        "timestamp": scan.timestamp.isoformat(),
-        "status": scan.status
+        "timestamp": scan.timestamp.isoformat() if scan.timestamp else None,
+        "status": scan.status,
+        "pages_fetched": scan.pages_fetched or 0,
+        "posts_stored": scan.posts_stored or 0,
+        "errors": scan.errors or 0
     }
 
 
@@ -135,50 +352,107 @@ def scan_to_dict(scan: Scan) -> dict:
 @scans_router.post("/create-scan", status_code=201)
 async def create_scan_endpoint(
     scan: ScanCreate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     db_scan = create_scan(db, scan)
-    background_tasks.add_task(run_scan, db_scan.id)
+    # Picked up by `python -m app.worker`
+    enqueue(
+        db, "scan", f"scan:{db_scan.id}",
+        {"scan_id": db_scan.id, "incremental": scan.incremental, **scan.model_dump(include=SCRAPE_OPTIONS)}
+    )
     scan_dict = scan_to_dict(db_scan)
     return JSONResponse(
-        content={"message": "Scan started", "scan": scan_dict}
+        content={"message": "Scan queued", "scan": scan_dict}
     )
 
 @scans_router.get("/list")
 async def list_scans_endpoint(
     name: str | None = None,
     status: str | None = None,
+    sort: str = "timestamp",
+    order: str = "desc",
+    cursor: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
     db: Session = Depends(get_db)
 ):
-    scans = get_scans(db, name, status)
-    scan_dicts = []
-    
-    for scan in scans:
-        try:
-            scan_dict = scan_to_dict(scan)
-            scan_dicts.append(scan_dict)
-        except Exception as e:
-            print(f"Error processing scan {scan.id}: {str(e)}")
-            scan_dicts.append({
-                "id": scan.id,
-                "name": scan.name,
-                "onion_url": scan.onion_url,
-                "http_proxy": scan.http_proxy,
-                "https_proxy": scan.https_proxy,
-                "timestamp": scan.timestamp.isoformat() if scan.timestamp else None,
-                "status": scan.status,
-                "result": {"error": f"Processing error: {str(e)}"}
-            })
-    
+    scans, next_cursor = get_scans(db, name, status, sort, order, cursor, limit)
     return JSONResponse(
-        content={"message": "Scans retrieved", "scans": scan_dicts}
+        content={
+            "message": "Scans retrieved",
+            "scans": [scan_to_dict(scan) for scan in scans],
+            "next_cursor": next_cursor
+        }
+    )
+
+
+@scans_router.get("/profiles")
+async def list_profiles_endpoint():
+    """Site extraction profiles loaded from SITE_PROFILES_DIR, in matching order."""
+    return JSONResponse(
+        content={"message": "Profiles retrieved", "profiles": [profile.to_dict() for profile in get_profiles()]}
     )
 
 
+def cluster_to_dict(cluster: PostCluster, members: list[Post]) -> dict:
+    return {
+        "id": cluster.id,
+        "size": cluster.size or 0,
+        "first_seen": cluster.first_seen.isoformat() if cluster.first_seen else None,
+        "last_seen": cluster.last_seen.isoformat() if cluster.last_seen else None,
+        "members": [
+            {"id": post.id, "scan_id": post.scan_id, "title": post.title, "link": post.link, "date": post.date, "status": post.status}
+            for post in members
+        ]
+    }
+
+def cluster_members(db: Session, cluster_ids: list[int], limit: int | None = None) -> dict:
+    """Members of each cluster, newest first, at most `limit` per cluster."""
+    members = {cluster_id: [] for cluster_id in cluster_ids}
+    query = db.query(Post).options(
+        load_only(Post.id, Post.scan_id, Post.cluster_id, Post.title, Post.link, Post.date, Post.status)
+    ).filter(Post.cluster_id.in_(cluster_ids)).order_by(Post.id.desc())
+    for post in query:
+        if limit is None or len(members[post.cluster_id]) < limit:
+            members[post.cluster_id].append(post)
+    return members
+
+@scans_router.get("/clusters")
+async def list_clusters_endpoint(
+    min_size: int = 2,
+    offset: int = 0,
+    limit: int = DEFAULT_PAGE_SIZE,
+    members_limit: int = 10,
+    db: Session = Depends(get_db)
+):
+    """Near-duplicate clusters with at least `min_size` posts, largest first, with up to `members_limit` members each."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = db.query(PostCluster).filter(PostCluster.size >= min_size)
+    total = query.count()
+    clusters = query.order_by(PostCluster.size.desc(), PostCluster.id).offset(offset).limit(limit).all()
+    members = cluster_members(db, [cluster.id for cluster in clusters], max(1, members_limit))
+    return JSONResponse(content={
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "clusters": [cluster_to_dict(cluster, members[cluster.id]) for cluster in clusters]
+    })
+
+@scans_router.get("/clusters/{cluster_id}")
+async def get_cluster_endpoint(
+    cluster_id: int,
+    db: Session = Depends(get_db)
+):
+    cluster = db.query(PostCluster).filter(PostCluster.id == cluster_id).first()
+    if not cluster:
+        raise HTTPException(status_code=404, detail="Cluster not found")
+    return JSONResponse(content={"cluster": cluster_to_dict(cluster, cluster_members(db, [cluster_id])[cluster_id])})
+
+
 @scans_router.get("/{scan_id}")
 async def get_scan_endpoint(
     scan_id: int,
+    offset: int = 0,
+    limit: int | None = None,
     db: Session = Depends(get_db)
 ):
     db_scan = get_scan(db, scan_id)
@@ -187,28 +461,114 @@ async def get_scan_endpoint(
     
     result_str = '{"message": "No result available"}'
     
-    if db_scan.result:
-        print(f"Raw scan result (ID: {scan_id}): {db_scan.result}")
+    posts = get_scan_posts(db, scan_id, offset, limit)
+    if posts:
+        result_str = json.dumps({"posts": [post_to_dict(post) for post in posts]})
+    elif db_scan.result:
         try:
             decoded_bytes = base64.b64decode(db_scan.result)
             result_str = decoded_bytes.decode('utf-8')
             # Remove trailing % if present
             if result_str.endswith('%'):
                 result_str = result_str[:-1]
-                print(f"Removed trailing % from decoded result (ID: {scan_id}): {result_str}")
         except (base64.binascii.Error, UnicodeDecodeError) as e:
-            print(f"Failed to decode scan result (ID: {scan_id}): {str(e)}")
+            logger.warning("Failed to decode scan result", extra={"scan_id": scan_id, "error": str(e)})
             result_str = '{"message": "Error decoding result"}'
-    
-    print(f"Returning decoded result (ID: {scan_id}): {result_str}")
-    
+
+    logger.debug("Returning scan result", extra={"scan_id": scan_id, "posts": len(posts), "bytes": len(result_str)})
+
     return JSONResponse(content={"result": result_str})
 
 
+@scans_router.get("/{scan_id}/stats")
+async def get_scan_stats_endpoint(
+    scan_id: int,
+    db: Session = Depends(get_db)
+):
+    """Per-host request stats (adaptive limit, retries, breaker state) and Tor circuit stats of a scan."""
+    db_scan = get_scan(db, scan_id)
+    if not db_scan:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    fetch_stats = json.loads(db_scan.fetch_stats) if db_scan.fetch_stats else {"hosts": {}, "circuits": []}
+    return JSONResponse(content={"scan": scan_to_dict(db_scan), **fetch_stats})
+
+
+def poll_scan_stream(scan_id: int, after_id: int):
+    """Return (scan progress dict or None, posts newer than after_id)."""
+    with SessionLocal() as db:
+        db_scan = get_scan(db, scan_id)
+        if not db_scan:
+            return None, []
+        posts = db.query(Post).filter(Post.scan_id == scan_id, Post.id > after_id).order_by(Post.id).limit(500).all()
+        return scan_to_dict(db_scan), [post_to_dict(post) for post in posts]
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@scans_router.get("/{scan_id}/stream")
+async def stream_scan_endpoint(scan_id: int):
+    """Server-Sent Events feed of a scan: `post` for every stored post, `progress` counters, then `done`."""
+    progress, _ = await asyncio.to_thread(poll_scan_stream, scan_id, 0)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+
+    async def events():
+        last_id = 0
+        while True:
+            progress, posts = await asyncio.to_thread(poll_scan_stream, scan_id, last_id)
+            if progress is None:
+                yield sse_event("done", {"status": "deleted"})
+                return
+            for post in posts:
+                last_id = post["id"]
+                yield sse_event("post", post)
+            yield sse_event("progress", progress)
+            # Keep draining while a backlog remains; finish once the scan has stopped
+            if len(posts) == 500:
+                continue
+            if progress["status"] != "running":
+                yield sse_event("done", progress)
+                return
+            await asyncio.sleep(STREAM_POLL_INTERVAL)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@scans_router.get("/{scan_id}/posts/{post_id}")
+async def get_post_endpoint(
+    scan_id: int,
+    post_id: int,
+    db: Session = Depends(get_db)
+):
+    post = db.query(Post).filter(Post.id == post_id, Post.scan_id == scan_id).first()
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
+    return JSONResponse(content={"post": post_to_dict(post)})
+
+
 @scans_router.delete("/delete-all")
 async def delete_all_scans(db: Session = Depends(get_db)):
-    """Delete all scans from the database."""
+    """Delete all scans from the database.
+
+    Everything derived from them goes too: the search index, the post index
+    (so the next incremental scan stores every post again), clusters, and the
+    AI reports with their classifications. The classification cache is
+    keyed by content, not by scan, and is kept.
+    """
     try:
+        clear_search_index(db)
+        db.query(Classification).delete()
+        db.query(AIReport).delete()
+        db.query(PostIndex).delete()
+        db.query(Post).delete()
+        db.query(ClusterBand).delete()
+        db.query(PostCluster).delete()
         db.query(Scan).delete()
         db.commit()
         return JSONResponse(
@@ -0,0 +1,223 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from pydantic import Field
+from datetime import datetime, timedelta
+from typing import Literal
+import json
+import logging
+import os
+import random
+from ..models.database import get_db, SessionLocal, Scan, Post, AIReport, Schedule
+from ..services.job_queue import enqueue, check_lease
+from .scans_router import ScanCreate, SCRAPE_OPTIONS, create_scan, run_scan
+
+logger = logging.getLogger(__name__)
+
+schedules_router = APIRouter(prefix="/schedules", tags=["Scan Schedules Router"])
+
+# Environment variable holding the Anthropic API key used by auto-classify.
+# It is read by the worker when a schedule fires and never stored with the schedule.
+SCHEDULE_API_KEY_ENV = "ANTHROPIC_API_KEY"
+
+# Pydantic Models
+class ScheduleCreate(ScanCreate):
+    incremental: bool = True
+    interval_minutes: int = Field(60, ge=1)
+    jitter_seconds: int = Field(300, ge=0)
+    max_concurrent: int = Field(1, ge=1, le=16)
+    auto_classify: bool = False
+    # Only used when auto_classify is set; the API key comes from SCHEDULE_API_KEY_ENV on the worker
+    model_name: str | None = None
+    temperature: float = 0.1
+    max_tokens: int = 100
+    classify_mode: Literal["sync", "batch", "packed"] = "sync"
+    classify_cascade: bool = False  # Let the local model settle confident posts first
+
+# Database Functions
+def next_run_time(schedule: Schedule, now: datetime) -> datetime:
+    """Next firing time: one interval from now, shifted by up to +/- jitter_seconds."""
+    jitter = schedule.jitter_seconds or 0
+    return now + timedelta(minutes=schedule.interval_minutes, seconds=random.uniform(-jitter, jitter))
+
+def create_schedule(db: Session, schedule: ScheduleCreate) -> Schedule:
+    now = datetime.utcnow()
+    db_schedule = Schedule(
+        name=schedule.name,
+        onion_url=schedule.onion_url,
+        http_proxy=schedule.http_proxy,
+        https_proxy=schedule.https_proxy,
+        interval_minutes=schedule.interval_minutes,
+        jitter_seconds=schedule.jitter_seconds,
+        max_concurrent=schedule.max_concurrent,
+        incremental=schedule.incremental,
+        scrape_options=json.dumps(schedule.model_dump(include=SCRAPE_OPTIONS)),
+        auto_classify=schedule.auto_classify,
+        classify_options=json.dumps({
+            "model_name": schedule.model_name,
+            "temperature": schedule.temperature,
+            "max_tokens": schedule.max_tokens,
+            "mode": schedule.classify_mode,
+            "cascade": schedule.classify_cascade
+        }) if schedule.auto_classify else None,
+        paused=False,
+        # Start at a random point in the first interval so schedules created together don't fire together
+        next_run_at=now + timedelta(minutes=random.uniform(0, schedule.interval_minutes)),
+        created_at=now
+    )
+    db.add(db_schedule)
+    db.commit()
+    db.refresh(db_schedule)
+    return db_schedule
+
+def schedule_to_dict(schedule: Schedule) -> dict:
+    """Convert a Schedule to a dictionary."""
+    return {
+        "id": schedule.id,
+        "name": schedule.name,
+        "onion_url": schedule.onion_url,
+        "interval_minutes": schedule.interval_minutes,
+        "jitter_seconds": schedule.jitter_seconds,
+        "max_concurrent": schedule.max_concurrent,
+        "incremental": schedule.incremental,
+        "scrape_options": json.loads(schedule.scrape_options or "{}"),
+        "auto_classify": schedule.auto_classify,
+        "paused": schedule.paused,
+        "next_run_at": schedule.next_run_at.isoformat() if schedule.next_run_at else None,
+        "last_run_at": schedule.last_run_at.isoformat() if schedule.last_run_at else None,
+        "last_scan_id": schedule.last_scan_id
+    }
+
+def fire_due_schedules(now: datetime = None) -> int:
+    """Queue a scan for every schedule that is due. Returns the number of scans queued.
+
+    Each schedule is claimed by moving its next_run_at forward with a
+    conditional UPDATE, so several worker pools never fire it twice. The
+    scan job itself is delayed by a random part of jitter_seconds, so a
+    batch of schedules falling due together reaches Tor spread out.
+    """
+    now = now or datetime.utcnow()
+    fired = 0
+    with SessionLocal() as db:
+        due = db.query(Schedule).filter(Schedule.paused == False, Schedule.next_run_at <= now).all()  # noqa: E712
+        for schedule in due:
+            claimed = db.execute(
+                update(Schedule)
+                .where(Schedule.id == schedule.id, Schedule.next_run_at == schedule.next_run_at)
+                .values(next_run_at=next_run_time(schedule, now))
+            ).rowcount
+            db.commit()
+            if not claimed:
+                continue
+            in_flight = db.query(Scan).filter(Scan.schedule_id == schedule.id, Scan.status == "running").count()
+            if in_flight >= (schedule.max_concurrent or 1):
+                logger.info("Schedule skipped, scans still running", extra={"schedule_id": schedule.id, "in_flight": in_flight})
+                continue
+            scan = ScanCreate(
+                name=schedule.name,
+                onion_url=schedule.onion_url,
+                http_proxy=schedule.http_proxy,
+                https_proxy=schedule.https_proxy
+            )
+            db_scan = create_scan(db, scan)
+            db_scan.schedule_id = schedule.id
+            schedule.last_run_at = now
+            schedule.last_scan_id = db_scan.id
+            db.commit()
+            enqueue(
+                db, "scheduled_scan", f"scan:{db_scan.id}",
+                {"schedule_id": schedule.id, "scan_id": db_scan.id},
+                delay=random.uniform(0, schedule.jitter_seconds or 0)
+            )
+            fired += 1
+    return fired
+
+# Job Handler
+def run_scheduled_scan(schedule_id: int, scan_id: int, reraise: bool = False, lease_lost=None):
+    """Run a scan with its schedule's options, then queue classification of new and changed posts."""
+    with SessionLocal() as db:
+        schedule = db.get(Schedule, schedule_id)
+        if not schedule:
+            return
+        incremental = schedule.incremental
+        scrape_options = json.loads(schedule.scrape_options or "{}")
+        classify_options = json.loads(schedule.classify_options or "{}") if schedule.auto_classify else None
+        if classify_options and "api_key" in classify_options:
+            # Written by older versions; drop the key from the database
+            classify_options.pop("api_key")
+            schedule.classify_options = json.dumps(classify_options)
+            db.commit()
+
+    run_scan(scan_id, incremental=incremental, reraise=reraise, lease_lost=lease_lost, **scrape_options)
+    if not classify_options:
+        return
+
+    with SessionLocal() as db:
+        db_scan = db.get(Scan, scan_id)
+        if not db_scan or db_scan.status != "completed":
+            return
+        fresh = db.query(Post).filter(Post.scan_id == scan_id, Post.status.in_(("new", "changed"))).count()
+        if not fresh:
+            return
+        api_key = os.getenv(SCHEDULE_API_KEY_ENV)
+        db_report = AIReport(
+            scan_id=scan_id,
+            name=db_scan.name,
+            timestamp=datetime.utcnow(),
+            status="running" if api_key else "failed",
+            classification="" if api_key else json.dumps({"error": f"{SCHEDULE_API_KEY_ENV} is not set on the worker"}),
+            cache_hits=0,
+            cache_misses=0
+        )
+        check_lease(lease_lost)
+        db.add(db_report)
+        db.commit()
+        if not api_key:
+            logger.error("Auto-classify skipped, no API key configured", extra={"schedule_id": schedule_id, "env": SCHEDULE_API_KEY_ENV})
+            return
+        enqueue(db, "classification", f"report:{db_report.id}", {
+            "report_id": db_report.id,
+            "scan_id": scan_id,
+            "api_key": api_key,
+            **classify_options
+        })
+
+# API Endpoints
+@schedules_router.post("/create", status_code=201)
+async def create_schedule_endpoint(schedule: ScheduleCreate, db: Session = Depends(get_db)):
+    if schedule.auto_classify and not schedule.model_name:
+        raise HTTPException(status_code=400, detail="auto_classify requires model_name")
+    db_schedule = create_schedule(db, schedule)
+    return JSONResponse(
+        status_code=201,
+        content={"message": "Schedule created", "schedule": schedule_to_dict(db_schedule)}
+    )
+
+@schedules_router.get("/list")
+async def list_schedules_endpoint(db: Session = Depends(get_db)):
+    schedules = db.query(Schedule).order_by(Schedule.id).all()
+    return JSONResponse(
+        content={"message": "Schedules retrieved", "schedules": [schedule_to_dict(schedule) for schedule in schedules]}
+    )
+
+def set_paused(db: Session, schedule_id: int, paused: bool) -> Schedule:
+    db_schedule = db.get(Schedule, schedule_id)
+    if not db_schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    db_schedule.paused = paused
+    if not paused:
+        db_schedule.next_run_at = next_run_time(db_schedule, datetime.utcnow())
+    db.commit()
+    db.refresh(db_schedule)
+    return db_schedule
+
+@schedules_router.post("/{schedule_id}/pause")
+async def pause_schedule_endpoint(schedule_id: int, db: Session = Depends(get_db)):
+    db_schedule = set_paused(db, schedule_id, True)
+    return JSONResponse(content={"message": "Schedule paused", "schedule": schedule_to_dict(db_schedule)})
+
+@schedules_router.post("/{schedule_id}/resume")
+async def resume_schedule_endpoint(schedule_id: int, db: Session = Depends(get_db)):
+    db_schedule = set_paused(db, schedule_id, False)
+    return JSONResponse(content={"message": "Schedule resumed", "schedule": schedule_to_dict(db_schedule)})
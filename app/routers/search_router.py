@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from datetime import datetime
+from ..models.database import get_db
+from ..services.search import search_posts
+
+search_router = APIRouter(prefix="/search", tags=["Search Router"])
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+@search_router.get("")
+async def search_endpoint(
+    q: str,
+    label: str | None = None,
+    market: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    offset: int = 0,
+    limit: int = DEFAULT_PAGE_SIZE,
+    raw: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Full-text search over scraped posts, best matches first.
+
+    `q` matches posts containing every word. `label` keeps posts classified
+    with that label, `market` posts from onion URLs containing it, and
+    `since`/`until` bound the scan time. With `raw=true`, `q` is FTS5 query
+    syntax (OR, NOT, NEAR, "phrases", prefix*).
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    try:
+        total, results = search_posts(db, q, label, market, since, until, offset, limit, raw)
+    except OperationalError as e:
+        if raw:
+            raise HTTPException(status_code=400, detail=f"Invalid search query: {str(e.orig)}")
+        raise
+    return JSONResponse(content={
+        "query": q,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "results": results
+    })
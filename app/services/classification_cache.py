@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from ..models.database import SessionLocal, ClassificationCache, bulk_upsert
+from .claude import PROMPT_VERSION
+
+CACHE_TTL_DAYS = float(os.getenv("CLASSIFICATION_CACHE_TTL_DAYS", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CLASSIFICATION_CACHE_MAX_ENTRIES", "100000"))
+MEMORY_CACHE_SIZE = int(os.getenv("CLASSIFICATION_CACHE_MEMORY_SIZE", "10000"))
+# Results this process stores between two evictions
+EVICT_EVERY = int(os.getenv("CLASSIFICATION_CACHE_EVICT_EVERY", "1000"))
+
+# Process-wide LRU in front of the database table, keyed by cache_key
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+
+# Results stored since this process last ran evict()
+_since_eviction = 0
+_eviction_lock = threading.Lock()
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _memory_get(key):
+    with _memory_lock:
+        if key in _memory:
+            result, created_at = _memory[key]
+            if created_at >= datetime.utcnow() - timedelta(days=CACHE_TTL_DAYS):
+                _memory.move_to_end(key)
+                return result
+            del _memory[key]
+    return None
+
+
+def _memory_put(key, result, created_at):
+    with _memory_lock:
+        _memory[key] = (result, created_at)
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+class ResultCache:
+    """Classification results keyed by (content hash, model, prompt version, temperature).
+
+    Args:
+        model_name (str): Claude model name the results belong to
+        temperature (float): Sampling temperature the results were produced with
+        prompt_version (str, optional): Version of the classification prompt
+    """
+
+    def __init__(self, model_name: str, temperature: float, prompt_version: str = PROMPT_VERSION):
+        self.model_name = model_name
+        self.temperature = float(temperature)
+        self.prompt_version = prompt_version
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, content: str) -> str:
+        parts = [content_hash(content), self.model_name, self.prompt_version, repr(self.temperature)]
+        return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()
+
+    def get_many(self, contents: list[str]) -> dict:
+        """Look up cached results. Returns {content: result} for every hit."""
+        found = {}
+        missing = {}
+        for content in set(contents):
+            key = self.key(content)
+            result = _memory_get(key)
+            if result is not None:
+                found[content] = result
+            else:
+                missing[key] = content
+
+        if missing:
+            cutoff = datetime.utcnow() - timedelta(days=CACHE_TTL_DAYS)
+            now = datetime.utcnow()
+            with SessionLocal() as db:
+                keys = list(missing)
+                # Stay well below SQLite's bound-parameter limit
+                for i in range(0, len(keys), 500):
+                    rows = db.query(ClassificationCache).filter(
+                        ClassificationCache.cache_key.in_(keys[i:i + 500]),
+                        ClassificationCache.created_at >= cutoff
+                    ).all()
+                    for row in rows:
+                        result = json.loads(row.result)
+                        row.last_used_at = now
+                        found[missing[row.cache_key]] = result
+                        _memory_put(row.cache_key, result, row.created_at)
+                db.commit()
+
+        for content in contents:
+            if content in found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def put_many(self, results: dict):
+        """Store {content: result} pairs. Results carrying an error are skipped.
+
+        Upserts on cache_key, so processes caching the same content at once
+        do not conflict. The table is trimmed every EVICT_EVERY stored results.
+        """
+        now = datetime.utcnow()
+        rows = []
+        for content, result in results.items():
+            if result.get("error") or not result.get("classification"):
+                continue
+            stored = {"classification": result["classification"], "scores": result.get("scores")}
+            key = self.key(content)
+            rows.append({
+                "cache_key": key,
+                "content_hash": content_hash(content),
+                "model_name": self.model_name,
+                "prompt_version": self.prompt_version,
+                "temperature": self.temperature,
+                "result": json.dumps(stored),
+                "created_at": now,
+                "last_used_at": now
+            })
+            _memory_put(key, stored, now)
+        if not rows:
+            return
+        with SessionLocal() as db:
+            bulk_upsert(db, ClassificationCache, rows, ["cache_key"])
+            db.commit()
+
+        global _since_eviction
+        with _eviction_lock:
+            _since_eviction += len(rows)
+            due = _since_eviction >= EVICT_EVERY
+            if due:
+                _since_eviction = 0
+        if due:
+            evict()
+
+
+def evict():
+    """Drop expired entries and trim the table to CACHE_MAX_ENTRIES, least recently used first."""
+    cutoff = datetime.utcnow() - timedelta(days=CACHE_TTL_DAYS)
+    with SessionLocal() as db:
+        db.query(ClassificationCache).filter(ClassificationCache.created_at < cutoff).delete(synchronize_session=False)
+        overflow = db.query(ClassificationCache).count() - CACHE_MAX_ENTRIES
+        if overflow > 0:
+            stale = db.query(ClassificationCache.id).order_by(ClassificationCache.last_used_at.asc()).limit(overflow).subquery()
+            db.query(ClassificationCache).filter(ClassificationCache.id.in_(stale.select())).delete(synchronize_session=False)
+        db.commit()
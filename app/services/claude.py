@@ -1,38 +1,33 @@
-from anthropic import Anthropic
+from anthropic import Anthropic, APIConnectionError, APIStatusError, RateLimitError
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
 import json
+from .metrics import CLASSIFICATION_SECONDS, CLASSIFICATION_TOKENS
 
+logger = logging.getLogger(__name__)
 
-def claude_classify(
-    api_key: str,
-    model_name: str,
-    post_content: str,
-    max_tokens: int = 100,
-    temperature: float = 0.1
-) -> dict:
-    """
-    Classify a post using Claude (e.g., Sonnet) to determine if it discusses selling initial access,
-    unrelated items, or warnings/complaints.
+BATCH_POLL_INTERVAL = float(os.getenv("ANTHROPIC_BATCH_POLL_INTERVAL", "30"))
 
-    Args:
-        api_key (str): Anthropic API key.
-        model_name (str): Claude model name (e.g., 'claude-3-5-sonnet-20241022').
-        post_content (str): Post text to classify.
-        max_tokens (int, optional): Max output tokens. Defaults to 100.
-        temperature (float, optional): Sampling temperature. Defaults to 0.1.
+# Bump PROMPT_VERSION whenever SYSTEM_PROMPT changes meaningfully
+PROMPT_VERSION = "1"
 
-    Returns:
-        dict: JSON with classification, scores, and error (if any).
-    """
-    client = Anthropic(api_key=api_key)
-    prompt_template = """
-    Does this post discuss selling initial access to a company (e.g., RDP, VPN, admin access), selling unrelated items (e.g., accounts, tools), or warnings/complaints? Classify it as:
+# Classification criteria shared by the single-post and packed prompts
+CRITERIA = """Does the post discuss selling initial access to a company (e.g., RDP, VPN, admin access), selling unrelated items (e.g., accounts, tools), or warnings/complaints? Classify it as:
 - Positive: Selling initial access.
 - Neutral: Selling unrelated items.
 - Negative: Warnings, general posts or complaints.
 
 The content must be specifically about selling access to a company or business whose name is mentioned in the post. 
 
-Return **only** a JSON object with:
+"""
+
+# Static instructions, sent as a cacheable system prompt so every call
+# shares the same prefix; only the post itself varies per request.
+SYSTEM_PROMPT = CRITERIA + """Return **only** a JSON object with:
 - `classification`: "Positive", "Neutral", or "Negative".
 - `scores`: Probabilities for `positive`, `neutral`, `negative` (summing to 1).
 
@@ -41,34 +36,324 @@ Wrap the JSON in ```json
   ...
 }
 ``` to ensure proper formatting. Do not include any reasoning or extra text.
+Do not include any other text or explanations.
+Make sure to return the JSON object in the specified format.
+"""
+
+# Instructions for packed requests that carry several numbered posts
+PACKED_SYSTEM_PROMPT = CRITERIA + """Each message contains several posts, each introduced by `Post <index>:`. Classify every post independently.
+
+Return **only** a JSON array with one object per post, each with:
+- `index`: The post index as an integer.
+- `classification`: "Positive", "Neutral", or "Negative".
+- `scores`: Probabilities for `positive`, `neutral`, `negative` (summing to 1).
+
+Wrap the JSON in ```json
+[
+  ...
+]
+``` to ensure proper formatting. Do not include any reasoning or extra text.
+"""
 
-Post:
+POST_TEMPLATE = """Post:
 ```markdown
 {{POST}}
-``` 
+```"""
+
+PACKED_POST_TEMPLATE = """Post {{INDEX}}:
+```markdown
+{{POST}}
+```"""
+
+LABELS = ("Positive", "Neutral", "Negative")
 
-Do not include any other text or explanations.
-Make sure to return the JSON object in the specified format.
-"""
-    prompt = prompt_template.replace("{{POST}}", post_content)
 
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for rate limiting."""
+    return len(text) // 4 + 1
+
+
+def _retryable(error: Exception) -> bool:
+    """Whether a failed request is worth retrying: 429, 5xx (including 529 overloaded) or a connection error."""
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
     try:
-        message = client.messages.create(
-            model=model_name,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return min(30.0, 2 ** attempt) + random.uniform(0, 1)
+
+
+def batch_custom_id(content: str) -> str:
+    """custom_id of a post in a Message Batch: the SHA-256 of its content, so results match by content, not position."""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def parse_classification(content: str):
+    """Extract the JSON object between ```json and ``` in a model reply."""
+    start = content.index("```json\n") + 7
+    end = content.index("\n```", start)
+    return json.loads(content[start:end])
+
+
+def _valid_result(item) -> bool:
+    scores = item.get("scores") if isinstance(item, dict) else None
+    return (
+        item.get("classification") in LABELS
+        and isinstance(scores, dict)
+        and all(isinstance(scores.get(key), (int, float)) for key in ("positive", "neutral", "negative"))
+    )
+
+
+def pack_posts(contents: list[str], pack_size: int, token_budget: int) -> list[list[int]]:
+    """Group post indexes into packs of at most `pack_size` posts and ~`token_budget` prompt tokens."""
+    packs = []
+    current, current_tokens = [], 0
+    for index, content in enumerate(contents):
+        tokens = estimate_tokens(content)
+        if current and (len(current) >= pack_size or current_tokens + tokens > token_budget):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def _usage_dict(usage) -> dict:
+    return {
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0
+    }
+
+
+def _count_tokens(model_name: str, usage):
+    for kind, tokens in _usage_dict(usage).items():
+        if tokens:
+            CLASSIFICATION_TOKENS.labels(model_name, kind.removesuffix("_tokens")).inc(tokens)
+
+
+class ClaudeClassifier:
+    """Classifies posts with one pooled Anthropic client.
+
+    A classifier is meant to live for a whole report or the whole process,
+    so HTTP connections are reused and the static system prompt can be
+    served from Anthropic's prompt cache.
+
+    Args:
+        api_key (str): Anthropic API key.
+        model_name (str): Claude model name (e.g., 'claude-3-5-sonnet-20241022').
+        max_retries (int, optional): Retries after a 429, a 5xx or a connection error. Defaults to 3.
+    """
+
+    def __init__(self, api_key: str, model_name: str, max_retries: int = 3):
+        self.model_name = model_name
+        self.max_retries = max_retries
+        # create_message retries itself so it can back off the shared rate limiter
+        self.client = Anthropic(api_key=api_key, max_retries=0)
+        # Message Batch calls keep the SDK's own retries
+        self.batch_client = self.client.with_options(max_retries=max_retries)
+        self.system = [
+            {"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}
+        ]
+        self.packed_system = [
+            {"type": "text", "text": PACKED_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}
+        ]
+
+    def create_message(self, prompt: str, max_tokens: int, temperature: float, limiter=None, system=None):
+        """Send one prompt, retrying on 429, 5xx and connection errors. Returns (message, latency in seconds)."""
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                message = self.client.messages.create(
+                    model=self.model_name,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    system=system or self.system,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ]
+                )
+                latency = time.perf_counter() - started
+                CLASSIFICATION_SECONDS.labels(self.model_name, "ok").observe(latency)
+                _count_tokens(self.model_name, message.usage)
+                return message, latency
+            except RateLimitError as e:
+                CLASSIFICATION_SECONDS.labels(self.model_name, "rate_limited").observe(time.perf_counter() - started)
+                if attempt == self.max_retries:
+                    raise
+                if limiter is not None:
+                    limiter.backoff()
+                time.sleep(_retry_delay(e, attempt))
+            except Exception as e:
+                CLASSIFICATION_SECONDS.labels(self.model_name, "error").observe(time.perf_counter() - started)
+                if attempt == self.max_retries or not _retryable(e):
+                    raise
+                logger.warning("Retrying Messages API request", extra={"model": self.model_name, "attempt": attempt + 1, "error": str(e)})
+                time.sleep(_retry_delay(e, attempt))
+
+    def classify(self, post_content: str, max_tokens: int = 100, temperature: float = 0.1, limiter=None) -> dict:
+        """
+        Classify a single post.
+
+        Returns:
+            dict: JSON with classification, scores, latency (seconds), usage and error (if any).
+        """
+        prompt = POST_TEMPLATE.replace("{{POST}}", post_content)
+        try:
+            message, latency = self.create_message(prompt, max_tokens, temperature, limiter)
+            result = parse_classification(message.content[0].text)
+            result["latency"] = round(latency, 4)
+            result["usage"] = _usage_dict(message.usage)
+            return result
+        except Exception as e:
+            return {"error": f"Failed to classify post: {str(e)}", "classification": None, "scores": None}
+
+    def classify_packed(self, contents: list[str], max_tokens: int = 100, temperature: float = 0.1, limiter=None) -> list:
+        """
+        Classify several posts with one request.
+
+        `max_tokens` is the per-post output budget. Items the model leaves out
+        or returns malformed come back as None so the caller can fall back to
+        single-post calls.
+
+        Returns:
+            list: One result dict (or None) per post, in input order.
+        """
+        prompt = "\n\n".join(
+            PACKED_POST_TEMPLATE.replace("{{INDEX}}", str(index)).replace("{{POST}}", content)
+            for index, content in enumerate(contents)
         )
-        content = message.content[0].text
-        # Extract JSON between ```json and ```
-        start = content.index("```json\n") + 7
-        end = content.index("\n```", start)
-        result = json.loads(content[start:end])
-        return result
-    except Exception as e:
-        return {"error": f"Failed to classify post: {str(e)}", "classification": None, "scores": None}
+        results = [None] * len(contents)
+        try:
+            message, latency = self.create_message(
+                prompt, max_tokens * len(contents), temperature, limiter, system=self.packed_system
+            )
+            items = parse_classification(message.content[0].text)
+        except Exception as e:
+            logger.warning("Packed classification failed, falling back to single posts", extra={"posts": len(contents), "error": str(e)})
+            return results
+        if not isinstance(items, list):
+            return results
+        for item in items:
+            if not isinstance(item, dict) or not _valid_result(item):
+                continue
+            index = item.get("index")
+            if isinstance(index, int) and 0 <= index < len(contents):
+                results[index] = {
+                    "classification": item["classification"],
+                    "scores": item["scores"],
+                    "latency": round(latency, 4)
+                }
+        # Usage belongs to the whole request; report it once on the first item
+        for result in results:
+            if result is not None:
+                result["usage"] = _usage_dict(message.usage)
+                break
+        return results
+
+    def submit_batch(self, contents: list[str], max_tokens: int = 100, temperature: float = 0.1) -> str:
+        """Submit posts as one Message Batch. Returns the batch id; custom_id is batch_custom_id(content)."""
+        requests = [
+            {
+                "custom_id": batch_custom_id(content),
+                "params": {
+                    "model": self.model_name,
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                    "system": self.system,
+                    "messages": [
+                        {"role": "user", "content": POST_TEMPLATE.replace("{{POST}}", content)}
+                    ]
+                }
+            }
+            for content in dict.fromkeys(contents)
+        ]
+        batch = self.batch_client.messages.batches.create(requests=requests)
+        return batch.id
+
+    def wait_for_batch(self, batch_id: str, poll_interval: float = BATCH_POLL_INTERVAL, timeout: float = 24 * 3600):
+        """Poll a Message Batch until it has ended. Raises TimeoutError after `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while True:
+            batch = self.batch_client.messages.batches.retrieve(batch_id)
+            if batch.processing_status == "ended":
+                return batch
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Message batch {batch_id} did not finish within {timeout} seconds")
+            time.sleep(poll_interval)
+
+    def batch_results(self, batch_id: str, contents: list[str]) -> dict:
+        """Collect the parsed results of an ended batch.
+
+        Returns:
+            dict: {content: result} for each of `contents` the batch has a result for
+        """
+        by_id = {batch_custom_id(content): content for content in contents}
+        results = {}
+        for entry in self.batch_client.messages.batches.results(batch_id):
+            content = by_id.get(entry.custom_id)
+            if content is None:
+                continue
+            if entry.result.type != "succeeded":
+                results[content] = {"error": f"Failed to classify post: batch request {entry.result.type}", "classification": None, "scores": None}
+                continue
+            message = entry.result.message
+            _count_tokens(self.model_name, message.usage)
+            try:
+                result = parse_classification(message.content[0].text)
+                result["usage"] = _usage_dict(message.usage)
+                results[content] = result
+            except Exception as e:
+                results[content] = {"error": f"Failed to classify post: {str(e)}", "classification": None, "scores": None}
+        return results
+
+
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+
+def get_classifier(api_key: str, model_name: str) -> ClaudeClassifier:
+    """Return the process-wide classifier for an (API key, model) pair."""
+    key = (api_key, model_name)
+    with _classifiers_lock:
+        if key not in _classifiers:
+            _classifiers[key] = ClaudeClassifier(api_key, model_name)
+        return _classifiers[key]
+
+
+def claude_classify(
+    api_key: str,
+    model_name: str,
+    post_content: str,
+    max_tokens: int = 100,
+    temperature: float = 0.1,
+    limiter=None
+) -> dict:
+    """
+    Classify a post using Claude (e.g., Sonnet) to determine if it discusses selling initial access,
+    unrelated items, or warnings/complaints.
+
+    Args:
+        api_key (str): Anthropic API key.
+        model_name (str): Claude model name (e.g., 'claude-3-5-sonnet-20241022').
+        post_content (str): Post text to classify.
+        max_tokens (int, optional): Max output tokens. Defaults to 100.
+        temperature (float, optional): Sampling temperature. Defaults to 0.1.
+        limiter (RateLimiter, optional): Shared limiter told to back off on 429.
+
+    Returns:
+        dict: JSON with classification, scores, latency, usage and error (if any).
+    """
+    return get_classifier(api_key, model_name).classify(post_content, max_tokens, temperature, limiter)
 
 
 # Example usage 
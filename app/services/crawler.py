@@ -0,0 +1,144 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from urllib.parse import urljoin, urlparse, parse_qs
+from .http_pool import get_session
+from .parsers import extract_listing, get_backend
+from .site_profiles import profile_for_url
+from .metrics import PARSE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that usually carry the page number of a listing
+PAGE_PARAMS = ('page', 'p', 'pg', 'offset', 'start')
+NEXT_LINK_TEXTS = ('next', 'next page', 'older', '»', '›', '>', '>>')
+
+
+def _absolute_link(href, page_url, base_url):
+    if href.startswith('/'):
+        return base_url.rstrip('/') + href
+    return urljoin(page_url, href)
+
+
+def _is_page_variant(candidate, page_url):
+    """True when candidate is the same listing as page_url with a different page param."""
+    a, b = urlparse(candidate), urlparse(page_url)
+    if a.netloc != b.netloc or a.path != b.path:
+        return False
+    qa, qb = parse_qs(a.query), parse_qs(b.query)
+    changed = {k for k in set(qa) | set(qb) if qa.get(k) != qb.get(k)}
+    return bool(changed) and changed <= set(PAGE_PARAMS)
+
+
+def parse_listing(html, page_url, base_url, rules=None, backend=None):
+    """Extract post rows and pagination links from one listing page.
+
+    Only plain dicts and strings are returned so the parsed tree can be
+    released as soon as the page has been processed.
+
+    Args:
+        html (str): Listing page HTML
+        page_url (str): URL the page was fetched from
+        base_url (str): Site root used to resolve '/'-relative links
+        rules (dict, optional): Extraction rules, see parsers.DEFAULT_RULES, or compile_rules() output
+        backend (optional): Parser backend from parsers.get_backend()
+
+    Returns:
+        tuple: (rows, next_links) or (None, next_links) if no table was found
+    """
+    rows, links = extract_listing(html, rules, backend)
+
+    next_links = []
+    for tag, href, rel, text, classes in links:
+        href = _absolute_link(href, page_url, base_url)
+        text = text.lower()
+        if 'next' in rel.lower().split() or text in NEXT_LINK_TEXTS or 'next' in classes.lower() or _is_page_variant(href, page_url):
+            if urlparse(href).netloc == urlparse(page_url).netloc:
+                next_links.append(href)
+
+    if rows is None:
+        return None, next_links
+    for row in rows:
+        row['link'] = _absolute_link(row.pop('href'), page_url, base_url)
+    return rows, next_links
+
+
+class ListingCrawler:
+    """Breadth-first crawl over paginated marketplace listings.
+
+    Listing pages are taken from a FIFO frontier, fetched `concurrency` at a
+    time, and every discovered pagination link is queued once (visited-set
+    dedup) until `max_pages` pages or `max_depth` pagination hops are reached.
+    Post rows are deduplicated by link and yielded as they are discovered.
+    Selectors and the base URL come from the site profile of the start URL.
+    """
+
+    def __init__(self, start_url, proxies, headers=None, timeout=30, max_pages=1, max_depth=1, concurrency=1, profile=None, parser=None, pool=None, limiter=None):
+        self.start_url = start_url
+        self.proxies = proxies
+        self.pool = pool  # ProxyPool to spread listing fetches over, if any
+        self.limiter = limiter  # HostLimiter shared with the post fetches, if any
+        self.headers = headers
+        self.timeout = timeout
+        self.max_pages = max(1, int(max_pages))
+        self.max_depth = max(0, int(max_depth))
+        self.concurrency = max(1, int(concurrency))
+        # Site profile picked by hostname unless one is given
+        self.profile = profile or profile_for_url(start_url)
+        self.rules = self.profile.compiled_rules
+        self.backend = get_backend(parser)
+        # Base URL (e.g., http://ft4uneyq3hu3txsmw6rnzrzrgxcbddze3hukj3kef6pvtlaycu6f7jid.onion)
+        self.base_url = self.profile.base_url(start_url)
+        self.frontier = deque([(start_url, 0)])
+        self.visited = {start_url}
+        self.seen_links = set()
+        self.pages_fetched = 0
+
+    def _get(self, url):
+        if self.pool is not None:
+            return self.pool.get(url, headers=self.headers, timeout=self.timeout)
+        return get_session(url, self.proxies).get(url, proxies=self.proxies, headers=self.headers, timeout=self.timeout)
+
+    def _fetch(self, url):
+        if self.limiter is not None:
+            response = self.limiter.request(url, lambda: self._get(url))
+        else:
+            response = self._get(url)
+        response.raise_for_status()
+        with PARSE_SECONDS.labels("listing").time():
+            return parse_listing(response.text, url, self.base_url, self.rules, self.backend)
+
+    def _fetch_safe(self, item):
+        url, depth = item
+        if url == self.start_url:
+            # Failures on the entry page fail the whole scan
+            return url, depth, self._fetch(url)
+        try:
+            return url, depth, self._fetch(url)
+        except Exception as e:
+            logger.warning("Failed to fetch listing page", extra={"url": url, "error": str(e)})
+            return url, depth, (None, [])
+
+    def crawl(self):
+        """Yield post rows (title, category, date, link) across all listing pages."""
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while self.frontier and self.pages_fetched < self.max_pages:
+                budget = min(self.concurrency, self.max_pages - self.pages_fetched)
+                batch = [self.frontier.popleft() for _ in range(min(budget, len(self.frontier)))]
+                for url, depth, (rows, next_links) in executor.map(self._fetch_safe, batch):
+                    self.pages_fetched += 1
+                    if rows is None:
+                        if url == self.start_url:
+                            raise ValueError("Table not found in HTML")
+                        logger.warning("No listing table found", extra={"url": url})
+                        rows = []
+                    for row in rows:
+                        if row['link'] in self.seen_links:
+                            continue
+                        self.seen_links.add(row['link'])
+                        yield row
+                    if depth < self.max_depth:
+                        for link in next_links:
+                            if link not in self.visited:
+                                self.visited.add(link)
+                                self.frontier.append((link, depth + 1))
@@ -0,0 +1,243 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import requests
+from .metrics import FETCH_BYTES, FETCH_SECONDS
+
+# Retries after a transient failure (connection error, timeout, 429 or 5xx)
+MAX_RETRIES = int(os.getenv("SCRAPER_MAX_RETRIES", "2"))
+# Base and cap in seconds of the jittered exponential backoff between retries
+BACKOFF_FACTOR = float(os.getenv("SCRAPER_BACKOFF_FACTOR", "0.5"))
+BACKOFF_MAX = float(os.getenv("SCRAPER_BACKOFF_MAX", "30"))
+# Consecutive failures that open a host's circuit breaker
+BREAKER_THRESHOLD = int(os.getenv("SCRAPER_BREAKER_THRESHOLD", "5"))
+# Seconds an open breaker fails fast before letting one probe request through
+BREAKER_COOLDOWN = float(os.getenv("SCRAPER_BREAKER_COOLDOWN", "30"))
+
+# Statuses worth retrying, and the ones meaning the host asks us to slow down
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+THROTTLE_STATUSES = (429, 503)
+# Weight of the newest sample in the latency moving average
+LATENCY_EWMA_ALPHA = 0.3
+
+
+class HostUnavailable(Exception):
+    """Raised instead of sending a request while a host's circuit breaker is open."""
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_FACTOR * 2 ** attempt))
+
+
+def retry_after(response):
+    """Seconds asked for by a Retry-After header, or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(BACKOFF_MAX, max(0.0, seconds))
+
+
+class HostGuard:
+    """Adaptive concurrency limit and circuit breaker for one host.
+
+    The number of requests allowed in flight follows AIMD, like TCP
+    congestion control: every success adds 1/limit (about +1 per round of
+    requests) up to `max_concurrency`, and a throttling answer (429/503) or a
+    failure halves it. Only requests started after the last decrease can
+    halve it again, so a burst of errors from one round counts once.
+
+    After BREAKER_THRESHOLD consecutive failures the breaker opens and
+    requests fail fast with HostUnavailable. After BREAKER_COOLDOWN one probe
+    request is let through: success closes the breaker, failure reopens it.
+    """
+
+    def __init__(self, max_concurrency, min_concurrency=1):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_concurrency = max(1, min(int(min_concurrency), self.max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.failures = 0  # Consecutive failures
+        self.opened_until = None  # Set while the breaker is open
+        self.probing = False
+        self.latency = None
+        self.counts = {
+            "requests": 0, "ok": 0, "throttled": 0, "failed": 0,
+            "retries": 0, "short_circuited": 0, "breaker_opened": 0
+        }
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Wait for a request slot. Returns the start time to pass to release().
+
+        Raises:
+            HostUnavailable: The breaker is open
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.opened_until is not None:
+                    if now < self.opened_until or self.probing:
+                        self.counts["short_circuited"] += 1
+                        raise HostUnavailable("Host is failing, circuit breaker open")
+                    # Half-open: this request is the probe
+                    self.probing = True
+                    break
+                if now < self.paused_until:
+                    self._cond.wait(self.paused_until - now)
+                elif self.in_flight < int(self.limit):
+                    break
+                else:
+                    self._cond.wait()
+            self.in_flight += 1
+            self.counts["requests"] += 1
+            return now
+
+    def release(self, started, outcome):
+        """Record the outcome of a request: 'ok', 'throttled' or 'failed'."""
+        with self._cond:
+            now = time.monotonic()
+            self.in_flight -= 1
+            self.counts[outcome] += 1
+            if outcome == "ok":
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.failures = 0
+                self.opened_until = None
+                self.probing = False
+                latency = now - started
+                self.latency = latency if self.latency is None else self.latency + LATENCY_EWMA_ALPHA * (latency - self.latency)
+            else:
+                if started >= self.last_decrease:
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    self.last_decrease = now
+                if outcome == "failed":
+                    self.failures += 1
+                    if self.probing or self.failures >= BREAKER_THRESHOLD:
+                        if self.opened_until is None or self.probing:
+                            self.counts["breaker_opened"] += 1
+                        self.opened_until = now + BREAKER_COOLDOWN
+                        self.probing = False
+                elif self.probing:
+                    # A throttled probe shows the host is up
+                    self.opened_until = None
+                    self.probing = False
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        """Hold back every request to this host for `seconds`, e.g. for Retry-After."""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def retried(self):
+        with self._cond:
+            self.counts["retries"] += 1
+
+    def to_dict(self):
+        with self._cond:
+            if self.opened_until is None:
+                breaker = "closed"
+            elif self.probing or time.monotonic() >= self.opened_until:
+                breaker = "half_open"
+            else:
+                breaker = "open"
+            return {
+                **self.counts,
+                "limit": round(self.limit, 2),
+                "latency": round(self.latency, 3) if self.latency is not None else None,
+                "breaker": breaker
+            }
+
+
+class HostLimiter:
+    """Per-host politeness and resilience layer for scraper requests.
+
+    Each onion host gets its own HostGuard. request() retries transient
+    failures with jittered backoff, honouring Retry-After.
+
+    Args:
+        max_per_host (int, optional): Ceiling of the adaptive per-host concurrency
+        max_retries (int, optional): Retries after a transient failure
+    """
+
+    def __init__(self, max_per_host=4, max_retries=MAX_RETRIES):
+        self.max_per_host = max(1, int(max_per_host))
+        self.max_retries = max(0, int(max_retries))
+        self._lock = threading.Lock()
+        self._guards = {}
+
+    def for_url(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._guards:
+                self._guards[host] = HostGuard(self.max_per_host)
+            return self._guards[host]
+
+    def request(self, url, send):
+        """Call `send()` to request `url` within the host's limits.
+
+        Args:
+            url (str): URL being requested, used to pick the host
+            send (callable): Makes the request and returns a requests.Response
+
+        Returns:
+            requests.Response: The last response, which may still be an error status
+
+        Raises:
+            HostUnavailable: The host's breaker is open
+            requests.RequestException: Connection errors and timeouts once retries run out
+        """
+        host = urlparse(url).netloc
+        guard = self.for_url(url)
+        for attempt in range(self.max_retries + 1):
+            started = guard.acquire()
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout):
+                self._release(guard, host, started, "failed")
+                if attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+            except Exception:
+                self._release(guard, host, started, "failed")
+                raise
+            else:
+                status = response.status_code
+                if status in THROTTLE_STATUSES:
+                    self._release(guard, host, started, "throttled")
+                elif status >= 500:
+                    self._release(guard, host, started, "failed")
+                else:
+                    self._release(guard, host, started, "ok")
+                FETCH_BYTES.labels(host).inc(len(response.content))
+                if status not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                delay = retry_after(response)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                elif status == 429:
+                    # An explicit rate limit applies to the whole host, not just this request
+                    guard.pause(delay)
+            guard.retried()
+            time.sleep(delay)
+
+    def _release(self, guard, host, started, outcome):
+        FETCH_SECONDS.labels(host, outcome).observe(time.monotonic() - started)
+        guard.release(started, outcome)
+
+    def stats(self):
+        """Per-host request counts, current concurrency limit, latency and breaker state."""
+        with self._lock:
+            guards = dict(self._guards)
+        return {host: guard.to_dict() for host, guard in guards.items()}
@@ -0,0 +1,81 @@
+import os
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Pool sizes can be tuned from the environment. Retries are handled per
+# host by host_limiter.HostLimiter, so sessions never retry on their own.
+POOL_CONNECTIONS = int(os.getenv("SCRAPER_POOL_CONNECTIONS", "4"))
+POOL_MAXSIZE = int(os.getenv("SCRAPER_POOL_MAXSIZE", "16"))
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def _build_session(pool_maxsize):
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=pool_maxsize,
+        max_retries=0,
+        pool_block=False
+    )
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.headers['Connection'] = 'keep-alive'
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def session_key(url, proxies):
+    """Return the (proxy, host) pair a session is shared under."""
+    scheme = urlparse(url).scheme or 'http'
+    proxy = (proxies or {}).get(scheme) or ''
+    return proxy, urlparse(url).netloc
+
+
+def get_session(url, proxies, pool_maxsize=POOL_MAXSIZE):
+    """Return the shared keep-alive session for the URL's (proxy, host) pair.
+
+    Reusing one session per pair keeps the SOCKS handshake and Tor stream
+    alive across requests instead of paying for them on every page.
+
+    Args:
+        url (str): URL that will be requested
+        proxies (dict): Proxy configuration for HTTP/HTTPS
+        pool_maxsize (int, optional): Max pooled connections for a new session
+
+    Returns:
+        requests.Session: Session with proxies and pooling configured
+    """
+    key = session_key(url, proxies)
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _build_session(max(pool_maxsize, 1))
+            session.proxies.update(proxies or {})
+            _sessions[key] = session
+        return session
+
+
+def drop_sessions(proxy):
+    """Close and forget the sessions going through `proxy`, e.g. a retired Tor circuit."""
+    with _lock:
+        keys = [key for key in _sessions if key[0] == proxy]
+        sessions = [_sessions.pop(key) for key in keys]
+    for session in sessions:
+        session.close()
+
+
+def close_sessions():
+    """Close and forget every pooled session."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,204 @@
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func
+from ..models.database import SessionLocal, Job
+
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "10"))
+RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "900"))
+
+# Payload keys scrubbed once a job is finished, so API keys don't linger in the table
+SECRET_KEYS = {"api_key"}
+
+
+class LeaseLost(Exception):
+    """Raised inside a job handler once its worker no longer holds the job's lease."""
+
+
+def check_lease(lease_lost):
+    """Raise LeaseLost if the worker has set `lease_lost`.
+
+    Handlers call this before committing results, so a job that expired and
+    was handed to another worker is not written by both.
+
+    Args:
+        lease_lost (threading.Event | None): Set by the worker when a heartbeat fails
+    """
+    if lease_lost is not None and lease_lost.is_set():
+        raise LeaseLost("The job's lease expired and it may be running on another worker")
+
+
+def enqueue(db, job_type: str, reference: str, payload: dict, max_attempts: int = 3, delay: float = 0) -> Job:
+    """Add a job to the queue and commit it.
+
+    Args:
+        db (Session): Database session
+        job_type (str): Handler name, e.g. "scan"
+        reference (str): Row the job works on, e.g. "scan:12"
+        payload (dict): JSON-serialisable keyword arguments for the handler
+        max_attempts (int, optional): Attempts before the job is marked failed. Defaults to 3
+        delay (float, optional): Seconds before the job may be claimed. Defaults to 0
+
+    Returns:
+        Job: The queued job
+    """
+    now = datetime.utcnow()
+    job = Job(
+        job_type=job_type,
+        reference=reference,
+        payload=json.dumps(payload),
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts,
+        run_after=now + timedelta(seconds=delay),
+        created_at=now,
+        updated_at=now
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def claim(worker_id: str, job_types: tuple, limit: int):
+    """Atomically lease the oldest runnable job of any of `job_types`.
+
+    The job is only taken while fewer than `limit` jobs of those types
+    together hold a live lease, so the concurrency cap holds across processes.
+
+    Returns:
+        Job | None: The leased job, detached from its session
+    """
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        running = select(func.count()).select_from(Job).where(
+            Job.job_type.in_(job_types),
+            Job.status == "running",
+            Job.lease_until > now
+        ).scalar_subquery()
+        candidate = select(Job.id).where(
+            Job.job_type.in_(job_types),
+            Job.status == "queued",
+            Job.run_after <= now
+        ).order_by(Job.run_after, Job.id).limit(1).scalar_subquery()
+        job_id = db.execute(
+            update(Job)
+            .where(Job.id == candidate, Job.status == "queued", running < limit)
+            .values(
+                status="running",
+                worker_id=worker_id,
+                attempts=Job.attempts + 1,
+                lease_until=now + timedelta(seconds=LEASE_SECONDS),
+                updated_at=now
+            )
+            .returning(Job.id)
+        ).scalar()
+        db.commit()
+        if job_id is None:
+            return None
+        job = db.get(Job, job_id)
+        db.expunge(job)
+        return job
+
+
+def heartbeat(job_id: int, worker_id: str) -> bool:
+    """Extend a job's lease. Returns False if the worker no longer owns the job."""
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        updated = db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.worker_id == worker_id, Job.status == "running")
+            .values(lease_until=now + timedelta(seconds=LEASE_SECONDS), updated_at=now)
+        ).rowcount
+        db.commit()
+        return updated == 1
+
+
+def _scrub(payload: str) -> str:
+    data = json.loads(payload or "{}")
+    for key in SECRET_KEYS & set(data):
+        data[key] = None
+    return json.dumps(data)
+
+
+def complete(job_id: int):
+    with SessionLocal() as db:
+        job = db.get(Job, job_id)
+        job.status = "completed"
+        job.lease_until = None
+        job.payload = _scrub(job.payload)
+        job.updated_at = datetime.utcnow()
+        db.commit()
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1)))
+
+
+def fail(job_id: int, error: str) -> bool:
+    """Record a failed attempt. Returns True if the job was requeued for another try."""
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        job = db.get(Job, job_id)
+        job.last_error = error
+        job.lease_until = None
+        job.updated_at = now
+        retried = job.attempts < job.max_attempts
+        if retried:
+            job.status = "queued"
+            job.run_after = now + timedelta(seconds=retry_delay(job.attempts))
+        else:
+            job.status = "failed"
+            job.payload = _scrub(job.payload)
+        db.commit()
+        return retried
+
+
+def requeue_expired(on_failure=None) -> int:
+    """Return jobs whose worker stopped heartbeating to the queue. Returns the count.
+
+    Args:
+        on_failure (callable, optional): Called with (job_type, payload, error)
+            for each job that has no attempts left and is marked failed instead
+    """
+    now = datetime.utcnow()
+    failed = []
+    with SessionLocal() as db:
+        expired = db.query(Job).filter(Job.status == "running", Job.lease_until < now).all()
+        for job in expired:
+            job.last_error = "Lease expired"
+            job.lease_until = None
+            job.run_after = now
+            job.updated_at = now
+            if job.attempts < job.max_attempts:
+                job.status = "queued"
+            else:
+                job.status = "failed"
+                failed.append((job.job_type, json.loads(job.payload or "{}")))
+                job.payload = _scrub(job.payload)
+        db.commit()
+    if on_failure is not None:
+        for job_type, payload in failed:
+            on_failure(job_type, payload, "Lease expired")
+    return len(expired)
+
+
+def has_active_job(db, reference: str) -> bool:
+    return db.query(Job.id).filter(
+        Job.reference == reference,
+        Job.status.in_(("queued", "running"))
+    ).first() is not None
+
+
+def queue_depth(db) -> dict:
+    """Number of queued and running jobs per type."""
+    rows = db.query(Job.job_type, Job.status, func.count()).filter(
+        Job.status.in_(("queued", "running"))
+    ).group_by(Job.job_type, Job.status).all()
+    depth = {}
+    for job_type, status, count in rows:
+        depth.setdefault(job_type, {"queued": 0, "running": 0})[status] = count
+    return depth
@@ -0,0 +1,204 @@
+import argparse
+import csv
+import logging
+import os
+import threading
+import time
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, classification_report
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+from sklearn.pipeline import FeatureUnion, Pipeline
+from .claude import LABELS
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATASET_PATH = os.path.join(ROOT_DIR, "datasets", "base.csv")
+MODEL_PATH = os.getenv("LOCAL_CLASSIFIER_PATH", os.path.join(ROOT_DIR, "datasets", "local_classifier.joblib"))
+# Posts the local model is at least this confident about skip Claude in cascade mode
+CASCADE_THRESHOLD = float(os.getenv("LOCAL_CASCADE_THRESHOLD", "0.7"))
+# Labels the local model may settle on its own; Positive posts are the findings, so Claude confirms them
+CASCADE_LABELS = tuple(
+    label.strip().capitalize() for label in os.getenv("LOCAL_CASCADE_LABELS", "Negative,Neutral").split(",") if label.strip()
+)
+
+
+def load_dataset(path=DATASET_PATH):
+    """Read a (text, label) CSV like datasets/base.csv.
+
+    Returns:
+        tuple: (texts, labels) with labels as "Positive", "Neutral" or "Negative"
+    """
+    texts, labels = [], []
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            label = (row.get("label") or "").strip().capitalize()
+            if row.get("text") and label in LABELS:
+                texts.append(row["text"])
+                labels.append(label)
+    return texts, labels
+
+
+def build_pipeline():
+    """TF-IDF over word 1-2-grams and character 3-5-grams, then a logistic regression.
+
+    Character n-grams keep the model useful on the misspellings and
+    shorthand common in forum posts ("RDP w/ DA", "acc3ss").
+    """
+    features = FeatureUnion([
+        ("words", TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=1)),
+        ("chars", TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), sublinear_tf=True, min_df=2))
+    ])
+    return Pipeline([
+        ("features", features),
+        ("model", LogisticRegression(C=10.0, class_weight="balanced", max_iter=2000))
+    ])
+
+
+class LocalClassifier:
+    """CPU-only post classifier with the same result shape as the Claude classifier.
+
+    Args:
+        pipeline (Pipeline): Fitted pipeline from build_pipeline()
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.classes = list(pipeline.classes_)
+
+    @classmethod
+    def train(cls, texts, labels):
+        return cls(build_pipeline().fit(texts, labels))
+
+    @classmethod
+    def load(cls, path=MODEL_PATH):
+        return cls(joblib.load(path))
+
+    def save(self, path=MODEL_PATH):
+        joblib.dump(self.pipeline, path)
+
+    def predict_proba(self, contents):
+        """Probabilities per post as an array of shape (len(contents), len(self.classes))."""
+        return self.pipeline.predict_proba(list(contents))
+
+    def predict(self, contents):
+        """Classify posts in one vectorized pass.
+
+        Returns:
+            list: One dict per post with classification, scores and latency
+                (the post's share of the batch time, in seconds)
+        """
+        contents = list(contents)
+        if not contents:
+            return []
+        started = time.perf_counter()
+        probabilities = self.predict_proba(contents)
+        latency = round((time.perf_counter() - started) / len(contents), 6)
+        results = []
+        for row in probabilities:
+            best = int(np.argmax(row))
+            results.append({
+                "classification": self.classes[best],
+                "scores": {label.lower(): round(float(p), 4) for label, p in zip(self.classes, row)},
+                "latency": latency
+            })
+        return results
+
+
+def cascade_split(classifier, contents, threshold=CASCADE_THRESHOLD, labels=CASCADE_LABELS):
+    """Classify `contents` locally and keep the results confident enough to skip Claude.
+
+    Returns:
+        tuple: ({content: result} settled locally, [contents left for Claude])
+    """
+    settled, remaining = {}, []
+    for content, result in zip(contents, classifier.predict(contents)):
+        label = result["classification"]
+        if label in labels and result["scores"][label.lower()] >= threshold:
+            settled[content] = result
+        else:
+            remaining.append(content)
+    return settled, remaining
+
+
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+
+def get_local_classifier(path=MODEL_PATH):
+    """Return the process-wide LocalClassifier loaded from `path`.
+
+    Without a saved model, one is trained from DATASET_PATH (about a second
+    on the shipped dataset) and saved to `path` when it is writable.
+    """
+    with _classifiers_lock:
+        if path not in _classifiers:
+            if os.path.exists(path):
+                _classifiers[path] = LocalClassifier.load(path)
+            else:
+                logger.info("No local classifier saved, training one", extra={"path": path, "dataset": DATASET_PATH})
+                classifier = LocalClassifier.train(*load_dataset(DATASET_PATH))
+                try:
+                    classifier.save(path)
+                except OSError as e:
+                    logger.warning("Could not save local classifier", extra={"path": path, "error": str(e)})
+                _classifiers[path] = classifier
+        return _classifiers[path]
+
+
+def evaluate(texts, labels, folds=5, thresholds=(0.5, 0.6, 0.7, 0.8, 0.9), cascade_labels=CASCADE_LABELS):
+    """Cross-validated accuracy, plus how many posts a cascade would keep local per threshold.
+
+    Returns:
+        dict: accuracy, report (per-class precision/recall) and cascade rows with
+            threshold, local_share and local_accuracy
+    """
+    folds = max(2, min(folds, min(labels.count(label) for label in set(labels))))
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=0)
+    pipeline = build_pipeline()
+    probabilities = cross_val_predict(pipeline, texts, labels, cv=splitter, method="predict_proba")
+    classes = sorted(set(labels))
+    predicted = [classes[i] for i in probabilities.argmax(axis=1)]
+    confidence = probabilities.max(axis=1)
+    cascade = []
+    for threshold in thresholds:
+        local = (confidence >= threshold) & np.isin(predicted, cascade_labels)
+        correct = [p == l for p, l, keep in zip(predicted, labels, local) if keep]
+        cascade.append({
+            "threshold": threshold,
+            "local_share": round(float(local.mean()), 3),
+            "local_accuracy": round(sum(correct) / len(correct), 3) if correct else None
+        })
+    return {
+        "folds": folds,
+        "accuracy": round(accuracy_score(labels, predicted), 3),
+        "report": classification_report(labels, predicted, zero_division=0),
+        "cascade": cascade
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or evaluate the local post classifier")
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--data", default=DATASET_PATH, help="CSV with text and label columns")
+    parser.add_argument("--output", default=MODEL_PATH, help="Where train saves the model")
+    parser.add_argument("--folds", type=int, default=5, help="Cross-validation folds for evaluate")
+    args = parser.parse_args()
+
+    texts, labels = load_dataset(args.data)
+    print(f"Loaded {len(texts)} posts from {args.data}")
+    if args.command == "train":
+        LocalClassifier.train(texts, labels).save(args.output)
+        print(f"Saved model to {args.output}")
+    else:
+        results = evaluate(texts, labels, args.folds)
+        print(f"{results['folds']}-fold accuracy: {results['accuracy']}")
+        print(results["report"])
+        for row in results["cascade"]:
+            print(
+                f"threshold={row['threshold']:.2f} kept local={row['local_share']:.1%} "
+                f"local accuracy={row['local_accuracy']}"
+            )
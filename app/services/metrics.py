@@ -0,0 +1,264 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# Seconds between the metric snapshots worker processes publish to the database
+PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_SECONDS", "15"))
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Requests over Tor take seconds, and up to the scraper timeout when a circuit stalls
+FETCH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+class Metric:
+    """Base of the metric types: a value per combination of label values.
+
+    Args:
+        name (str): Metric name, e.g. "scraper_fetch_bytes_total"
+        documentation (str): HELP text
+        labelnames (tuple, optional): Label names, values are given to labels()
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def labels(self, *values):
+        """The child metric for one combination of label values."""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+        return _Child(self, tuple(str(value) for value in values))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "help": self.documentation,
+                "labelnames": list(self.labelnames),
+                "values": [[list(key), self._copy(value)] for key, value in self._values.items()]
+            }
+
+    def _copy(self, value):
+        return value
+
+
+class _Child:
+    def __init__(self, metric, key):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount=1.0):
+        self.metric._inc(self.key, amount)
+
+    def set(self, value):
+        self.metric._set(self.key, value)
+
+    def observe(self, value):
+        self.metric._observe(self.key, value)
+
+    def time(self):
+        return _timer(self.observe)
+
+
+@contextmanager
+def _timer(observe):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(time.perf_counter() - started)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0):
+        self._inc((), amount)
+
+    def _inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    """A value read at scrape time. Gauges stay in the process that sets them and are not published."""
+
+    kind = "gauge"
+
+    def set(self, value):
+        self._set((), value)
+
+    def _set(self, key, value):
+        with self._lock:
+            self._values[key] = float(value)
+
+    def reset(self):
+        """Zero every series seen so far, so ones that are not set again read 0 instead of vanishing."""
+        with self._lock:
+            self._values = {key: 0.0 for key in self._values}
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value):
+        self._observe((), value)
+
+    def time(self):
+        """Context manager observing the seconds its body takes."""
+        return _timer(self.observe)
+
+    def _observe(self, key, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum and count
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            state["counts"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        return snapshot
+
+    def _copy(self, value):
+        return {"counts": list(value["counts"]), "sum": value["sum"], "count": value["count"]}
+
+
+def snapshot(include_gauges=False):
+    """JSON-serialisable state of every metric in this process, keyed by name."""
+    with _registry_lock:
+        metrics = list(_registry)
+    return {
+        metric.name: metric.snapshot()
+        for metric in metrics if include_gauges or metric.kind != "gauge"
+    }
+
+
+def merge(snapshots):
+    """Add up snapshots from several processes. Counters and histograms are summed per series."""
+    merged = {}
+    for current in snapshots:
+        for name, metric in current.items():
+            target = merged.setdefault(name, {**metric, "values": []})
+            if target["kind"] != metric["kind"] or target.get("buckets") != metric.get("buckets"):
+                # Published by a process running an older definition of the metric
+                continue
+            series = {tuple(key): value for key, value in target["values"]}
+            for key, value in metric["values"]:
+                key = tuple(key)
+                if key not in series:
+                    series[key] = value if metric["kind"] != "histogram" else {
+                        "counts": list(value["counts"]), "sum": value["sum"], "count": value["count"]
+                    }
+                elif metric["kind"] == "histogram":
+                    series[key] = {
+                        "counts": [a + b for a, b in zip(series[key]["counts"], value["counts"])],
+                        "sum": series[key]["sum"] + value["sum"],
+                        "count": series[key]["count"] + value["count"]
+                    }
+                else:
+                    series[key] = series[key] + value
+            target["values"] = [[list(key), value] for key, value in series.items()]
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def render(metrics):
+    """Prometheus text exposition of merged snapshots."""
+    lines = []
+    for name, metric in sorted(metrics.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labelnames"]
+        for key, value in sorted(metric["values"], key=lambda item: item[0]):
+            if metric["kind"] == "histogram":
+                cumulative = 0
+                for bound, count in zip(metric["buckets"] + [float("inf")], value["counts"]):
+                    cumulative += count
+                    le = 'le="' + _number(bound) + '"'
+                    lines.append(f"{name}_bucket{_labels(names, key, le)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(names, key)} {_number(value['sum'])}")
+                lines.append(f"{name}_count{_labels(names, key)} {value['count']}")
+            else:
+                lines.append(f"{name}{_labels(names, key)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def instrument_sessions(session_factory):
+    """Observe DB_COMMIT_SECONDS for every commit of sessions made by `session_factory`."""
+
+    @event.listens_for(session_factory, "before_commit")
+    def commit_started(session):
+        session.info["commit_started"] = time.perf_counter()
+
+    @event.listens_for(session_factory, "after_commit")
+    def commit_finished(session):
+        started = session.info.pop("commit_started", None)
+        if started is not None:
+            DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+
+# Scraper
+FETCH_SECONDS = Histogram(
+    "scraper_fetch_duration_seconds", "Time of one HTTP request to a scraped site, per attempt",
+    ("host", "outcome"), FETCH_BUCKETS
+)
+FETCH_BYTES = Counter("scraper_fetch_bytes_total", "Response body bytes downloaded from scraped sites", ("host",))
+PARSE_SECONDS = Histogram("scraper_parse_duration_seconds", "Time to extract a listing or post page", ("kind",))
+SCRAPED_POSTS = Counter("scraper_posts_total", "Posts scraped, by status", ("status",))
+
+# Classification
+CLASSIFICATION_SECONDS = Histogram(
+    "classification_request_duration_seconds", "Time of one Messages API request, per attempt",
+    ("model", "outcome"), FETCH_BUCKETS
+)
+CLASSIFICATION_TOKENS = Counter("classification_tokens_total", "Tokens used by classification requests", ("model", "kind"))
+CLASSIFIED_POSTS = Counter(
+    "classification_posts_total", "Posts classified, by where the result came from (claude, cache or local)", ("source",)
+)
+
+# Database and jobs
+DB_COMMIT_SECONDS = Histogram("db_commit_duration_seconds", "Time of a session commit, including its flush")
+JOBS = Gauge("jobs", "Jobs in the queue by type and status (queued or running)", ("job_type", "status"))
+SCANS_IN_FLIGHT = Gauge("scans_in_flight", "Scans with status running")
+REPORTS_IN_FLIGHT = Gauge("reports_in_flight", "Classification reports with status running")
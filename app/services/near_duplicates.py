@@ -0,0 +1,204 @@
+import argparse
+import hashlib
+import os
+from datetime import datetime
+import numpy as np
+from sqlalchemy import func, update
+from ..models.database import SessionLocal, Post, PostCluster, ClusterBand
+
+# Estimated Jaccard similarity (of character shingles) above which posts are near-duplicates
+SIMILARITY_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.6"))
+# MinHash signature of NUM_PERM values, split into BANDS bands of ROWS values for LSH.
+# Posts with similarity s share a band with probability 1 - (1 - s^ROWS)^BANDS:
+# 0.99 at s=0.7, 0.64 at s=0.5, 0.04 at s=0.2.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Bytes per shingle; posts shorter than MIN_CHARS are not clustered
+SHINGLE_BYTES = 5
+MIN_CHARS = 40
+# Shingles hashed per numpy step, bounding memory on very long posts
+HASH_CHUNK = 4096
+
+# Fixed seed: signatures are stored and compared across processes and runs
+_random = np.random.default_rng(20250101)
+_MULTIPLIERS = _random.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_OFFSETS = _random.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+_SHIFTS = np.arange(SHINGLE_BYTES, dtype=np.uint64) * np.uint64(8)
+
+
+def shingles(text):
+    """Distinct 5-byte shingles of the lowercased, whitespace-collapsed text, as integers."""
+    data = np.frombuffer(" ".join((text or "").lower().split()).encode("utf-8"), dtype=np.uint8)
+    if len(data) < max(MIN_CHARS, SHINGLE_BYTES):
+        return None
+    windows = np.lib.stride_tricks.sliding_window_view(data, SHINGLE_BYTES).astype(np.uint64)
+    return np.unique((windows << _SHIFTS).sum(axis=1, dtype=np.uint64))
+
+
+def minhash(text):
+    """MinHash signature (NUM_PERM uint32 values) of `text`, or None if it is too short.
+
+    Each permutation is a multiply-shift hash of the shingle; the signature
+    keeps the minimum per permutation. The share of equal positions in two
+    signatures estimates the Jaccard similarity of their shingle sets.
+    """
+    values = shingles(text)
+    if values is None:
+        return None
+    signature = np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(values), HASH_CHUNK):
+        chunk = values[start:start + HASH_CHUNK, None]
+        # uint64 arithmetic wraps, which is what multiply-shift hashing wants
+        hashed = (chunk * _MULTIPLIERS + _OFFSETS) >> np.uint64(32)
+        np.minimum(signature, hashed.min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+
+def band_keys(signature):
+    """One signed 64-bit bucket key per LSH band, the band index mixed in."""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS].tobytes()
+        digest = hashlib.blake2b(bytes([band]) + rows, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+
+def find_cluster(db, signature):
+    """Most similar existing cluster at or above SIMILARITY_THRESHOLD, or None.
+
+    Candidates are the clusters sharing at least one band bucket, so only a
+    handful of signatures are compared instead of every cluster.
+    """
+    candidates = (
+        db.query(PostCluster.id, PostCluster.signature)
+        .join(ClusterBand, ClusterBand.cluster_id == PostCluster.id)
+        .filter(ClusterBand.key.in_(band_keys(signature)))
+        .distinct()
+    )
+    best = None
+    for cluster_id, cluster_signature in candidates:
+        score = similarity(signature, np.frombuffer(cluster_signature, dtype=np.uint32))
+        if score >= SIMILARITY_THRESHOLD and (best is None or score > best[1]):
+            best = (cluster_id, score)
+    return best[0] if best else None
+
+
+def create_cluster(db, signature, now):
+    cluster = PostCluster(signature=signature.tobytes(), size=0, first_seen=now, last_seen=now)
+    db.add(cluster)
+    db.flush()
+    db.add_all([ClusterBand(key=key, cluster_id=cluster.id) for key in band_keys(signature)])
+    # Later posts in the same batch must be able to find the new cluster
+    db.flush()
+    return cluster.id
+
+
+def assign_clusters(db, posts, now=None):
+    """Set 'cluster_id' on scraped post dicts, creating clusters as needed.
+
+    Posts without content (errors, unchanged posts of incremental scans, very
+    short posts) are left unclustered. The caller commits.
+
+    Args:
+        db (Session): Database session
+        posts (list): Post dicts with plain-text content
+        now (datetime, optional): Time recorded as the clusters' last_seen
+    """
+    now = now or datetime.utcnow()
+    sizes = {}
+    for post in posts:
+        post["cluster_id"] = None
+        if post.get("status") in ("error", "unchanged"):
+            continue
+        signature = minhash(post.get("content"))
+        if signature is None:
+            continue
+        cluster_id = find_cluster(db, signature) or create_cluster(db, signature, now)
+        post["cluster_id"] = cluster_id
+        sizes[cluster_id] = sizes.get(cluster_id, 0) + 1
+    for cluster_id, count in sizes.items():
+        db.query(PostCluster).filter(PostCluster.id == cluster_id).update(
+            {PostCluster.size: PostCluster.size + count, PostCluster.last_seen: now},
+            synchronize_session=False
+        )
+
+
+def release_scan_posts(db, scan_id):
+    """Take a scan's posts out of their clusters' sizes before the posts are deleted."""
+    counts = (
+        db.query(Post.cluster_id, func.count(Post.id))
+        .filter(Post.scan_id == scan_id, Post.cluster_id.isnot(None))
+        .group_by(Post.cluster_id)
+        .all()
+    )
+    for cluster_id, count in counts:
+        db.query(PostCluster).filter(PostCluster.id == cluster_id).update(
+            {PostCluster.size: PostCluster.size - count},
+            synchronize_session=False
+        )
+
+
+def cluster_representatives(db, cluster_ids):
+    """Content of the first post of each cluster, keyed by cluster id.
+
+    Classifying this one text per cluster gives every member the same
+    result, also across scans, since the classification cache is keyed by
+    content.
+    """
+    cluster_ids = list(set(cluster_ids))
+    if not cluster_ids:
+        return {}
+    first_posts = (
+        db.query(func.min(Post.id))
+        .filter(Post.cluster_id.in_(cluster_ids))
+        .group_by(Post.cluster_id)
+        .scalar_subquery()
+    )
+    return dict(db.query(Post.cluster_id, Post.content).filter(Post.id.in_(first_posts)))
+
+
+def backfill_clusters(chunk_size=500):
+    """Cluster posts stored before near-duplicate detection existed.
+
+    Returns:
+        int: Number of posts assigned to a cluster
+    """
+    assigned = 0
+    last_id = 0
+    with SessionLocal() as db:
+        while True:
+            rows = (
+                db.query(Post.id, Post.content, Post.status)
+                .filter(Post.id > last_id, Post.cluster_id.is_(None))
+                .order_by(Post.id)
+                .limit(chunk_size)
+                .all()
+            )
+            if not rows:
+                return assigned
+            last_id = rows[-1].id
+            posts = [{"id": row.id, "content": row.content, "status": row.status} for row in rows]
+            assign_clusters(db, posts)
+            updates = [
+                {"id": post["id"], "cluster_id": post["cluster_id"]}
+                for post in posts if post["cluster_id"] is not None
+            ]
+            if updates:
+                db.execute(update(Post), updates)
+            db.commit()
+            assigned += len(updates)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Near-duplicate post clustering")
+    parser.add_argument("command", choices=["backfill"])
+    args = parser.parse_args()
+
+    print(f"Clustered {backfill_clusters()} posts")
@@ -0,0 +1,327 @@
+import copy
+import functools
+import logging
+import os
+import re
+import soupsieve
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from lxml import html as lxml_html
+    from lxml.cssselect import CSSSelector
+    from lxml.etree import ParserError
+except ImportError:  # lxml and cssselect are optional
+    lxml_html = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:  # selectolax is optional
+    SelectolaxParser = None
+
+logger = logging.getLogger(__name__)
+
+# Parser backend used when none is given: "auto", "selectolax", "lxml" or "html.parser"
+DEFAULT_PARSER = os.getenv("SCRAPER_PARSER", "auto")
+
+# Declarative extraction rules for a marketplace. Every entry is a CSS selector:
+#   listing.table   the table holding the post rows
+#   listing.row     rows inside that table
+#   listing.cell    cells inside a row; rows without exactly len(fields) cells are skipped
+#   listing.fields  names of the cells in order; "title" is required
+#   listing.link    element inside the title cell whose href is the post link
+#   pagination      candidate pagination links anywhere on a listing page
+#   post.content    element whose text is the post content (first match)
+DEFAULT_RULES = {
+    "listing": {
+        "table": "table.table",
+        "row": "tr",
+        "cell": "td",
+        "fields": ["title", "category", "date"],
+        "link": "a[href]"
+    },
+    "pagination": "a[href], link[href]",
+    "post": {
+        "content": "div.post-content div.content p"
+    }
+}
+
+_SIMPLE_SELECTOR = re.compile(r"^([a-zA-Z][\w-]*)?((?:\.[\w-]+)*)")
+
+
+class CompiledSelector:
+    """A CSS selector compiled once for each backend that can reuse a compiled form.
+
+    soupsieve.compile also validates the selector, so a bad one fails when
+    the rules are compiled rather than mid-crawl. The lxml form is built on
+    first use. selectolax takes selector text on every call, so it uses `text`.
+    """
+
+    def __init__(self, selector):
+        self.text = selector
+        self.soup = soupsieve.compile(selector)
+        self._lxml = None
+
+    @property
+    def lxml(self):
+        if self._lxml is None:
+            self._lxml = CSSSelector(self.text)
+        return self._lxml
+
+    def __str__(self):
+        return self.text
+
+
+def compile_rules(rules):
+    """Copy of `rules` (see DEFAULT_RULES) with every selector replaced by a CompiledSelector."""
+    compiled = copy.deepcopy(rules)
+    listing = compiled["listing"]
+    for key in ("table", "row", "cell", "link"):
+        listing[key] = CompiledSelector(listing[key])
+    compiled["pagination"] = CompiledSelector(compiled["pagination"])
+    compiled["post"]["content"] = CompiledSelector(compiled["post"]["content"])
+    return compiled
+
+
+DEFAULT_COMPILED_RULES = compile_rules(DEFAULT_RULES)
+
+
+def _compiled_rules(rules):
+    if rules is None or rules is DEFAULT_RULES:
+        return DEFAULT_COMPILED_RULES
+    if isinstance(rules["pagination"], CompiledSelector):
+        return rules
+    return compile_rules(rules)
+
+
+@functools.lru_cache(maxsize=None)
+def _compiled_selector(selector):
+    """CompiledSelector for selector text passed straight to a node."""
+    return CompiledSelector(selector)
+
+
+def _as_compiled(selector):
+    return selector if isinstance(selector, CompiledSelector) else _compiled_selector(selector)
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_strainer(selectors):
+    return _strainer(selectors)
+
+
+def _strainer(selectors):
+    """SoupStrainer keeping only the outermost element of each selector.
+
+    Only the leading `tag.class` part of a selector is used, so the strained
+    tree always contains what the full selector matches. Returns None if a
+    selector can't be reduced that way, meaning the whole page is parsed.
+    """
+    names = set()
+    classes = set()
+    for selector in selectors:
+        for part in selector.split(","):
+            match = _SIMPLE_SELECTOR.match(part.strip().split(" ")[0])
+            if not match or not match.group(1):
+                return None
+            names.add(match.group(1).lower())
+            if match.group(2):
+                classes.update(match.group(2).strip(".").split("."))
+            else:
+                # A bare tag matches regardless of class
+                classes.add(None)
+    if None in classes:
+        return SoupStrainer(list(names))
+    if len(classes) == 1:
+        return SoupStrainer(list(names), class_=classes.pop())
+    return SoupStrainer(list(names), class_=lambda value: value in classes)
+
+
+class SoupNode:
+    def __init__(self, element):
+        self.element = element
+
+    @property
+    def tag(self):
+        return self.element.name
+
+    def text(self):
+        return self.element.get_text()
+
+    def attr(self, name):
+        value = self.element.get(name)
+        if isinstance(value, list):
+            return " ".join(value)
+        return value
+
+    def select(self, selector):
+        return [SoupNode(element) for element in _as_compiled(selector).soup.select(self.element)]
+
+    def select_one(self, selector):
+        element = _as_compiled(selector).soup.select_one(self.element)
+        return SoupNode(element) if element is not None else None
+
+
+class LxmlNode:
+    def __init__(self, element):
+        self.element = element
+
+    @property
+    def tag(self):
+        return self.element.tag
+
+    def text(self):
+        return self.element.text_content()
+
+    def attr(self, name):
+        return self.element.get(name)
+
+    def select(self, selector):
+        return [LxmlNode(element) for element in _as_compiled(selector).lxml(self.element)]
+
+    def select_one(self, selector):
+        matches = _as_compiled(selector).lxml(self.element)
+        return LxmlNode(matches[0]) if matches else None
+
+
+class SelectolaxNode:
+    def __init__(self, element):
+        self.element = element
+
+    @property
+    def tag(self):
+        return self.element.tag
+
+    def text(self):
+        return self.element.text(deep=True)
+
+    def attr(self, name):
+        return self.element.attributes.get(name)
+
+    def select(self, selector):
+        return [SelectolaxNode(element) for element in self.element.css(str(selector))]
+
+    def select_one(self, selector):
+        element = self.element.css_first(str(selector))
+        return SelectolaxNode(element) if element is not None else None
+
+
+class HtmlParserBackend:
+    """BeautifulSoup with the pure-Python html.parser, always available.
+
+    `only` selectors are turned into a SoupStrainer so elements outside them
+    are never built into the tree.
+    """
+    name = "html.parser"
+
+    def parse(self, html, only=None):
+        strainer = _cached_strainer(tuple(str(selector) for selector in only)) if only else None
+        return SoupNode(BeautifulSoup(html, "html.parser", parse_only=strainer))
+
+
+class LxmlBackend:
+    name = "lxml"
+
+    def parse(self, html, only=None):
+        try:
+            return LxmlNode(lxml_html.document_fromstring(html))
+        except ValueError:
+            # Pages starting with an XML declaration must be parsed as bytes
+            return LxmlNode(lxml_html.document_fromstring(html.encode("utf-8")))
+        except ParserError:
+            # Empty documents
+            return LxmlNode(lxml_html.document_fromstring("<html></html>"))
+
+
+class SelectolaxBackend:
+    name = "selectolax"
+
+    def parse(self, html, only=None):
+        return SelectolaxNode(SelectolaxParser(html).root or SelectolaxParser("<html></html>").root)
+
+
+BACKENDS = {
+    "html.parser": HtmlParserBackend,
+    "lxml": LxmlBackend,
+    "selectolax": SelectolaxBackend,
+}
+
+
+def available_backends():
+    """Names of the backends whose libraries are installed, fastest first."""
+    names = []
+    if SelectolaxParser is not None:
+        names.append("selectolax")
+    if lxml_html is not None:
+        names.append("lxml")
+    names.append("html.parser")
+    return names
+
+
+def get_backend(name=None):
+    """Return a parser backend by name.
+
+    "auto" picks the fastest installed backend. A backend whose library is
+    missing falls back to html.parser.
+    """
+    name = name or DEFAULT_PARSER
+    if name == "auto":
+        name = available_backends()[0]
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown parser backend: {name}")
+    if name not in available_backends():
+        logger.warning("Parser backend is not installed, using html.parser", extra={"backend": name})
+        name = "html.parser"
+    return BACKENDS[name]()
+
+
+def extract_post_content(html, rules=None, backend=None):
+    """Return the stripped text of the first post.content match, or '' if there is none.
+
+    `rules` may be plain or from compile_rules(); plain rules other than
+    DEFAULT_RULES are compiled on every call.
+    """
+    rules = _compiled_rules(rules)
+    backend = backend or get_backend()
+    selector = rules["post"]["content"]
+    node = backend.parse(html, only=[selector]).select_one(selector)
+    return node.text().strip() if node is not None else ''
+
+
+def extract_listing(html, rules=None, backend=None):
+    """Extract raw rows and pagination candidates from a listing page.
+
+    Returns:
+        tuple: (rows or None if there is no listing table, links) where rows
+            are dicts of the listing fields plus 'href', and links are
+            (tag, href, rel, text, class) tuples
+    """
+    rules = _compiled_rules(rules)
+    backend = backend or get_backend()
+    listing = rules["listing"]
+    document = backend.parse(html, only=[listing["table"], rules["pagination"]])
+
+    links = []
+    for node in document.select(rules["pagination"]):
+        href = node.attr("href")
+        if not href:
+            continue
+        text = node.text().strip() if node.tag == "a" else ""
+        links.append((node.tag, href, node.attr("rel") or "", text, node.attr("class") or ""))
+
+    table = document.select_one(listing["table"])
+    if table is None:
+        return None, links
+
+    rows = []
+    fields = listing["fields"]
+    for row in table.select(listing["row"]):
+        cells = row.select(listing["cell"])
+        if len(cells) != len(fields):
+            continue
+        title_cell = cells[fields.index("title")]
+        anchor = title_cell.select_one(listing["link"])
+        if anchor is None or not anchor.attr("href"):
+            continue
+        entry = {field: cell.text().strip() for field, cell in zip(fields, cells)}
+        entry["href"] = anchor.attr("href")
+        rows.append(entry)
+    return rows, links
@@ -0,0 +1,222 @@
+import logging
+import os
+import random
+import secrets
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, urlunparse
+from .http_pool import get_session, drop_sessions
+
+logger = logging.getLogger(__name__)
+
+# Isolated circuits opened per SOCKS endpoint
+CIRCUITS_PER_PROXY = int(os.getenv("TOR_CIRCUITS_PER_PROXY", "2"))
+# Consecutive failures before a circuit is replaced
+MAX_CIRCUIT_FAILURES = int(os.getenv("TOR_MAX_CIRCUIT_FAILURES", "3"))
+# A circuit this many times slower than the pool median is replaced
+SLOW_CIRCUIT_FACTOR = float(os.getenv("TOR_SLOW_CIRCUIT_FACTOR", "3"))
+# Seconds a replaced circuit is left out of selection while Tor builds the new one
+CIRCUIT_COOLDOWN = float(os.getenv("TOR_CIRCUIT_COOLDOWN", "10"))
+# Weight of the newest sample in the latency moving average
+LATENCY_EWMA_ALPHA = 0.3
+# Samples needed before a circuit can be judged slow
+MIN_LATENCY_SAMPLES = 5
+
+
+def split_proxies(value):
+    """Split a comma-separated proxy setting into a list of proxy URLs."""
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
+class Circuit:
+    """One isolated route through a SOCKS endpoint.
+
+    Tor's IsolateSOCKSAuth (on by default) builds a separate circuit for
+    every distinct SOCKS username/password, so fresh credentials mean a
+    fresh circuit. Non-SOCKS proxies are used as they are.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.rotations = 0
+        self._new_identity()
+
+    def _new_identity(self):
+        parsed = urlparse(self.endpoint)
+        if parsed.scheme.startswith("socks"):
+            credentials = f"scan-{secrets.token_hex(4)}:{secrets.token_hex(8)}"
+            # Keep the host:port text as written (no port, IPv6 brackets) and swap only the userinfo
+            host = parsed.netloc.rpartition("@")[2]
+            self.url = urlunparse(parsed._replace(netloc=f"{credentials}@{host}"))
+        else:
+            self.url = self.endpoint
+        self.latency = None  # Moving average of request latency in seconds
+        self.samples = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.down_until = 0.0
+
+    @property
+    def proxies(self):
+        return {"http": self.url, "https": self.url}
+
+    def score(self):
+        """Expected wait on this circuit; unmeasured circuits are tried first."""
+        return (self.latency or 0.0) * (1 + self.in_flight)
+
+    def rotate(self):
+        retired = self.url
+        self.rotations += 1
+        self._new_identity()
+        if retired != self.url:
+            drop_sessions(retired)
+        self.down_until = time.monotonic() + CIRCUIT_COOLDOWN
+
+    def to_dict(self):
+        return {
+            "endpoint": self.endpoint,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "samples": self.samples,
+            "failures": self.failures,
+            "rotations": self.rotations,
+            "in_flight": self.in_flight
+        }
+
+
+class ProxyPool:
+    """Latency-aware pool of isolated circuits over one or more SOCKS endpoints.
+
+    Requests go to the better of two randomly sampled circuits (lower moving
+    average latency times in-flight requests), which spreads load without
+    piling onto a single "fastest" circuit. Circuits that fail repeatedly or
+    run much slower than the rest of the pool get new credentials, and so a
+    new Tor circuit.
+
+    Args:
+        endpoints (list): Proxy URLs, e.g. socks5h://127.0.0.1:9050
+        circuits_per_proxy (int, optional): Isolated circuits per endpoint
+    """
+
+    def __init__(self, endpoints, circuits_per_proxy=CIRCUITS_PER_PROXY):
+        self.circuits = [
+            Circuit(endpoint)
+            for endpoint in dict.fromkeys(endpoints)
+            for _ in range(max(1, int(circuits_per_proxy)))
+        ]
+        if not self.circuits:
+            raise ValueError("A proxy pool needs at least one endpoint")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_proxies(cls, proxies, circuits_per_proxy=CIRCUITS_PER_PROXY):
+        """Build a pool from a requests-style proxies dict whose values may list several proxies.
+
+        The http and https values are merged into one set of endpoints, and
+        every circuit carries both schemes: a SOCKS endpoint tunnels either,
+        and onion markets are fetched over both. Configure the same proxies
+        for both schemes, since a proxy listed under one is also used for the other.
+
+        Returns None when no proxy is configured.
+        """
+        endpoints = []
+        for value in (proxies or {}).values():
+            endpoints.extend(split_proxies(value))
+        return cls(endpoints, circuits_per_proxy) if endpoints else None
+
+    def acquire(self):
+        """Pick a circuit for one request. Pair with release()."""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [circuit for circuit in self.circuits if circuit.down_until <= now] or self.circuits
+            if len(candidates) > 1:
+                first, second = random.sample(candidates, 2)
+                circuit = first if first.score() <= second.score() else second
+            else:
+                circuit = candidates[0]
+            circuit.in_flight += 1
+            return circuit
+
+    def release(self, circuit, latency, ok=True):
+        """Record the outcome of a request made through `circuit`."""
+        with self._lock:
+            circuit.in_flight = max(0, circuit.in_flight - 1)
+            if not ok:
+                circuit.failures += 1
+                if circuit.failures >= MAX_CIRCUIT_FAILURES:
+                    logger.info("Replacing failing circuit", extra={"endpoint": circuit.endpoint})
+                    circuit.rotate()
+                return
+            circuit.failures = 0
+            circuit.samples += 1
+            if circuit.latency is None:
+                circuit.latency = latency
+            else:
+                circuit.latency += LATENCY_EWMA_ALPHA * (latency - circuit.latency)
+            if circuit.samples >= MIN_LATENCY_SAMPLES and self._is_slow(circuit):
+                logger.info("Replacing slow circuit", extra={"endpoint": circuit.endpoint, "latency": round(circuit.latency, 2)})
+                circuit.rotate()
+
+    def _is_slow(self, circuit):
+        measured = [c.latency for c in self.circuits if c.latency is not None and c.samples >= MIN_LATENCY_SAMPLES]
+        if len(measured) < 2:
+            return False
+        return circuit.latency > SLOW_CIRCUIT_FACTOR * statistics.median(measured)
+
+    def get(self, url, **kwargs):
+        """GET `url` through a pooled circuit, recording latency and failures."""
+        circuit = self.acquire()
+        started = time.perf_counter()
+        try:
+            response = get_session(url, circuit.proxies).get(url, proxies=circuit.proxies, **kwargs)
+        except Exception:
+            self.release(circuit, time.perf_counter() - started, ok=False)
+            raise
+        # 5xx and 429 usually mean the exit or the route is struggling, not the page
+        self.release(circuit, time.perf_counter() - started, ok=response.status_code < 500 and response.status_code != 429)
+        return response
+
+    def check_health(self, url, timeout=20, headers=None):
+        """Probe every circuit with a HEAD request to `url` in parallel.
+
+        Circuits that fail, answer 5xx or are rate limited (429) are replaced.
+
+        Returns:
+            int: Number of healthy circuits
+        """
+        def probe(circuit):
+            started = time.perf_counter()
+            try:
+                response = get_session(url, circuit.proxies).head(url, proxies=circuit.proxies, headers=headers, timeout=timeout)
+                # Same rule as get(): a 429 means this circuit is being rate limited
+                healthy = response.status_code < 500 and response.status_code != 429
+            except Exception as e:
+                logger.warning("Circuit health check failed", extra={"endpoint": circuit.endpoint, "error": str(e)})
+                healthy = False
+            with self._lock:
+                if healthy:
+                    circuit.latency = time.perf_counter() - started
+                    circuit.failures = 0
+                else:
+                    circuit.rotate()
+            return healthy
+
+        with ThreadPoolExecutor(max_workers=len(self.circuits)) as executor:
+            return sum(executor.map(probe, list(self.circuits)))
+
+    def stats(self):
+        with self._lock:
+            return [circuit.to_dict() for circuit in self.circuits]
+
+    def close(self):
+        """Close the pooled sessions of this pool's isolated circuits.
+
+        Their credentials are never reused, so the sessions would otherwise
+        stay in http_pool for the life of the process. Sessions of plain
+        proxies are shared with other scans and are kept.
+        """
+        with self._lock:
+            urls = [circuit.url for circuit in self.circuits if circuit.url != circuit.endpoint]
+        for url in urls:
+            drop_sessions(url)
@@ -1,81 +1,221 @@
-import requests
-from bs4 import BeautifulSoup
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import base64
+import hashlib
 import json
+import logging
+from .http_pool import get_session
+from .crawler import ListingCrawler
+from .host_limiter import HostLimiter
+from .parsers import extract_post_content
+from .proxy_pool import ProxyPool, CIRCUITS_PER_PROXY
+from .metrics import PARSE_SECONDS, SCRAPED_POSTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_PER_HOST = 4
+
+
+def http_get(url, proxies, headers, timeout, pool=None):
+    """GET through a circuit of `pool` when given, otherwise through `proxies`."""
+    if pool is not None:
+        return pool.get(url, headers=headers, timeout=timeout)
+    return get_session(url, proxies).get(url, proxies=proxies, headers=headers, timeout=timeout)
+
+
+def fetch_post_content(link, proxies, headers, timeout, limiter=None, known=None, rules=None, backend=None, pool=None):
+    """Fetch a single post page and extract its content.
+
+    When `known` holds the validators and hash from a previous scan, the
+    request is made conditional and an unchanged post comes back with
+    empty content.
+
+    Args:
+        link (str): Absolute URL of the post
+        proxies (dict): Proxy configuration for HTTP/HTTPS
+        headers (dict): HTTP headers for the request
+        timeout (int): Request timeout in seconds
+        limiter (HostLimiter, optional): Per-host adaptive limiter, retries and circuit breaker
+        known (dict, optional): content_hash, etag and last_modified from the post index
+        rules (dict, optional): Extraction rules, see parsers.DEFAULT_RULES, or compile_rules() output
+        backend (optional): Parser backend from parsers.get_backend()
+        pool (ProxyPool, optional): Circuit pool to spread requests over instead of `proxies`
+
+    Returns:
+        dict: content (plain text), status ('new', 'changed', 'unchanged' or 'error'),
+            content_hash, etag and last_modified
+    """
+    result = {
+        'content': '',
+        'status': 'changed' if known else 'new',
+        'content_hash': None,
+        'etag': None,
+        'last_modified': None
+    }
+    request_headers = dict(headers)
+    if known:
+        if known.get('etag'):
+            request_headers['If-None-Match'] = known['etag']
+        if known.get('last_modified'):
+            request_headers['If-Modified-Since'] = known['last_modified']
+    try:
+        logger.debug("Fetching post", extra={"url": link})
+        if limiter is not None:
+            post_response = limiter.request(link, lambda: http_get(link, proxies, request_headers, timeout, pool))
+        else:
+            post_response = http_get(link, proxies, request_headers, timeout, pool)
+        if known and post_response.status_code == 304:
+            result.update({
+                'status': 'unchanged',
+                'content_hash': known.get('content_hash'),
+                'etag': known.get('etag'),
+                'last_modified': known.get('last_modified')
+            })
+            return result
+        post_response.raise_for_status()
+        result['etag'] = post_response.headers.get('ETag')
+        result['last_modified'] = post_response.headers.get('Last-Modified')
+        with PARSE_SECONDS.labels("post").time():
+            content = extract_post_content(post_response.text, rules, backend)
+        result['content_hash'] = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        if known and known.get('content_hash') == result['content_hash']:
+            result['status'] = 'unchanged'
+        else:
+            result['content'] = content
+    except Exception as e:
+        logger.warning("Failed to fetch post", extra={"url": link, "error": str(e)})
+        result['status'] = 'error'
+        result['content'] = '{"message": "Error fetching content"}'
+    SCRAPED_POSTS.labels(result['status']).inc()
+    return result
+
+
+def iter_posts(onion_url, proxies, headers=None, timeout=30, concurrency=DEFAULT_CONCURRENCY, max_per_host=DEFAULT_MAX_PER_HOST, max_pages=1, max_depth=1, known_posts=None, stats=None, profile=None, parser=None, circuits_per_proxy=CIRCUITS_PER_PROXY):
+    """Scrape posts from a darknet marketplace, yielding each post as soon as it is fetched.
+
+    Listing pages are crawled while post pages are already being fetched.
+    At most 2 * concurrency posts are held in flight, so memory stays flat
+    regardless of how many posts the site has.
 
-def scrape_posts(onion_url, proxies, headers=None, timeout=30):
-    """Scrape posts from a darknet marketplace and return base64-encoded JSON.
-    
     Args:
         onion_url (str): The onion URL to scrape
         proxies (dict): Proxy configuration for HTTP/HTTPS
         headers (dict, optional): HTTP headers for the request
         timeout (int, optional): Request timeout in seconds. Defaults to 30
-    
-    Returns:
-        str: Base64-encoded JSON string of scraped posts
+        concurrency (int, optional): Number of worker threads fetching post pages. Defaults to 4
+        max_per_host (int, optional): Max in-flight requests per onion host. Defaults to 4.
+            The limit adapts below this when a host throttles or fails, and
+            requests to a host that keeps failing fail fast.
+        max_pages (int, optional): Max listing pages to crawl. Defaults to 1
+        max_depth (int, optional): Max pagination hops from onion_url. Defaults to 1
+        known_posts (dict, optional): Post index of a previous scan keyed by link.
+            When given, posts are fetched with conditional requests and only new
+            or changed posts carry content.
+        stats (dict, optional): Updated in place with pages_fetched, errors, hosts
+            (per-host request stats) and circuits (Tor circuit stats)
+        profile (SiteProfile, optional): Extraction profile. Defaults to the
+            profile matching the onion_url hostname
+        parser (str, optional): Parser backend name. Defaults to SCRAPER_PARSER
+        circuits_per_proxy (int, optional): Isolated Tor circuits opened per proxy.
+            Proxy values may list several comma-separated SOCKS endpoints; all
+            fetches are spread over their circuits.
+
+    Yields:
+        dict: Post (title, category, date, link, content, status, content_hash,
+            etag, last_modified) in listing order, with plain-text content
     """
     if headers is None:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
+    if stats is None:
+        stats = {}
+    stats.setdefault('pages_fetched', 0)
+    stats.setdefault('errors', 0)
 
+    pool = ProxyPool.from_proxies(proxies, circuits_per_proxy)
     try:
-        response = requests.get(onion_url, proxies=proxies, headers=headers, timeout=timeout)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        table = soup.find('table', class_='table')
-        if not table:
-            raise ValueError("Table not found in HTML")
-        
-        # Extract base URL (e.g., http://ft4uneyq3hu3txsmw6rnzrzrgxcbddze3hukj3kef6pvtlaycu6f7jid.onion)
-        base_url = onion_url.split('/marketplace')[0]
-        
-        posts = []
-        for row in table.find('tbody').find_all('tr'):
-            cells = row.find_all('td')
-            if len(cells) != 3:
-                continue
-            title_cell = cells[0]
-            title = title_cell.text.strip()
-            link = title_cell.find('a')['href']
-            if link.startswith('/'):
-                link = base_url.rstrip('/') + link
-            category = cells[1].text.strip()
-            date_str = cells[2].text.strip()
-            
-            # Fetch post content from the link
-            content_b64 = ''
-            try:
-                print(f"Fetching content from: {link}")
-                post_response = requests.get(link, proxies=proxies, headers=headers, timeout=timeout)
-                post_response.raise_for_status()
-                post_soup = BeautifulSoup(post_response.text, 'html.parser')
-                post_content_div = post_soup.find('div', class_='post-content')
-                if post_content_div:
-                    content_div = post_content_div.find('div', class_='content')
-                    if content_div:
-                        content_p = content_div.find('p') # Get first <p> tag
-                        if content_p:
-                            content = content_p.text.strip()
-                            content_b64 = base64.b64encode(content.encode('utf-8')).decode('utf-8')
-            except Exception as e:
-                print(f"Failed to fetch content for post {link}: {str(e)}")
-                content_b64 = base64.b64encode('{"message": "Error fetching content"}'.encode('utf-8')).decode('utf-8')
-            
-            posts.append({
-                'title': title,
-                'category': category,
-                'date': date_str,
-                'link': link,
-                'content': content_b64 # Base64-encoded post content
-            })
-        
-        posts_json = json.dumps({'posts': posts})
-        return base64.b64encode(posts_json.encode('utf-8')).decode('utf-8')
-    
-    except Exception as e:
-        raise e
+        if pool is not None and len(pool.circuits) > 1:
+            # Builds every circuit up front and swaps out the ones that can't reach the site
+            healthy = pool.check_health(onion_url, timeout=timeout, headers=headers)
+            logger.info("Circuits checked", extra={"url": onion_url, "healthy": healthy, "circuits": len(pool.circuits)})
+
+        limiter = HostLimiter(max_per_host)
+        crawler = ListingCrawler(
+            onion_url,
+            proxies,
+            pool=pool,
+            limiter=limiter,
+            headers=headers,
+            timeout=timeout,
+            max_pages=max_pages,
+            max_depth=max_depth,
+            concurrency=min(concurrency, max_per_host),
+            profile=profile,
+            parser=parser
+        )
+        rules = crawler.rules
+        backend = crawler.backend
+        known_posts = known_posts or {}
+        workers = max(1, int(concurrency))
+        window = workers * 2
+
+        def finish(post, future):
+            post.update(future.result())
+            stats['pages_fetched'] = crawler.pages_fetched
+            stats['hosts'] = limiter.stats()
+            if post['status'] == 'error':
+                stats['errors'] += 1
+            return post
+
+        # Futures are consumed in submission order, which keeps the listing order
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for row in crawler.crawl():
+                future = executor.submit(
+                    fetch_post_content, row['link'], proxies, headers, timeout, limiter, known_posts.get(row['link']), rules, backend, pool
+                )
+                in_flight.append((row, future))
+                while len(in_flight) >= window:
+                    yield finish(*in_flight.popleft())
+            while in_flight:
+                yield finish(*in_flight.popleft())
+        stats['pages_fetched'] = crawler.pages_fetched
+        stats['hosts'] = limiter.stats()
+        if pool is not None:
+            stats['circuits'] = pool.stats()
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def collect_posts(onion_url, proxies, **options):
+    """Scrape posts from a darknet marketplace into a list.
+
+    Takes the same options as iter_posts.
+
+    Returns:
+        list: Post dicts in listing order, with plain-text content
+    """
+    return list(iter_posts(onion_url, proxies, **options))
+
+
+def scrape_posts(onion_url, proxies, **options):
+    """Scrape posts from a darknet marketplace and return base64-encoded JSON.
+
+    Takes the same options as iter_posts. Each post's content is
+    base64-encoded inside the JSON, as stored in Scan.result by earlier
+    versions.
+
+    Returns:
+        str: Base64-encoded JSON string of scraped posts
+    """
+    posts = collect_posts(onion_url, proxies, **options)
+    for post in posts:
+        post['content'] = base64.b64encode(post['content'].encode('utf-8')).decode('utf-8')
+    posts_json = json.dumps({'posts': posts})
+    return base64.b64encode(posts_json.encode('utf-8')).decode('utf-8')
 
 if __name__ == "__main__":
     proxies = {
@@ -0,0 +1,130 @@
+import re
+from sqlalchemy import and_, column, exists, func, literal_column, or_, table
+from ..models.database import FTS_TABLE, Classification, Post, Scan, search_supported
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+# Tokens around the best match in a content snippet
+SNIPPET_TOKENS = 16
+# bm25 weights of the title, category and content columns
+BM25_WEIGHTS = (5.0, 2.0, 1.0)
+
+_TERM = re.compile(r"\w+")
+_fts = table(FTS_TABLE, column("rowid"))
+_fts_name = literal_column(FTS_TABLE)
+
+
+def match_expression(query: str, raw: bool = False) -> str:
+    """FTS5 MATCH expression for a search box query.
+
+    Every word must match (implicit AND), and punctuation is ignored, so
+    input never trips FTS5 syntax. With `raw` the query is passed through,
+    allowing OR, NOT, NEAR, "exact phrases" and prefix* terms.
+    """
+    if raw:
+        return query
+    return " ".join(f'"{term}"' for term in _TERM.findall(query))
+
+
+def _filters(label, market, since, until):
+    filters = []
+    if label:
+        filters.append(exists().where(Classification.post_id == Post.id, Classification.label == label))
+    if market:
+        filters.append(Scan.onion_url.contains(market))
+    if since:
+        filters.append(Scan.timestamp >= since)
+    if until:
+        filters.append(Scan.timestamp < until)
+    return filters
+
+
+def search_posts(db, query: str, label=None, market=None, since=None, until=None, offset=0, limit=20, raw=False):
+    """Full-text search over the title, category and content of scraped posts.
+
+    Results are ranked by bm25 and carry the title and a content snippet with
+    matches wrapped in <mark> tags. Only posts of completed scans are indexed.
+
+    Args:
+        db (Session): Database session
+        query (str): Words to search for
+        label (str, optional): Only posts classified with this label in any report
+        market (str, optional): Only posts from scans whose onion URL contains this
+        since (datetime, optional): Only posts from scans started at or after this time
+        until (datetime, optional): Only posts from scans started before this time
+        offset (int, optional): Results to skip
+        limit (int, optional): Results to return
+        raw (bool, optional): Treat `query` as FTS5 query syntax
+
+    Returns:
+        tuple: (total matches, list of result dicts)
+    """
+    expression = match_expression(query, raw)
+    if not expression:
+        return 0, []
+    filters = _filters(label, market, since, until)
+    if not search_supported(db.get_bind()):
+        return _search_like(db, query, filters, offset, limit)
+
+    matched = and_(_fts_name.op("MATCH")(expression), *filters)
+    total = (
+        db.query(func.count(Post.id))
+        .select_from(_fts)
+        .join(Post, Post.id == _fts.c.rowid)
+        .join(Scan, Scan.id == Post.scan_id)
+        .filter(matched)
+        .scalar()
+    )
+    rank = func.bm25(_fts_name, *BM25_WEIGHTS)
+    rows = (
+        db.query(
+            Post.id, Post.scan_id, Post.link, Post.date, Post.category, Scan.onion_url, Scan.timestamp,
+            func.highlight(_fts_name, 0, HIGHLIGHT_START, HIGHLIGHT_END).label("title"),
+            func.snippet(_fts_name, 2, HIGHLIGHT_START, HIGHLIGHT_END, "…", SNIPPET_TOKENS).label("snippet"),
+            rank.label("rank")
+        )
+        .select_from(_fts)
+        .join(Post, Post.id == _fts.c.rowid)
+        .join(Scan, Scan.id == Post.scan_id)
+        .filter(matched)
+        .order_by(rank)
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    return total, [_result(row, row.title, row.snippet, row.rank) for row in rows]
+
+
+def _search_like(db, query, filters, offset, limit):
+    """Unranked LIKE matching for databases without FTS5."""
+    terms = [or_(Post.title.ilike(f"%{term}%"), Post.content.ilike(f"%{term}%")) for term in _TERM.findall(query)]
+    base = db.query(Post.id).join(Scan, Scan.id == Post.scan_id).filter(*terms, *filters)
+    total = base.count()
+    rows = (
+        db.query(
+            Post.id, Post.scan_id, Post.link, Post.date, Post.category, Scan.onion_url, Scan.timestamp,
+            Post.title, func.substr(Post.content, 1, 200).label("snippet")
+        )
+        .join(Scan, Scan.id == Post.scan_id)
+        .filter(*terms, *filters)
+        .order_by(Post.id.desc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    return total, [_result(row, row.title, row.snippet, None) for row in rows]
+
+
+def _result(row, title, snippet, rank):
+    return {
+        "post_id": row.id,
+        "scan_id": row.scan_id,
+        "title": title,
+        "link": row.link,
+        "date": row.date,
+        "category": row.category,
+        "market": row.onion_url,
+        "scanned_at": row.timestamp.isoformat() if row.timestamp else None,
+        "snippet": snippet,
+        "rank": rank
+    }
@@ -0,0 +1,128 @@
+import copy
+import fnmatch
+import json
+import os
+import threading
+from urllib.parse import urlparse
+from .parsers import DEFAULT_RULES, compile_rules
+
+try:
+    import yaml
+except ImportError:  # PyYAML is optional; JSON profiles always work
+    yaml = None
+
+PROFILES_DIR = os.getenv(
+    "SITE_PROFILES_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "profiles")
+)
+
+_lock = threading.Lock()
+_profiles = None  # Loaded SiteProfile list, most specific first
+_by_host = {}  # Hostname -> SiteProfile resolved for it
+
+
+def _merge(base, override):
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class SiteProfile:
+    """Extraction rules for the marketplaces matching `hosts`.
+
+    Args:
+        name (str): Profile name
+        hosts (list): Hostnames or fnmatch patterns, e.g. "*.onion"
+        rules (dict): Overrides merged over parsers.DEFAULT_RULES
+        base_path (str, optional): Path prefix of listing URLs; '/'-relative
+            links resolve against the part of the start URL before it
+    """
+
+    def __init__(self, name, hosts, rules=None, base_path=None):
+        self.name = name
+        self.hosts = [host.lower() for host in hosts]
+        self.base_path = base_path
+        self.rules = _merge(DEFAULT_RULES, rules or {})
+        fields = self.rules["listing"]["fields"]
+        if "title" not in fields:
+            raise ValueError(f"Site profile {name}: listing.fields must include 'title'")
+        # Selectors are compiled once per profile; a selector that doesn't parse fails on load, not mid-crawl
+        self.compiled_rules = compile_rules(self.rules)
+
+    @classmethod
+    def from_dict(cls, data):
+        rules = {key: data[key] for key in ("listing", "pagination", "post") if key in data}
+        return cls(data["name"], data.get("hosts") or [], rules, data.get("base_path"))
+
+    def matches(self, host):
+        return any(fnmatch.fnmatchcase(host, pattern) for pattern in self.hosts)
+
+    def base_url(self, url):
+        """Site root for `url`, used to resolve '/'-relative links."""
+        if self.base_path and self.base_path in url:
+            return url.split(self.base_path)[0]
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}"
+
+    def to_dict(self):
+        return {"name": self.name, "hosts": self.hosts, "base_path": self.base_path, **self.rules}
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ValueError(f"PyYAML is needed to load {path}")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def load_profiles(directory=PROFILES_DIR):
+    """Load every .json (and .yaml/.yml with PyYAML) profile in `directory`.
+
+    Profiles with exact hostnames are tried before wildcard ones, so a
+    catch-all "*" profile only applies when nothing else matches.
+    """
+    profiles = []
+    if os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith((".json", ".yaml", ".yml")):
+                continue
+            profiles.append(SiteProfile.from_dict(_read(os.path.join(directory, filename))))
+    profiles.sort(key=lambda profile: all(any(ch in host for ch in "*?[") for host in profile.hosts))
+    return profiles
+
+
+def get_profiles():
+    global _profiles
+    with _lock:
+        if _profiles is None:
+            _profiles = load_profiles()
+        return _profiles
+
+
+def reload_profiles():
+    """Re-read the profile directory, e.g. after adding a market."""
+    global _profiles
+    with _lock:
+        _profiles = load_profiles()
+        _by_host.clear()
+
+
+def profile_for_url(url):
+    """Return the SiteProfile for the host of `url`, resolved once per host."""
+    host = (urlparse(url).hostname or "").lower()
+    profile = _by_host.get(host)
+    if profile is not None:
+        return profile
+    profiles = get_profiles()
+    profile = next((candidate for candidate in profiles if candidate.matches(host)), None)
+    if profile is None:
+        profile = SiteProfile("default", ["*"], base_path="/marketplace")
+    with _lock:
+        _by_host[host] = profile
+    return profile
@@ -0,0 +1,216 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from .log_config import configure_logging
+from .models.database import engine, Base, SessionLocal, Scan, AIReport, upgrade_schema, publish_metric_snapshot
+from .routers.scans_router import run_scan, fail_scan
+from .routers.claude_router import run_classification, fail_report
+from .routers.schedules_router import run_scheduled_scan, fire_due_schedules
+from .services.http_pool import close_sessions
+from .services import job_queue, metrics
+
+logger = logging.getLogger(__name__)
+
+# Job type -> (handler, called with the payload and error once all attempts are used up)
+JOB_HANDLERS = {
+    "scan": (run_scan, lambda payload, error: fail_scan(payload["scan_id"], error)),
+    "scheduled_scan": (run_scheduled_scan, lambda payload, error: fail_scan(payload["scan_id"], error)),
+    "classification": (run_classification, lambda payload, error: fail_report(payload["report_id"], error)),
+}
+
+# Job types that share one concurrency limit; manual and scheduled scans both hold a Tor crawl
+LIMIT_GROUPS = {"scan": ("scan", "scheduled_scan"), "classification": ("classification",)}
+
+# Default cap on jobs of each group running at once, across all worker processes.
+# Scans default to one less than the worker processes, so a classification can always start.
+DEFAULT_LIMITS = {"scan": None, "classification": 2}
+
+# Seconds between checks for due schedules and expired leases
+SCHEDULER_TICK_SECONDS = float(os.getenv("SCHEDULER_TICK_SECONDS", "15"))
+
+
+def fail_expired_job(job_type: str, payload: dict, error: str):
+    """Mark the scan or report of a job whose lease expired on its last attempt as failed."""
+    JOB_HANDLERS[job_type][1](payload, error)
+
+
+def run_job(job, worker_id: str):
+    """Run one leased job, heartbeating its lease until the handler returns.
+
+    If a heartbeat finds the lease gone, the handler is told through
+    `lease_lost` and stops before its next commit.
+    """
+    handler, on_failure = JOB_HANDLERS[job.job_type]
+    payload = json.loads(job.payload)
+    stop = threading.Event()
+    lease_lost = threading.Event()
+
+    def beat():
+        while not stop.wait(job_queue.LEASE_SECONDS / 3):
+            if not job_queue.heartbeat(job.id, worker_id):
+                logger.warning("Worker lost the lease on its job", extra={"worker_id": worker_id, "job_id": job.id})
+                lease_lost.set()
+                return
+
+    heartbeat_thread = threading.Thread(target=beat, daemon=True)
+    heartbeat_thread.start()
+    logger.info(
+        "Running job",
+        extra={"worker_id": worker_id, "job_id": job.id, "job_type": job.job_type, "attempt": job.attempts, "max_attempts": job.max_attempts}
+    )
+    try:
+        handler(**payload, reraise=True, lease_lost=lease_lost)
+    except job_queue.LeaseLost:
+        # The job is queued again or running elsewhere; leave its state to that worker
+        logger.warning("Abandoned job after losing its lease", extra={"worker_id": worker_id, "job_id": job.id})
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        if not job_queue.fail(job.id, error):
+            on_failure(payload, error)
+            logger.error("Job failed", extra={"job_id": job.id, "job_type": job.job_type, "attempts": job.attempts, "error": error})
+    else:
+        if lease_lost.is_set():
+            logger.warning("Job finished after losing its lease", extra={"worker_id": worker_id, "job_id": job.id})
+        else:
+            job_queue.complete(job.id)
+    finally:
+        stop.set()
+        heartbeat_thread.join()
+
+
+def publish_metrics(worker_id: str):
+    try:
+        publish_metric_snapshot(worker_id, metrics.snapshot())
+    except Exception as e:
+        logger.warning("Could not publish metrics", extra={"worker_id": worker_id, "error": str(e)})
+
+
+def work(worker_id: str, limits: dict, poll_interval: float, stop):
+    """Worker process loop: claim and run one job at a time until `stop` is set."""
+    # Connections inherited from the parent must not be shared across processes
+    engine.dispose(close=False)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_logging()
+    metrics.instrument_sessions(SessionLocal)
+
+    def publish_periodically():
+        # Scans run for minutes, so metrics are published while jobs run, not only between them
+        while not stop.wait(metrics.PUBLISH_INTERVAL):
+            publish_metrics(worker_id)
+
+    threading.Thread(target=publish_periodically, daemon=True).start()
+    try:
+        while not stop.is_set():
+            job = None
+            for group, limit in limits.items():
+                job = job_queue.claim(worker_id, LIMIT_GROUPS[group], limit)
+                if job:
+                    break
+            if job:
+                run_job(job, worker_id)
+            else:
+                stop.wait(poll_interval)
+    finally:
+        publish_metrics(worker_id)
+        close_sessions()
+
+
+def recover_orphans(grace_seconds: float = job_queue.LEASE_SECONDS) -> int:
+    """Requeue expired leases and fail scans and reports left "running" without a job.
+
+    Rows younger than `grace_seconds` are left alone, since the API creates the
+    row just before it enqueues the job.
+
+    Returns:
+        int: Number of jobs requeued plus rows marked failed
+    """
+    recovered = job_queue.requeue_expired(on_failure=fail_expired_job)
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    with SessionLocal() as db:
+        scan_ids = [scan_id for (scan_id,) in db.query(Scan.id).filter(Scan.status == "running", Scan.timestamp < cutoff)]
+        report_ids = [report_id for (report_id,) in db.query(AIReport.id).filter(AIReport.status == "running", AIReport.timestamp < cutoff)]
+        scan_ids = [scan_id for scan_id in scan_ids if not job_queue.has_active_job(db, f"scan:{scan_id}")]
+        report_ids = [report_id for report_id in report_ids if not job_queue.has_active_job(db, f"report:{report_id}")]
+    for scan_id in scan_ids:
+        fail_scan(scan_id, "Scan interrupted before it finished")
+    for report_id in report_ids:
+        fail_report(report_id, "Classification interrupted before it finished")
+    return recovered + len(scan_ids) + len(report_ids)
+
+
+def parse_limits(values: list[str], processes: int) -> dict:
+    limits = dict(DEFAULT_LIMITS)
+    limits["scan"] = max(1, processes - 1)
+    for value in values or []:
+        group, _, limit = value.partition("=")
+        if group not in LIMIT_GROUPS or not limit.isdigit():
+            raise argparse.ArgumentTypeError(f"Invalid --limit {value!r}, expected e.g. scan=3")
+        limits[group] = int(limit)
+    if limits["scan"] >= processes:
+        logger.warning(
+            "Scans can occupy every worker process and hold up classifications",
+            extra={"scan_limit": limits["scan"], "processes": processes}
+        )
+    return limits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run scan and classification jobs from the database queue")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("WORKER_PROCESSES", "4")))
+    parser.add_argument("--limit", action="append", metavar="TYPE=N",
+                        help="Max concurrent jobs of a type across all workers, e.g. --limit scan=8. "
+                             "scan covers manual and scheduled scans and defaults to --processes minus one")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between queue polls when idle")
+    args = parser.parse_args()
+    configure_logging()
+    limits = parse_limits(args.limit, args.processes)
+
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+    logger.info("Recovered orphaned jobs and rows", extra={"recovered": recover_orphans()})
+
+    stop = multiprocessing.Event()
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+    def start(n):
+        process = multiprocessing.Process(target=work, args=(f"{prefix}-{n}", limits, args.poll_interval, stop), daemon=True)
+        process.start()
+        return process
+
+    def shutdown(signum, frame):
+        raise KeyboardInterrupt
+
+    processes = [start(n) for n in range(args.processes)]
+    signal.signal(signal.SIGTERM, shutdown)
+    logger.info("Started workers", extra={"processes": args.processes, "limits": limits})
+    try:
+        while True:
+            time.sleep(SCHEDULER_TICK_SECONDS)
+            # Jobs held by a crashed worker come back once their lease runs out
+            requeued = job_queue.requeue_expired(on_failure=fail_expired_job)
+            if requeued:
+                logger.info("Requeued jobs with expired leases", extra={"requeued": requeued})
+            fired = fire_due_schedules()
+            if fired:
+                logger.info("Queued scheduled scans", extra={"queued": fired})
+            for n, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.warning("Worker exited, restarting", extra={"worker_id": f"{prefix}-{n}", "exit_code": process.exitcode})
+                    processes[n] = start(n)
+    except KeyboardInterrupt:
+        logger.info("Stopping workers after their current jobs")
+        stop.set()
+
+    # Anything cut short by a hard kill is requeued once its lease expires
+    for process in processes:
+        process.join()
+
+if __name__ == "__main__":
+    main()
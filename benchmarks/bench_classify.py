@@ -0,0 +1,67 @@
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_anthropic import start_server
+
+# Measures classify_posts throughput against the fake Anthropic API for
+# several concurrency levels. With --cascade the posts are the labeled ones
+# from datasets/base.csv and the local model settles the confident ones.
+
+def fake_scan(count, run=0, texts=None):
+    # `run` makes every benchmark round unique so the classification cache stays cold
+    posts = [
+        SimpleNamespace(
+            id=n,
+            content=f"{texts[n % len(texts)]} (run {run})" if texts else f"Selling RDP access to Company {n} (run {run})",
+            status="new"
+        )
+        for n in range(count)
+    ]
+    return SimpleNamespace(posts=posts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark classify_posts against a local fake Anthropic API")
+    parser.add_argument("--posts", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--mode", choices=["sync", "packed"], default="sync")
+    parser.add_argument("--cascade", action="store_true", help="Classify with the local model first")
+    args = parser.parse_args()
+
+    server, base_url = start_server(latency=args.latency, rate_limit_every=args.rate_limit_every)
+    os.environ["ANTHROPIC_BASE_URL"] = base_url
+    from app.models.database import Base, engine, upgrade_schema
+    from app.routers.claude_router import classify_posts
+    from app.services.local_classifier import load_dataset
+
+    texts = load_dataset()[0] if args.cascade else None
+
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+
+    try:
+        for run, concurrency in enumerate(args.concurrency):
+            scan = fake_scan(args.posts, f"{time.time()}-{run}", texts)
+            server.state.requests = 0
+            started = time.perf_counter()
+            result = classify_posts(
+                scan, "test-key", "fake-model", 0.1, 100,
+                concurrency=concurrency, requests_per_minute=100000, tokens_per_minute=10000000,
+                mode=args.mode, cascade=args.cascade
+            )
+            elapsed = time.perf_counter() - started
+            errors = sum(1 for post in result["posts"] if post["classification"] is None)
+            print(
+                f"mode={args.mode} cascade={args.cascade} concurrency={concurrency:>3} requests={server.state.requests} "
+                f"posts={len(result['posts'])} local={result['local']} errors={errors} time={elapsed:.2f}s "
+                f"posts/sec={len(result['posts']) / elapsed:.1f}"
+            )
+    finally:
+        server.shutdown()
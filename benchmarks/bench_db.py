@@ -0,0 +1,110 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app.models.database import Base, Scan, Post, make_engine, insert_posts, post_rows
+
+# Concurrent write+read throughput of the scan tables. Writer threads behave
+# like running scans (commit a batch of posts and update the scan counters),
+# reader threads like the dashboard and scan list. Runs once with the stock
+# SQLite setup (rollback journal, ORM inserts) and once with the tuned one
+# (WAL, pragmas, multi-row inserts).
+
+
+def fake_posts(scan_id, batch, size):
+    return [
+        {
+            "link": f"http://market.onion/posts/{scan_id}-{batch}-{n}",
+            "title": f"Post {n}",
+            "category": "Access",
+            "date": "2025-01-01",
+            "content": f"Selling access to Company {n}. RDP with DA. " * 8,
+            "status": "new"
+        }
+        for n in range(size)
+    ]
+
+
+def run(label, engine, writers, readers, duration, batch_size, tuned):
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    counts = {"posts": 0, "reads": 0, "locked": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def count(key, amount=1):
+        with lock:
+            counts[key] += amount
+
+    def writer():
+        with Session() as db:
+            scan = Scan(name="bench", onion_url="http://market.onion", timestamp=datetime.utcnow(), status="running", result="")
+            db.add(scan)
+            db.commit()
+            batch = 0
+            while time.perf_counter() < deadline:
+                posts = fake_posts(scan.id, batch, batch_size)
+                try:
+                    if tuned:
+                        insert_posts(db, scan.id, posts, batch * batch_size)
+                    else:
+                        for row in post_rows(scan.id, posts, batch * batch_size):
+                            db.add(Post(**row))
+                    scan.posts_stored = (batch + 1) * batch_size
+                    db.commit()
+                    count("posts", batch_size)
+                    batch += 1
+                except OperationalError:
+                    db.rollback()
+                    count("locked")
+
+    def reader():
+        with Session() as db:
+            while time.perf_counter() < deadline:
+                try:
+                    db.query(Scan).count()
+                    latest = db.query(Scan).order_by(Scan.timestamp.desc()).first()
+                    if latest:
+                        db.query(Post).filter(Post.scan_id == latest.id).order_by(Post.position).limit(50).all()
+                    db.rollback()
+                    count("reads")
+                except OperationalError:
+                    db.rollback()
+                    count("locked")
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    print(
+        f"{label:<8} writers={writers} readers={readers} "
+        f"posts/sec={counts['posts'] / elapsed:.0f} reads/sec={counts['reads'] / elapsed:.0f} "
+        f"locked_errors={counts['locked']}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark concurrent SQLite writes and reads, stock vs tuned")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per run")
+    parser.add_argument("--batch-size", type=int, default=10, help="Posts per commit, like STORE_BATCH_SIZE")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for label, tuned in (("stock", False), ("tuned", True)):
+            url = f"sqlite:///{os.path.join(directory, label + '.db')}"
+            run(label, make_engine(url, tuned=tuned), args.writers, args.readers, args.duration, args.batch_size, tuned)
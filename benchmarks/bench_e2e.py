@@ -0,0 +1,414 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import fake_anthropic
+import fake_market
+
+# Offline end-to-end benchmark: a fake market (fake_market.py) and a fake
+# Messages API (fake_anthropic.py) run in this process, and every scenario
+# runs in a fresh process with its own SQLite database, so peak RSS and DB
+# state are per scenario:
+#   scrape    scrape_posts over the market, no database
+#   run_scan  run_scan storing posts, clusters and the search index
+#   classify  classify_posts over a stored scan against the fake API
+#   api       the FastAPI app under uvicorn plus an in-process worker: create
+#             a scan and a classification over HTTP, wait for both, then
+#             time the read endpoints
+# Reported per scenario: posts/sec, p50/p99 latency of market and API
+# requests (and of each endpoint in `api`), peak RSS and time spent in
+# database writes and commits. --json saves the results, --compare prints
+# the change against a saved run.
+
+SCENARIOS = ("scrape", "run_scan", "classify", "api")
+DATASET_PATH = os.path.join(ROOT_DIR, "datasets", "base.csv")
+# Read endpoints timed by the api scenario; {scan_id} and {report_id} are filled in
+API_READS = (
+    "/scans/list",
+    "/scans/{scan_id}?limit=50",
+    "/scans/{scan_id}/stats",
+    "/scans/clusters?limit=20",
+    "/claude/reports/{report_id}?limit=50",
+    "/search?q=access&limit=20",
+)
+# Metrics compared by --compare, with True where higher is better
+COMPARED = {"posts_per_sec": True, "seconds": False, "peak_rss_mb": False, "db_write_seconds": False}
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of `samples`, or None when there are none."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def latency_summary(samples):
+    return {
+        "count": len(samples),
+        "p50": round(percentile(samples, 50) * 1000, 2) if samples else None,
+        "p99": round(percentile(samples, 99) * 1000, 2) if samples else None
+    }
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class Measure:
+    """Latency samples by name and database write time, collected inside a scenario process."""
+
+    def __init__(self, names):
+        self.names = names  # URL prefix -> sample name
+        self.samples = {}
+        self.db = {"write_seconds": 0.0, "commit_seconds": 0.0, "statements": 0, "commits": 0}
+        self.started = None
+        self.elapsed = None
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def add_url(self, url, seconds):
+        for prefix, name in self.names.items():
+            if str(url).startswith(prefix):
+                self.add(name, seconds)
+                return
+
+    def begin(self):
+        """Start the clock, dropping whatever setup recorded."""
+        with self._lock:
+            self.samples.clear()
+            self.db.update(write_seconds=0.0, commit_seconds=0.0, statements=0, commits=0)
+        self.started = time.perf_counter()
+
+    def end(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def watch_http(self):
+        """Time every request sent through requests (scraper) and httpx (Anthropic SDK)."""
+        import httpx
+        import requests
+
+        def timed(send):
+            def wrapper(client, request, *args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return send(client, request, *args, **kwargs)
+                finally:
+                    self.add_url(request.url, time.perf_counter() - started)
+            return wrapper
+
+        requests.Session.send = timed(requests.Session.send)
+        httpx.Client.send = timed(httpx.Client.send)
+
+    def watch_db(self, engine):
+        """Time INSERT/UPDATE/DELETE statements and commits on `engine`."""
+        from sqlalchemy import event
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("bench_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["bench_started"].pop()
+            if statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+                with self._lock:
+                    self.db["write_seconds"] += elapsed
+                    self.db["statements"] += 1
+
+        do_commit = engine.dialect.do_commit
+
+        def timed_commit(dbapi_connection):
+            started = time.perf_counter()
+            try:
+                do_commit(dbapi_connection)
+            finally:
+                with self._lock:
+                    self.db["commit_seconds"] += time.perf_counter() - started
+                    self.db["commits"] += 1
+
+        engine.dialect.do_commit = timed_commit
+
+    def result(self, posts, **extra):
+        seconds = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        return {
+            "posts": posts,
+            "seconds": round(seconds, 3),
+            "posts_per_sec": round(posts / seconds, 1) if seconds else None,
+            "latency_ms": {name: latency_summary(samples) for name, samples in sorted(self.samples.items())},
+            "db_write_seconds": round(self.db["write_seconds"] + self.db["commit_seconds"], 3),
+            "db": {key: round(value, 3) for key, value in self.db.items()},
+            "peak_rss_mb": peak_rss_mb(),
+            **extra
+        }
+
+
+def scrape_options(settings):
+    max_pages = -(-settings["posts"] // settings["page_size"])
+    return {
+        "concurrency": settings["concurrency"],
+        "max_per_host": settings["concurrency"],
+        "max_pages": max_pages,
+        "max_depth": max_pages
+    }
+
+
+def prepare_db():
+    from app.models.database import Base, engine, upgrade_schema, create_search_index
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+    create_search_index()
+
+
+def store_scan(settings):
+    """Insert a scan of the fake market and return its id."""
+    from datetime import datetime
+    from app.models.database import SessionLocal, Scan
+    with SessionLocal() as db:
+        scan = Scan(
+            name="bench", onion_url=settings["market_url"], http_proxy="", https_proxy="",
+            timestamp=datetime.utcnow(), status="queued", result=""
+        )
+        db.add(scan)
+        db.commit()
+        return scan.id
+
+
+def scan_counts(scan_id):
+    from app.models.database import SessionLocal, Scan
+    with SessionLocal() as db:
+        scan = db.query(Scan).filter(Scan.id == scan_id).first()
+        return scan.status, scan.posts_stored or 0, scan.errors or 0
+
+
+def scenario_scrape(settings, measure):
+    import base64
+    from app.services.scraper import scrape_posts
+    measure.begin()
+    result = scrape_posts(settings["market_url"], proxies={}, **scrape_options(settings))
+    measure.end()
+    posts = json.loads(base64.b64decode(result))["posts"]
+    errors = sum(1 for post in posts if post["status"] == "error")
+    return measure.result(len(posts), errors=errors)
+
+
+def scenario_run_scan(settings, measure):
+    from app.routers.scans_router import run_scan
+    prepare_db()
+    scan_id = store_scan(settings)
+    measure.begin()
+    run_scan(scan_id, **scrape_options(settings))
+    measure.end()
+    status, posts, errors = scan_counts(scan_id)
+    return measure.result(posts, errors=errors, status=status)
+
+
+def scenario_classify(settings, measure):
+    from app.models.database import SessionLocal, Scan
+    from app.routers.scans_router import run_scan
+    from app.routers.claude_router import classify_posts
+    from app.services.near_duplicates import cluster_representatives
+    prepare_db()
+    scan_id = store_scan(settings)
+    run_scan(scan_id, **scrape_options(settings))
+    with SessionLocal() as db:
+        scan = db.query(Scan).filter(Scan.id == scan_id).first()
+        cluster_contents = cluster_representatives(db, [post.cluster_id for post in scan.posts if post.cluster_id is not None])
+        measure.begin()
+        result = classify_posts(
+            scan, "bench-key", "fake-model", 0.1, 100,
+            concurrency=settings["classify_concurrency"], requests_per_minute=1000000, tokens_per_minute=100000000,
+            mode=settings["classify_mode"], cluster_contents=cluster_contents
+        )
+        measure.end()
+    errors = sum(1 for post in result["posts"] if post["classification"] is None)
+    return measure.result(len(result["posts"]), errors=errors, unique=result["unique"], usage=result["usage"])
+
+
+def scenario_api(settings, measure):
+    import requests
+    import uvicorn
+    from app.main import app
+    from app.worker import run_job
+    from app.services import job_queue
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=settings["api_port"], log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    stop = threading.Event()
+
+    def worker():
+        # app.worker.work installs signal handlers, which only the main thread may do
+        while not stop.is_set():
+            job = job_queue.claim("bench", ("scan",), 1) or job_queue.claim("bench", ("classification",), 1)
+            if job:
+                run_job(job, "bench")
+            else:
+                stop.wait(0.05)
+
+    threading.Thread(target=worker, daemon=True).start()
+    base_url = f"http://127.0.0.1:{settings['api_port']}"
+    while not server.started:
+        time.sleep(0.01)
+    session = requests.Session()
+
+    def call(method, path, body=None, label=None):
+        started = time.perf_counter()
+        response = session.request(method, base_url + path, json=body)
+        measure.add(f"{method} {(label or path).split('?')[0]}", time.perf_counter() - started)
+        response.raise_for_status()
+        return response.json()
+
+    def wait_for(path, done):
+        while True:
+            body = session.get(base_url + path).json()
+            if done(body):
+                return body
+            time.sleep(0.05)
+
+    try:
+        measure.begin()
+        scan = call("POST", "/scans/create-scan", {
+            "name": "bench", "onion_url": settings["market_url"], "http_proxy": "", "https_proxy": "",
+            **scrape_options(settings)
+        })["scan"]
+        wait_for(f"/scans/{scan['id']}/stats", lambda body: body["scan"]["status"] in ("completed", "failed"))
+        scan_seconds = time.perf_counter() - measure.started
+        report_id = call("POST", "/claude/start-classification", {
+            "scan_id": scan["id"], "api_key": "bench-key", "model_name": "fake-model",
+            "concurrency": settings["classify_concurrency"], "requests_per_minute": 1000000,
+            "tokens_per_minute": 100000000, "mode": settings["classify_mode"]
+        })["report_id"]
+        wait_for(f"/claude/reports/{report_id}?limit=1", lambda body: body["status"] in ("completed", "failed"))
+        measure.end()
+        for _ in range(settings["requests"]):
+            for path in API_READS:
+                call("GET", path.format(scan_id=scan["id"], report_id=report_id), label=path)
+        status, posts, errors = scan_counts(scan["id"])
+        return measure.result(posts, errors=errors, status=status, scan_seconds=round(scan_seconds, 3))
+    finally:
+        stop.set()
+        server.should_exit = True
+
+
+def run_scenario(name, settings):
+    """Entry point of a scenario process."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{settings['db_path']}"
+    os.environ["ANTHROPIC_BASE_URL"] = settings["anthropic_url"]
+    output = sys.stdout if settings["verbose"] else open(os.devnull, "w")
+    with contextlib.redirect_stdout(output):
+        from app.models.database import engine
+        measure = Measure({settings["market_base_url"]: "market", settings["anthropic_url"]: "messages_api"})
+        measure.watch_http()
+        measure.watch_db(engine)
+        return globals()[f"scenario_{name}"](settings, measure)
+
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def print_result(name, result):
+    print(
+        f"{name:<9} posts={result['posts']} errors={result.get('errors', 0)} time={result['seconds']:.2f}s "
+        f"posts/sec={result['posts_per_sec']} db_write={result['db_write_seconds']:.3f}s "
+        f"({result['db']['statements']} statements, {result['db']['commits']} commits) peak_rss={result['peak_rss_mb']}MB"
+    )
+    for label, summary in result["latency_ms"].items():
+        print(f"    {label:<28} n={summary['count']:<5} p50={summary['p50']}ms p99={summary['p99']}ms")
+
+
+def compare(results, baseline):
+    """Print the change of the main metrics against a saved run."""
+    print(f"\nChange against baseline ({baseline.get('timestamp')})")
+    for name, result in results.items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        changes = []
+        for metric, higher_is_better in COMPARED.items():
+            old, new = before.get(metric), result.get(metric)
+            if old and new is not None:
+                change = (new - old) / old * 100
+                worse = change < 0 if higher_is_better else change > 0
+                changes.append(f"{metric} {old} -> {new} ({change:+.1f}%{' worse' if worse and abs(change) >= 10 else ''})")
+        print(f"  {name:<9} " + ", ".join(changes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark against a fake market and a fake Messages API")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--posts", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds of delay per market request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of market requests answered with 500")
+    parser.add_argument("--texts", default=DATASET_PATH, help="CSV whose text column gives post bodies ('' for the built-in template)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Scraper concurrency and per-host limit")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Seconds of delay per Messages API request")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth Messages API request with 429")
+    parser.add_argument("--classify-concurrency", type=int, default=8)
+    parser.add_argument("--classify-mode", choices=["sync", "packed"], default="sync")
+    parser.add_argument("--requests", type=int, default=20, help="Rounds of read requests in the api scenario")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--compare", help="Results file of an earlier run to compare with")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's own output")
+    args = parser.parse_args()
+
+    market, market_url = fake_market.start_server(
+        posts=args.posts, latency=args.latency, page_size=args.page_size, error_rate=args.error_rate,
+        texts=fake_market.load_texts(args.texts) if args.texts else None
+    )
+    api, anthropic_url = fake_anthropic.start_server(latency=args.api_latency, rate_limit_every=args.rate_limit_every)
+    results = {}
+    try:
+        for name in args.scenarios:
+            with tempfile.TemporaryDirectory() as directory:
+                settings = {
+                    **vars(args),
+                    "market_base_url": market_url,
+                    "market_url": f"{market_url}/marketplace/sellers",
+                    "anthropic_url": anthropic_url,
+                    "db_path": os.path.join(directory, "bench.db"),
+                    "api_port": free_port()
+                }
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                    results[name] = executor.submit(run_scenario, name, settings).result()
+            print_result(name, results[name])
+    finally:
+        market.shutdown()
+        api.shutdown()
+
+    settings = {key: value for key, value in vars(args).items() if key not in ("json", "compare", "verbose")}
+    output = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": settings,
+        "scenarios": results
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"Saved results to {args.json}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.crawler import parse_listing
+from app.services.parsers import DEFAULT_RULES, HtmlParserBackend, available_backends, extract_post_content, get_backend
+
+# Parses the saved listing and post pages in fixtures/ with every installed
+# parser backend and reports pages/sec. "html.parser-full" builds the whole
+# tree without a SoupStrainer, like the scraper did before backends existed.
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+BASE_URL = "http://market.onion"
+
+
+class FullTreeBackend(HtmlParserBackend):
+    name = "html.parser-full"
+
+    def parse(self, html, only=None):
+        return super().parse(html, only=None)
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def measure(function, seconds):
+    """Call function repeatedly for about `seconds`. Returns (calls/sec, last result)."""
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        result = function()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return calls / elapsed, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parser backends on saved fixture pages")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Time spent per backend and page type")
+    args = parser.parse_args()
+
+    listing_html = read_fixture("listing.html")
+    post_html = read_fixture("post.html")
+    page_url = f"{BASE_URL}/marketplace/sellers"
+
+    backends = [FullTreeBackend()] + [get_backend(name) for name in reversed(available_backends())]
+    expected = None
+    for backend in backends:
+        listings_per_sec, (rows, next_links) = measure(
+            lambda: parse_listing(listing_html, page_url, BASE_URL, DEFAULT_RULES, backend), args.seconds
+        )
+        posts_per_sec, content = measure(
+            lambda: extract_post_content(post_html, DEFAULT_RULES, backend), args.seconds
+        )
+        # Every backend must extract exactly the same data
+        output = (rows, sorted(set(next_links)), content)
+        if expected is None:
+            expected = output
+        status = "ok" if output == expected else "MISMATCH"
+        print(
+            f"{backend.name:<17} listing pages/sec={listings_per_sec:>7.1f} ({len(rows)} rows) "
+            f"post pages/sec={posts_per_sec:>7.1f} output={status}"
+        )
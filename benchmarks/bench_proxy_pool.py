@@ -0,0 +1,68 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.scraper import collect_posts
+from fake_market import start_server
+from fake_socks import start_server as start_socks
+
+# Scrapes the fake market through fake SOCKS proxies: once over a single
+# circuit, as a scan with one Tor proxy did before the circuit pool, then
+# over a pool of isolated circuits spread across several proxies. Some
+# circuits can be made slow, broken or throttled to show them being replaced.
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Tor circuit pool against local fake SOCKS proxies")
+    parser.add_argument("--posts", type=int, default=60)
+    parser.add_argument("--proxies", type=int, default=2, help="Fake SOCKS proxies in the pooled run")
+    parser.add_argument("--circuits", type=int, default=4, help="Circuits per proxy in the pooled run")
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds per request on a circuit")
+    parser.add_argument("--slow-fraction", type=float, default=0.25)
+    parser.add_argument("--broken-fraction", type=float, default=0.0)
+    parser.add_argument("--throttled-fraction", type=float, default=0.0, help="Share of circuits answering 429")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    market, base_url = start_server(posts=args.posts, latency=0.0)
+    socks = [
+        start_socks(
+            latency=args.latency,
+            slow_fraction=args.slow_fraction,
+            broken_fraction=args.broken_fraction,
+            throttled_fraction=args.throttled_fraction,
+            seed=n
+        )
+        for n in range(args.proxies)
+    ]
+    onion_url = f"{base_url}/marketplace/sellers"
+    runs = (
+        ("single circuit", socks[0][1], 1),
+        ("circuit pool", ",".join(url for _, url in socks), args.circuits),
+    )
+    try:
+        for label, proxy, circuits in runs:
+            stats = {}
+            started = time.perf_counter()
+            posts = collect_posts(
+                onion_url,
+                proxies={'http': proxy, 'https': proxy},
+                concurrency=args.concurrency,
+                max_per_host=args.concurrency,
+                circuits_per_proxy=circuits,
+                stats=stats
+            )
+            elapsed = time.perf_counter() - started
+            circuit_stats = stats.get('circuits', [])
+            errors = sum(1 for post in posts if post['status'] == 'error')
+            rotations = sum(circuit['rotations'] for circuit in circuit_stats)
+            print(
+                f"{label:<15} circuits={len(circuit_stats):>3} posts={len(posts)} errors={errors} "
+                f"rotations={rotations} time={elapsed:.2f}s posts/sec={len(posts) / elapsed:.1f}"
+            )
+    finally:
+        market.shutdown()
+        for server, _ in socks:
+            server.shutdown()
@@ -0,0 +1,86 @@
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import scraper
+from app.services.host_limiter import HostLimiter
+from fake_market import start_server
+
+# Scrapes the fake market in two bad conditions, with the fixed per-host
+# semaphore the scraper used before (no retries, no breaker) and with the
+# adaptive HostLimiter:
+#   overloaded  the market answers 503 + Retry-After beyond --capacity
+#               concurrent requests while the scraper runs --concurrency
+#   dead host   every --dead-every-th post links to a host that accepts
+#               connections and never answers, so each request times out
+
+
+class FixedLimiter(HostLimiter):
+    """The old behaviour: a fixed semaphore per host and a single attempt."""
+
+    def __init__(self, max_per_host=4, max_retries=0):
+        super().__init__(max_per_host, 0)
+        self._semaphores = {}
+
+    def request(self, url, send):
+        guard = self.for_url(url)
+        with self._lock:
+            semaphore = self._semaphores.setdefault(guard, threading.BoundedSemaphore(self.max_per_host))
+        with semaphore:
+            return send()
+
+
+def blackhole():
+    """Listening socket that never accepts: connections open, reads time out."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(1024)
+    return sock, f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def run(label, limiter_class, onion_url, **options):
+    scraper.HostLimiter = limiter_class
+    stats = {}
+    started = time.perf_counter()
+    posts = scraper.collect_posts(onion_url, proxies={}, stats=stats, **options)
+    elapsed = time.perf_counter() - started
+    ok = sum(1 for post in posts if post['status'] != 'error')
+    print(f"  {label:<9} posts={len(posts)} ok={ok} errors={len(posts) - ok} time={elapsed:.2f}s ok/sec={ok / elapsed:.1f}")
+    for host, host_stats in stats.get('hosts', {}).items():
+        if limiter_class is HostLimiter:
+            print(f"    {host} {host_stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the per-host limiter, retries and breaker against a misbehaving fake market")
+    parser.add_argument("--posts", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--capacity", type=int, default=4)
+    parser.add_argument("--dead-every", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    args = parser.parse_args()
+
+    dead_sock, dead_url = blackhole()
+    scenarios = (
+        ("overloaded", dict(capacity=args.capacity), dict(concurrency=args.concurrency, max_per_host=args.concurrency)),
+        ("dead host", dict(dead_url=dead_url, dead_every=args.dead_every), dict(concurrency=4, max_per_host=4, timeout=args.timeout)),
+    )
+    try:
+        for name, market_options, scrape_options in scenarios:
+            print(name)
+            for label, limiter_class in (("fixed", FixedLimiter), ("adaptive", HostLimiter)):
+                # A fresh market per run so one run's backlog can't slow the next
+                server, base_url = start_server(posts=args.posts, latency=args.latency, **market_options)
+                try:
+                    run(label, limiter_class, f"{base_url}/marketplace/sellers", **scrape_options)
+                finally:
+                    server.shutdown()
+    finally:
+        scraper.HostLimiter = HostLimiter
+        dead_sock.close()
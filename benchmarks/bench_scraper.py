@@ -0,0 +1,43 @@
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.scraper import scrape_posts
+from fake_market import start_server
+
+# Compares sequential and concurrent post fetching against the fake market.
+# With per-request latency L and N posts, wall-clock time should approach
+# N * L / concurrency.
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark scrape_posts against a local fake market")
+    parser.add_argument("--posts", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--page-size", type=int, default=None)
+    args = parser.parse_args()
+
+    server, base_url = start_server(posts=args.posts, latency=args.latency, page_size=args.page_size)
+    max_pages = -(-args.posts // args.page_size) if args.page_size else 1
+    onion_url = f"{base_url}/marketplace/sellers"
+    try:
+        for concurrency in args.concurrency:
+            started = time.perf_counter()
+            result = scrape_posts(
+                onion_url,
+                proxies={},
+                concurrency=concurrency,
+                max_per_host=concurrency,
+                max_pages=max_pages,
+                max_depth=max_pages
+            )
+            elapsed = time.perf_counter() - started
+            posts = json.loads(base64.b64decode(result))['posts']
+            print(f"concurrency={concurrency:>3} posts={len(posts)} time={elapsed:.2f}s posts/sec={len(posts) / elapsed:.1f}")
+    finally:
+        server.shutdown()
@@ -0,0 +1,210 @@
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Anthropic Messages API. Point the SDK at it with
+# ANTHROPIC_BASE_URL=http://127.0.0.1:<port>. Every response is delayed by
+# `latency` seconds and every `rate_limit_every`-th request answers 429 so
+# limiter and backoff behaviour can be exercised offline. Likewise every
+# `server_error_every`-th message request answers 529 overloaded and every
+# `drop_every`-th one is closed without a response. Message Batches
+# are answered synchronously and report "ended" after `batch_delay` seconds.
+
+POSITIVE_WORDS = ('access', 'rdp', 'vpn', 'citrix', 'domain admin')
+NEUTRAL_WORDS = ('selling', 'accounts', 'tool', 'panel')
+PACKED_POST_PATTERN = re.compile(r"Post (\d+):\n```markdown\n(.*?)\n```", re.DOTALL)
+
+
+def classify_text(text):
+    lowered = text.lower()
+    if any(word in lowered for word in POSITIVE_WORDS):
+        return {"classification": "Positive", "scores": {"positive": 0.9, "neutral": 0.07, "negative": 0.03}}
+    if any(word in lowered for word in NEUTRAL_WORDS):
+        return {"classification": "Neutral", "scores": {"positive": 0.1, "neutral": 0.8, "negative": 0.1}}
+    return {"classification": "Negative", "scores": {"positive": 0.05, "neutral": 0.15, "negative": 0.8}}
+
+
+def _text_of(blocks):
+    if isinstance(blocks, str):
+        return blocks
+    return "".join(block.get("text", "") for block in blocks if isinstance(block, dict))
+
+
+def message_response(body):
+    """Build a Messages API response for one request body."""
+    system = _text_of(body.get("system") or "")
+    prompt = _text_of(body["messages"][-1]["content"])
+    packed = PACKED_POST_PATTERN.findall(prompt)
+    if packed:
+        result = [dict(classify_text(post), index=int(index)) for index, post in packed]
+    else:
+        result = classify_text(prompt)
+    text = "```json\n" + json.dumps(result) + "\n```"
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": (len(system) + len(prompt)) // 4, "output_tokens": len(text) // 4}
+    }
+
+
+class FakeAnthropicState:
+    def __init__(self, latency, rate_limit_every, batch_delay, server_error_every=0, drop_every=0):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.server_error_every = server_error_every
+        self.drop_every = drop_every
+        self.batch_delay = batch_delay
+        self.requests = 0
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def batch_object(self, batch_id, base_url):
+        batch = self.batches[batch_id]
+        ended = time.time() - batch["created"] >= self.batch_delay
+        count = len(batch["results"])
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else count,
+                "succeeded": count if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0
+            },
+            "created_at": "2025-01-01T00:00:00Z",
+            "expires_at": "2025-01-02T00:00:00Z",
+            "ended_at": "2025-01-01T00:00:01Z" if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": f"{base_url}/v1/messages/batches/{batch_id}/results" if ended else None
+        }
+
+
+def make_handler(state):
+    class AnthropicHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            data = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_json(self):
+            length = int(self.headers.get('Content-Length', 0))
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def _base_url(self):
+            return f"http://{self.headers.get('Host')}"
+
+        def do_GET(self):
+            parts = self.path.split('?')[0].strip('/').split('/')
+            # v1/messages/batches/<id>[/results]
+            if parts[:3] == ['v1', 'messages', 'batches'] and len(parts) >= 4 and parts[3] in state.batches:
+                batch_id = parts[3]
+                if len(parts) == 5 and parts[4] == 'results':
+                    lines = "\n".join(json.dumps(entry) for entry in state.batches[batch_id]["results"]) + "\n"
+                    data = lines.encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/binary')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                else:
+                    self._send_json(200, state.batch_object(batch_id, self._base_url()))
+            else:
+                self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+        def do_POST(self):
+            body = self._read_json()
+            with state.lock:
+                state.requests += 1
+                throttled = state.rate_limit_every and state.requests % state.rate_limit_every == 0
+                overloaded = state.server_error_every and state.requests % state.server_error_every == 0
+                dropped = state.drop_every and state.requests % state.drop_every == 0
+            time.sleep(state.latency)
+            if self.path.startswith('/v1/messages/batches'):
+                batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+                results = [
+                    {
+                        "custom_id": request["custom_id"],
+                        "result": {"type": "succeeded", "message": message_response(request["params"])}
+                    }
+                    for request in body.get("requests", [])
+                ]
+                with state.lock:
+                    state.batches[batch_id] = {"created": time.time(), "results": results}
+                self._send_json(200, state.batch_object(batch_id, self._base_url()))
+            elif self.path.startswith('/v1/messages'):
+                if dropped:
+                    # Like a connection reset mid-request: the client gets no response at all
+                    self.close_connection = True
+                    return
+                if throttled:
+                    self._send_json(429, {"type": "error", "error": {"type": "rate_limit_error", "message": "Rate limited"}}, {"retry-after": "0.1"})
+                    return
+                if overloaded:
+                    self._send_json(529, {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}}, {"retry-after": "0.1"})
+                    return
+                self._send_json(200, message_response(body))
+            else:
+                self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+
+    return AnthropicHandler
+
+
+def start_server(host='127.0.0.1', port=0, latency=0.3, rate_limit_every=0, batch_delay=1.0, server_error_every=0, drop_every=0):
+    """Start the fake API in a daemon thread.
+
+    Returns:
+        tuple: (server, base_url)
+    """
+    state = FakeAnthropicState(latency, rate_limit_every, batch_delay, server_error_every, drop_every)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake Anthropic Messages API locally")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds of delay per request")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth request with 429 (0 disables)")
+    parser.add_argument("--server-error-every", type=int, default=0, help="Answer every Nth message request with 529 (0 disables)")
+    parser.add_argument("--drop-every", type=int, default=0, help="Close every Nth message request without a response (0 disables)")
+    parser.add_argument("--batch-delay", type=float, default=1.0, help="Seconds before a message batch reports ended")
+    args = parser.parse_args()
+
+    server, base_url = start_server(
+        port=args.port,
+        latency=args.latency,
+        rate_limit_every=args.rate_limit_every,
+        batch_delay=args.batch_delay,
+        server_error_every=args.server_error_every,
+        drop_every=args.drop_every
+    )
+    print(f"Fake Anthropic API listening on {base_url} (export ANTHROPIC_BASE_URL={base_url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
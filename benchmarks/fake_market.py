@@ -0,0 +1,162 @@
+import argparse
+import csv
+import hashlib
+import html
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for an onion marketplace. Serves a paginated `table.table`
+# listing at /marketplace/sellers?page=N and `div.post-content` pages at
+# /posts/<n>, each after an artificial delay so scraper concurrency can be
+# measured without Tor. With `capacity` set, requests beyond that many in
+# flight get 503 with Retry-After, like an overloaded hidden service. With
+# `dead_url` set, every `dead_every`-th post links to that host instead.
+# `error_rate` is the share of requests answered with a 500, and `texts`
+# replaces the near-identical post bodies with real-looking ones.
+
+LISTING_TEMPLATE = """<html><body>
+<table class="table">
+<thead><tr><th>Title</th><th>Category</th><th>Date</th></tr></thead>
+<tbody>
+{rows}
+</tbody>
+</table>
+{pager}
+</body></html>"""
+
+ROW_TEMPLATE = """<tr><td><a href="{host}/posts/{n}">Post {n}</a></td><td>Access</td><td>2025-01-01</td></tr>"""
+
+POST_TEMPLATE = """<html><body>
+<div class="post-content"><div class="content"><p>{text}</p></div></div>
+</body></html>"""
+
+DEFAULT_TEXT = "Selling access to Company {n}. RDP with DA. Price 0.{n} BTC"
+
+
+def load_texts(path):
+    """Post bodies from the text column of a CSV like datasets/base.csv."""
+    with open(path, encoding='utf-8', newline='') as f:
+        return [row['text'] for row in csv.DictReader(f) if row.get('text')]
+
+
+def make_handler(posts, latency, page_size, capacity=None, dead_url=None, dead_every=0, error_rate=0.0, texts=None, seed=0):
+    in_flight = threading.BoundedSemaphore(capacity) if capacity else None
+    # Seeded so runs with the same options fail the same share of requests
+    errors = random.Random(seed)
+    errors_lock = threading.Lock()
+
+    def failing():
+        with errors_lock:
+            return errors.random() < error_rate
+
+    def post_text(n):
+        if texts:
+            # The post number keeps bodies reused across the dataset apart
+            return f"{html.escape(texts[n % len(texts)])} (#{n})"
+        return DEFAULT_TEXT.format(n=n)
+
+    def post_host(n):
+        return dead_url if dead_url and dead_every and n % dead_every == dead_every - 1 else ''
+
+    class MarketHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body):
+            data = body.encode('utf-8')
+            etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+            if status == 200 and self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(data)
+
+        def do_GET(self):
+            if in_flight is None:
+                self._serve()
+            elif in_flight.acquire(blocking=False):
+                try:
+                    self._serve()
+                finally:
+                    in_flight.release()
+            else:
+                self.send_response(503)
+                self.send_header('Retry-After', '1')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        def _serve(self):
+            time.sleep(latency)
+            if error_rate and failing():
+                self._send(500, "Internal server error")
+                return
+            url = urlparse(self.path)
+            if url.path.startswith('/marketplace'):
+                page = int(parse_qs(url.query).get('page', ['1'])[0])
+                first = (page - 1) * page_size
+                rows = "\n".join(ROW_TEMPLATE.format(host=post_host(n), n=n) for n in range(first, min(first + page_size, posts)))
+                pager = ''
+                if first + page_size < posts:
+                    pager = f'<a rel="next" href="{url.path}?page={page + 1}">Next</a>'
+                self._send(200, LISTING_TEMPLATE.format(rows=rows, pager=pager))
+            elif self.path.startswith('/posts/'):
+                n = self.path.rsplit('/', 1)[-1]
+                self._send(200, POST_TEMPLATE.format(text=post_text(int(n)) if n.isdigit() else n))
+            else:
+                self._send(404, "Not found")
+
+        do_HEAD = do_GET
+
+    return MarketHandler
+
+
+def start_server(host='127.0.0.1', port=0, posts=50, latency=0.2, page_size=None, capacity=None, dead_url=None, dead_every=0, error_rate=0.0, texts=None, seed=0):
+    """Start the fake market in a daemon thread.
+
+    Returns:
+        tuple: (server, base_url)
+    """
+    handler = make_handler(posts, latency, page_size or max(posts, 1), capacity, dead_url, dead_every, error_rate, texts, seed)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake onion marketplace locally")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--posts", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds of delay per request")
+    parser.add_argument("--page-size", type=int, default=None, help="Rows per listing page (default: all on one page)")
+    parser.add_argument("--capacity", type=int, default=None, help="Concurrent requests served before answering 503")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--texts", default=None, help="CSV with a text column to use as post bodies, e.g. datasets/base.csv")
+    args = parser.parse_args()
+
+    server, base_url = start_server(
+        port=args.port,
+        posts=args.posts,
+        latency=args.latency,
+        page_size=args.page_size,
+        capacity=args.capacity,
+        error_rate=args.error_rate,
+        texts=load_texts(args.texts) if args.texts else None
+    )
+    print(f"Fake market listening on {base_url}/marketplace/sellers")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,189 @@
+import argparse
+import random
+import select
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+# Local stand-in for a Tor SOCKS port. Speaks SOCKS5 CONNECT with no-auth and
+# username/password auth, and treats every distinct username like Tor's
+# IsolateSOCKSAuth does: as its own circuit. Each circuit gets its own
+# latency, added to every request sent through it, and carries one request
+# at a time, so a single circuit is a bottleneck the way a real one is.
+# A fraction of circuits can be made slow or broken to exercise eviction,
+# or throttled: they answer every request with 429 themselves, like an exit
+# the market has rate limited.
+
+THROTTLED_RESPONSE = (
+    b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 0\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+)
+
+
+class Circuit:
+    def __init__(self, latency, broken, throttled=False):
+        self.latency = latency
+        self.broken = broken
+        self.throttled = throttled
+        self.lock = threading.Lock()
+
+
+def make_handler(server_state):
+    class SocksHandler(socketserver.BaseRequestHandler):
+        def _read(self, size):
+            data = b""
+            while len(data) < size:
+                chunk = self.request.recv(size - len(data))
+                if not chunk:
+                    raise ConnectionError("client closed the connection")
+                data += chunk
+            return data
+
+        def _negotiate(self):
+            version, count = self._read(2)
+            methods = self._read(count)
+            if version != 5:
+                raise ConnectionError("not SOCKS5")
+            if 2 in methods:
+                self.request.sendall(b"\x05\x02")
+                self._read(1)
+                username = self._read(self._read(1)[0]).decode()
+                self._read(self._read(1)[0])
+                self.request.sendall(b"\x01\x00")
+                return username
+            self.request.sendall(b"\x05\x00")
+            return ""
+
+        def _target(self):
+            _, command, _, address_type = self._read(4)
+            if address_type == 1:
+                host = socket.inet_ntoa(self._read(4))
+            elif address_type == 3:
+                host = self._read(self._read(1)[0]).decode()
+            else:
+                host = socket.inet_ntop(socket.AF_INET6, self._read(16))
+            port = struct.unpack("!H", self._read(2))[0]
+            if command != 1:
+                raise ConnectionError("only CONNECT is supported")
+            return host, port
+
+        def handle(self):
+            try:
+                circuit = server_state.circuit(self._negotiate())
+                host, port = self._target()
+                if circuit.broken:
+                    # General SOCKS server failure, like a circuit that can't be built
+                    self.request.sendall(b"\x05\x01\x00\x01" + b"\x00" * 6)
+                    return
+                if circuit.throttled:
+                    self.request.sendall(b"\x05\x00\x00\x01" + b"\x00" * 6)
+                    self._throttle()
+                    return
+                upstream = socket.create_connection((host, port), timeout=30)
+            except (ConnectionError, OSError):
+                return
+            self.request.sendall(b"\x05\x00\x00\x01" + b"\x00" * 6)
+            with upstream:
+                self._relay(circuit, upstream)
+
+        def _throttle(self):
+            request = b""
+            while b"\r\n\r\n" not in request:
+                chunk = self.request.recv(65536)
+                if not chunk:
+                    return
+                request += chunk
+            self.request.sendall(THROTTLED_RESPONSE)
+
+        def _relay(self, circuit, upstream):
+            sockets = [self.request, upstream]
+            while True:
+                readable, _, _ = select.select(sockets, [], [], 60)
+                if not readable:
+                    return
+                for sock in readable:
+                    data = sock.recv(65536)
+                    if not data:
+                        return
+                    if sock is self.request:
+                        # A request leaving the client pays the circuit's latency
+                        with circuit.lock:
+                            time.sleep(circuit.latency)
+                        upstream.sendall(data)
+                    else:
+                        self.request.sendall(data)
+
+    return SocksHandler
+
+
+class ServerState:
+    def __init__(self, latency, slow_fraction, slow_factor, broken_fraction, seed, throttled_fraction=0.0):
+        self.latency = latency
+        self.slow_fraction = slow_fraction
+        self.slow_factor = slow_factor
+        self.broken_fraction = broken_fraction
+        self.throttled_fraction = throttled_fraction
+        self.random = random.Random(seed)
+        self.circuits = {}
+        self.lock = threading.Lock()
+
+    def circuit(self, username):
+        with self.lock:
+            circuit = self.circuits.get(username)
+            if circuit is None:
+                roll = self.random.random()
+                broken = roll < self.broken_fraction
+                slow = not broken and roll < self.broken_fraction + self.slow_fraction
+                latency = self.latency * (self.slow_factor if slow else 1) * self.random.uniform(0.8, 1.2)
+                # Rolled only when asked for, so seeded runs without throttling draw the same circuits as before
+                throttled = self.throttled_fraction > 0 and self.random.random() < self.throttled_fraction
+                circuit = self.circuits[username] = Circuit(latency, broken, throttled)
+            return circuit
+
+
+class SocksServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_server(host='127.0.0.1', port=0, latency=0.1, slow_fraction=0.0, slow_factor=10.0, broken_fraction=0.0, seed=None, throttled_fraction=0.0):
+    """Start a fake SOCKS5 proxy in a daemon thread.
+
+    `server.state.circuits` maps each SOCKS username seen so far to its Circuit.
+
+    Returns:
+        tuple: (server, proxy_url)
+    """
+    state = ServerState(latency, slow_fraction, slow_factor, broken_fraction, seed, throttled_fraction)
+    server = SocksServer((host, port), make_handler(state))
+    server.state = state
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"socks5h://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake Tor SOCKS5 port locally")
+    parser.add_argument("--port", type=int, default=9050)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds added to every request on a circuit")
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="Share of circuits that are --slow-factor times slower")
+    parser.add_argument("--slow-factor", type=float, default=10.0)
+    parser.add_argument("--broken-fraction", type=float, default=0.0, help="Share of circuits that refuse every connection")
+    parser.add_argument("--throttled-fraction", type=float, default=0.0, help="Share of circuits that answer every request with 429")
+    args = parser.parse_args()
+
+    server, proxy_url = start_server(
+        port=args.port,
+        latency=args.latency,
+        slow_fraction=args.slow_fraction,
+        slow_factor=args.slow_factor,
+        broken_fraction=args.broken_fraction,
+        throttled_fraction=args.throttled_fraction
+    )
+    print(f"Fake SOCKS proxy listening on {proxy_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,91 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# The engine is created when app.models.database is imported, so the test
+# database has to be chosen before anything from app is imported
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+
+from app.models.database import Base, engine, upgrade_schema, create_search_index, SessionLocal  # noqa: E402
+import fake_market  # noqa: E402
+import fake_anthropic  # noqa: E402
+import fake_socks  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+    create_search_index()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def market():
+    """Start a fake market for one test. Call with start_server options; returns the base URL."""
+    servers = []
+
+    def start(**options):
+        options.setdefault("latency", 0.0)
+        server, base_url = fake_market.start_server(**options)
+        servers.append(server)
+        return base_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+
+@pytest.fixture
+def anthropic_api(monkeypatch):
+    """Start a fake Anthropic API and point the SDK at it. Returns the server; server.state counts requests and batches."""
+    from app.services import claude
+
+    servers = []
+
+    def start(**options):
+        options.setdefault("latency", 0.0)
+        server, base_url = fake_anthropic.start_server(**options)
+        servers.append(server)
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", base_url)
+        # Classifiers are cached per key and model, along with the base URL they were built with
+        monkeypatch.setattr(claude, "_classifiers", {})
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def socks_proxy():
+    """Start a fake SOCKS5 proxy. Returns (server, proxy_url); server.state.circuits holds its circuits by username."""
+    servers = []
+
+    def start(**options):
+        options.setdefault("latency", 0.0)
+        server, proxy_url = fake_socks.start_server(**options)
+        servers.append(server)
+        return server, proxy_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,96 @@
+import functools
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app.models.database import Scan, Post
+from app.routers.claude_router import classify_posts
+from app.services.claude import ClaudeClassifier, get_classifier
+
+CONTENTS = [
+    "Selling RDP access to Company A",
+    "Selling accounts in bulk",
+    "This vendor is a scammer, avoid",
+    "Selling RDP access to Company A",
+    "VPN access to a hospital network",
+]
+EXPECTED = ["Positive", "Neutral", "Negative", "Positive", "Positive"]
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(
+        ClaudeClassifier, "wait_for_batch", functools.partialmethod(ClaudeClassifier.wait_for_batch, poll_interval=0.01)
+    )
+
+
+@pytest.fixture
+def model_name():
+    # Results are cached per model, so every test gets a model of its own
+    return f"claude-test-{uuid.uuid4().hex[:8]}"
+
+
+@pytest.fixture
+def scan(db):
+    scan = Scan(name="batch", onion_url="http://example.onion", http_proxy="", https_proxy="", timestamp=datetime.utcnow(), status="completed", result="")
+    scan.posts = [
+        Post(position=position, link=f"http://example.onion/posts/{position}", title=f"Post {position}", content=content, status="new")
+        for position, content in enumerate(CONTENTS)
+    ]
+    db.add(scan)
+    db.commit()
+    return scan
+
+
+def classify_batch(scan, model_name, **options):
+    return classify_posts(scan, "test-key", model_name, temperature=0.1, max_tokens=100, mode="batch", **options)
+
+
+def test_batch_results_are_collected_in_post_order(anthropic_api, scan, model_name):
+    server = anthropic_api(batch_delay=0.05)
+    submitted = []
+
+    result = classify_batch(scan, model_name, on_batch_submitted=submitted.append)
+
+    assert [post["classification"] for post in result["posts"]] == EXPECTED
+    assert [post["post_id"] for post in result["posts"]] == [post.id for post in scan.posts]
+    assert list(server.state.batches) == submitted
+    # The repeated post is sent once
+    assert len(server.state.batches[submitted[0]]["results"]) == len(set(CONTENTS))
+    assert result["usage"]["input_tokens"] > 0
+
+
+def test_retry_collects_the_earlier_batch(anthropic_api, scan, model_name):
+    server = anthropic_api(batch_delay=0.05)
+    batch_id = get_classifier("test-key", model_name).submit_batch(CONTENTS)
+    submitted = []
+
+    result = classify_batch(scan, model_name, batch_id=batch_id, on_batch_submitted=submitted.append)
+
+    assert [post["classification"] for post in result["posts"]] == EXPECTED
+    assert list(server.state.batches) == [batch_id]
+    assert submitted == []
+
+
+def test_retry_submits_only_posts_missing_from_the_earlier_batch(anthropic_api, scan, model_name):
+    server = anthropic_api(batch_delay=0.05)
+    batch_id = get_classifier("test-key", model_name).submit_batch(CONTENTS[:2])
+    submitted = []
+
+    result = classify_batch(scan, model_name, batch_id=batch_id, on_batch_submitted=submitted.append)
+
+    assert [post["classification"] for post in result["posts"]] == EXPECTED
+    assert len(submitted) == 1
+    assert len(server.state.batches[submitted[0]]["results"]) == len(set(CONTENTS[2:]) - set(CONTENTS[:2]))
+
+
+def test_later_runs_are_served_from_the_cache(anthropic_api, scan, model_name):
+    server = anthropic_api(batch_delay=0.05)
+    classify_batch(scan, model_name)
+
+    result = classify_batch(scan, model_name)
+
+    assert [post["classification"] for post in result["posts"]] == EXPECTED
+    assert all(post["cached"] for post in result["posts"])
+    assert len(server.state.batches) == 1
@@ -0,0 +1,69 @@
+import pytest
+from anthropic import APIStatusError, NotFoundError
+
+from app.services import claude
+from app.services.claude import ClaudeClassifier
+
+MODEL = "claude-test"
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(claude, "_retry_delay", lambda error, attempt: 0)
+
+
+def classify_all(classifier, count):
+    return [classifier.classify(f"Selling RDP access to Company {n}") for n in range(count)]
+
+
+@pytest.mark.parametrize("failure", ["rate_limit_every", "server_error_every", "drop_every"])
+def test_failed_requests_are_retried(anthropic_api, failure):
+    server = anthropic_api(**{failure: 2})
+    classifier = ClaudeClassifier("test-key", MODEL)
+
+    results = classify_all(classifier, 5)
+
+    assert [result.get("error") for result in results] == [None] * 5
+    assert {result["classification"] for result in results} == {"Positive"}
+    # Every post after the first hits one failure and one retry
+    assert server.state.requests == 9
+
+
+def test_retries_stop_after_max_retries(anthropic_api):
+    server = anthropic_api(server_error_every=1)
+    classifier = ClaudeClassifier("test-key", MODEL, max_retries=2)
+
+    with pytest.raises(APIStatusError) as error:
+        classifier.create_message("Post", max_tokens=100, temperature=0.1)
+
+    assert error.value.status_code == 529
+    assert server.state.requests == 3
+
+
+def test_client_errors_are_not_retried(anthropic_api, monkeypatch):
+    server = anthropic_api()
+    # The fake answers 404 outside /v1/messages
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/missing")
+    classifier = ClaudeClassifier("test-key", MODEL)
+
+    with pytest.raises(NotFoundError):
+        classifier.create_message("Post", max_tokens=100, temperature=0.1)
+
+    assert server.state.requests == 1
+
+
+def test_rate_limits_back_off_the_limiter(anthropic_api):
+    class Limiter:
+        backoffs = 0
+
+        def backoff(self):
+            self.backoffs += 1
+
+    anthropic_api(rate_limit_every=2)
+    classifier = ClaudeClassifier("test-key", MODEL)
+    limiter = Limiter()
+
+    for n in range(3):
+        classifier.create_message(f"Post {n}", max_tokens=100, temperature=0.1, limiter=limiter)
+
+    assert limiter.backoffs == 2
@@ -0,0 +1,77 @@
+from urllib.parse import urlparse
+
+from app.services import http_pool
+from app.services.proxy_pool import ProxyPool, MAX_CIRCUIT_FAILURES
+from app.services.scraper import collect_posts
+
+
+def throttle(server, circuit):
+    """Make the fake proxy answer 429 on `circuit`'s current credentials."""
+    server.state.circuit(urlparse(circuit.url).username).throttled = True
+
+
+def test_circuit_rotates_after_repeated_429(market, socks_proxy):
+    base_url = market(posts=1)
+    server, proxy_url = socks_proxy()
+    pool = ProxyPool([proxy_url], circuits_per_proxy=1)
+    circuit = pool.circuits[0]
+    throttled_url = circuit.url
+    throttle(server, circuit)
+
+    statuses = [pool.get(f"{base_url}/posts/0", timeout=5).status_code for _ in range(MAX_CIRCUIT_FAILURES)]
+
+    assert statuses == [429] * MAX_CIRCUIT_FAILURES
+    assert circuit.rotations == 1
+    assert circuit.url != throttled_url
+    assert urlparse(circuit.url).hostname == urlparse(proxy_url).hostname
+    # The retired circuit's sessions are closed and the new credentials reach a fresh circuit
+    assert not [key for key in http_pool._sessions if key[0] == throttled_url]
+    assert pool.get(f"{base_url}/posts/0", timeout=5).status_code == 200
+    assert circuit.failures == 0
+
+
+def test_fewer_429s_than_the_limit_keep_the_circuit(market, socks_proxy):
+    base_url = market(posts=1)
+    server, proxy_url = socks_proxy()
+    pool = ProxyPool([proxy_url], circuits_per_proxy=1)
+    circuit = pool.circuits[0]
+    throttle(server, circuit)
+
+    for _ in range(MAX_CIRCUIT_FAILURES - 1):
+        pool.get(f"{base_url}/posts/0", timeout=5)
+
+    assert circuit.rotations == 0
+    assert circuit.failures == MAX_CIRCUIT_FAILURES - 1
+
+
+def test_scan_replaces_throttled_circuits(market, socks_proxy):
+    base_url = market(posts=30)
+    server, proxy_url = socks_proxy(throttled_fraction=0.5, seed=1)
+    stats = {}
+
+    posts = collect_posts(
+        f"{base_url}/marketplace/sellers",
+        proxies={'http': proxy_url, 'https': proxy_url},
+        concurrency=4,
+        circuits_per_proxy=4,
+        stats=stats
+    )
+
+    assert [post["title"] for post in posts] == [f"Post {n}" for n in range(30)]
+    assert all(post["status"] == "new" for post in posts)
+    assert any(circuit.throttled for circuit in server.state.circuits.values())
+    assert sum(circuit["rotations"] for circuit in stats["circuits"]) > 0
+
+
+def test_close_drops_the_sessions_of_pooled_circuits(market, socks_proxy):
+    base_url = market(posts=1)
+    _, proxy_url = socks_proxy()
+    pool = ProxyPool([proxy_url], circuits_per_proxy=3)
+    for _ in range(6):
+        pool.get(f"{base_url}/posts/0", timeout=5)
+    urls = {circuit.url for circuit in pool.circuits}
+    assert [key for key in http_pool._sessions if key[0] in urls]
+
+    pool.close()
+
+    assert not [key for key in http_pool._sessions if key[0] in urls]
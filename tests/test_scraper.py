@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.database import Scan
+from app.routers.scans_router import get_scans, SORT_COLUMNS
+from app.services.scraper import collect_posts
+
+
+def test_collect_posts_keeps_listing_order_across_pages(market):
+    base_url = market(posts=25, page_size=10)
+    stats = {}
+
+    posts = collect_posts(
+        f"{base_url}/marketplace/sellers", proxies={}, concurrency=8, max_pages=5, max_depth=5, stats=stats
+    )
+
+    assert [post["title"] for post in posts] == [f"Post {n}" for n in range(25)]
+    assert all(post["status"] == "new" and post["content"] for post in posts)
+    assert stats["pages_fetched"] == 3
+
+
+def test_collect_posts_stops_at_max_pages(market):
+    base_url = market(posts=25, page_size=10)
+
+    posts = collect_posts(f"{base_url}/marketplace/sellers", proxies={}, max_pages=2, max_depth=5)
+
+    assert [post["title"] for post in posts] == [f"Post {n}" for n in range(20)]
+
+
+@pytest.fixture
+def paged_scans(db):
+    # Few distinct names, statuses and timestamps, so most pages break ties on id
+    started = datetime(2025, 1, 1)
+    scans = [
+        Scan(
+            name=f"keyset-{n % 4}",
+            onion_url="http://example.onion",
+            http_proxy="",
+            https_proxy="",
+            timestamp=started + timedelta(minutes=n % 3),
+            status=("completed", "failed", "running")[n % 3],
+            result=""
+        )
+        for n in range(23)
+    ]
+    db.add_all(scans)
+    db.commit()
+    yield scans
+    for scan in scans:
+        db.delete(scan)
+    db.commit()
+
+
+@pytest.mark.parametrize("sort", sorted(SORT_COLUMNS))
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_get_scans_pages_without_gaps_or_duplicates(db, paged_scans, sort, order):
+    expected = sorted(paged_scans, key=lambda scan: (getattr(scan, sort), scan.id), reverse=order == "desc")
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = get_scans(db, name="keyset-", sort=sort, order=order, cursor=cursor, limit=5)
+        assert len(page) <= 5
+        seen.extend(scan.id for scan in page)
+        if cursor is None:
+            break
+
+    assert seen == [scan.id for scan in expected]
+
+
+def test_get_scans_filters_before_paging(db, paged_scans):
+    page, cursor = get_scans(db, name="keyset-1", status="failed", sort="id", order="asc", limit=50)
+
+    expected = [scan.id for scan in paged_scans if scan.name == "keyset-1" and scan.status == "failed"]
+    assert [scan.id for scan in page] == expected
+    assert cursor is None
+
+
+def test_get_scans_rejects_a_bad_cursor(db):
+    with pytest.raises(HTTPException) as error:
+        get_scans(db, cursor="not-a-cursor")
+    assert error.value.status_code == 400